@@ -0,0 +1,21 @@
+from fastapi import APIRouter
+from services.presigned_url_cache import presigned_url_cache
+from utils.document_handling.document_index import document_index_cache
+from utils.document_handling.page_renderer import page_render_cache
+
+router = APIRouter()
+
+
+@router.get("/cache-metrics")
+async def get_cache_metrics():
+    """
+    Size and hit metrics of the in-process document caches.
+
+    Returns:
+        dict: Per cache its entry count, hits, misses, hit rate and evictions
+    """
+    return {
+        "document_index": document_index_cache.stats(),
+        "page_renders": page_render_cache.stats(),
+        "presigned_urls": presigned_url_cache.stats(),
+    }
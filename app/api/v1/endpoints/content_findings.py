@@ -1,5 +1,6 @@
-from fastapi import APIRouter, Body
-from utils.document_handling.content_findings import generate_findings_from_text
+from typing import List, Optional
+from fastapi import APIRouter, Body, HTTPException
+from utils.document_handling.content_findings import generate_findings, generate_findings_from_text, resolve_source_text
 
 router = APIRouter()
 
@@ -22,22 +23,58 @@ def get_content_formats():
 
 
 @router.post("/generate-findings/", tags=["Findings"])
-def get_findings(
+async def get_findings(
     content_format: str = Body(...),
-    text: str = Body(...)
+    text: Optional[str] = Body(None),
+    document_id: Optional[str] = Body(None)
 ):
     """
     Extract findings from the provided text based on the selected content format.
 
     Args:
         content_format (str): The type of content format to use for extraction.
-        text (str): The input text from which to extract findings.
+        text (str, optional): The input text from which to extract findings.
+        document_id (str, optional): A processed document to use as the input instead of text.
 
     Returns:
         dict: A dictionary containing the extracted findings or an error message if the format is invalid.
     """
     if content_format not in AVAILABLE_CONTENT_FORMATS:
         return {"error": f"Invalid content format. Choose from: {AVAILABLE_CONTENT_FORMATS}"}
-    
-    result = generate_findings_from_text(content_format, text)
+
+    source_text = await resolve_source_text(text=text, document_id=document_id)
+    result = await generate_findings_from_text(content_format, source_text)
     return {"findings": result}
+
+
+@router.post("/generate-findings/batch/", tags=["Findings"])
+async def get_findings_batch(
+    content_formats: Optional[List[str]] = Body(None),
+    text: Optional[str] = Body(None),
+    document_id: Optional[str] = Body(None)
+):
+    """
+    Extract findings for several content formats from one text in a single request.
+
+    The formats are extracted in parallel from one shared, preprocessed copy of the text.
+
+    Args:
+        content_formats (List[str], optional): The content formats to extract. Defaults to all available formats.
+        text (str, optional): The input text from which to extract findings.
+        document_id (str, optional): A processed document to use as the input instead of text.
+
+    Returns:
+        dict: The findings per content format, and the error per format that failed.
+
+    Raises:
+        HTTPException: If a content format is invalid or no input is given.
+    """
+    content_formats = content_formats or AVAILABLE_CONTENT_FORMATS
+    invalid_formats = [content_format for content_format in content_formats if content_format not in AVAILABLE_CONTENT_FORMATS]
+    if invalid_formats:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid content formats {invalid_formats}. Choose from: {AVAILABLE_CONTENT_FORMATS}"
+        )
+
+    return await generate_findings(content_formats, text=text, document_id=document_id)
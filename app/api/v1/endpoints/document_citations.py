@@ -0,0 +1,57 @@
+from fastapi import APIRouter, HTTPException
+from schemas.base import LocatePhraseRequest, LinesInRectRequest
+from utils.document_handling.document_index import DocumentIndex, document_index_cache
+
+router = APIRouter()
+
+
+async def get_document_index(document_id: str) -> DocumentIndex:
+    """The line index of a document, 404 if the document or its lines do not exist."""
+    try:
+        return await document_index_cache.get(document_id)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=f"Document lines not found: {str(e)}")
+
+
+@router.post("/locate-phrase")
+async def locate_phrase(request: LocatePhraseRequest):
+    """
+    Find the lines of a processed document that contain a phrase.
+
+    Args:
+        document_id (str): The document's unique identifier
+        phrase (str): The text to locate, e.g. a quote cited in generated content
+        page_numbers (Optional[List[int]]): Only search these pages
+        limit (int): Maximum number of matches
+
+    Returns:
+        dict: Per match its page number and the lines it spans, with their bounding boxes
+    """
+    index = await get_document_index(request.document_id)
+
+    return {
+        "document_id": request.document_id,
+        "matches": index.find_phrase(request.phrase, page_numbers=request.page_numbers, limit=request.limit),
+    }
+
+
+@router.post("/lines-in-rect")
+async def lines_in_rect(request: LinesInRectRequest):
+    """
+    Return the lines of a document page overlapping a rectangle.
+
+    Args:
+        document_id (str): The document's unique identifier
+        page_number (int): 1-based page number
+        rect (List[float]): x0, y0, x1, y1 in PDF points
+
+    Returns:
+        dict: The overlapping lines, top to bottom, with their bounding boxes
+    """
+    index = await get_document_index(request.document_id)
+
+    return {
+        "document_id": request.document_id,
+        "page_number": request.page_number,
+        "lines": index.lines_in_rect(request.page_number, request.rect),
+    }
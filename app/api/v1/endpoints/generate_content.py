@@ -1,9 +1,11 @@
+import json
 from fastapi import APIRouter, HTTPException
-from typing import Dict, Optional
+from fastapi.responses import StreamingResponse
+from typing import AsyncGenerator, Dict, Optional
 from pydantic import BaseModel
 from utils.document_handling.content_generation import content_generator
 from utils.document_handling.question_flow import ContentFlowManager, ContentFlowQuestion
-from schemas.base import ContentGenerationRequest, ContentGenerationResponse
+from schemas.base import ContentGenerationRequest, ContentGenerationResponse, ContentVariantsRequest
 from utils.document_handling.logger import log
 
 router = APIRouter()
@@ -47,7 +49,10 @@ async def generate_content(request: ContentGenerationRequest):
             audience=request.audience,
             tone=request.tone,
             text=request.text,
-            image_paths=request.image_paths
+            image_paths=request.image_paths,
+            document_ids=request.document_ids,
+            workspace_id=request.workspace_id,
+            context_token_budget=request.context_token_budget
         )
 
         return result 
@@ -59,4 +64,137 @@ async def generate_content(request: ContentGenerationRequest):
         raise HTTPException(
             status_code=500, 
             detail=f"Content generation failed: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+def format_sse(event: str, data: dict) -> str:
+    """Serialize one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def content_event_stream(chunks: AsyncGenerator[str, None]) -> AsyncGenerator[str, None]:
+    """
+    Wrap a token stream into server-sent events.
+
+    Emits one "chunk" event per token batch, then a "done" event carrying the full
+    content, or an "error" event if the stream fails after it has started.
+    """
+    parts = []
+    try:
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            parts.append(chunk)
+            yield format_sse("chunk", {"content": chunk})
+    except Exception as e:
+        detail = getattr(e, "detail", str(e))
+        log(f"Error while streaming generated content: {detail}")
+        yield format_sse("error", {"detail": f"Content generation failed: {detail}"})
+        return
+
+    yield format_sse("done", {"generated_content": "".join(parts)})
+
+
+@router.post("/generate-content/stream")
+async def stream_generate_content(request: ContentGenerationRequest):
+    """
+    Stream generated content as server-sent events.
+
+    Takes the same body as /generate-content. Parameters are validated before the
+    stream opens, so invalid requests still get a regular error response.
+
+    Args:
+        request (ContentGenerationRequest): The request containing all necessary parameters for content generation.
+
+    Returns:
+        StreamingResponse: "chunk" events with partial content, then a "done" event with the full content.
+
+    Raises:
+        HTTPException: If validation fails or the stream cannot be opened.
+    """
+    try:
+        chunks = await content_generator.stream_content(
+            content_format=request.content_format,
+            objective=request.objective,
+            audience=request.audience,
+            tone=request.tone,
+            text=request.text,
+            image_paths=request.image_paths,
+            document_ids=request.document_ids,
+            workspace_id=request.workspace_id,
+            context_token_budget=request.context_token_budget
+        )
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        log(f"Error in stream_generate_content endpoint: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Content generation failed: {str(e)}"
+        )
+
+    return StreamingResponse(
+        content_event_stream(chunks),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def variant_event_stream(results: AsyncGenerator[dict, None]) -> AsyncGenerator[str, None]:
+    """
+    Wrap variant results into server-sent events.
+
+    Emits one "variant" event per variant as it completes, then a "done" event
+    with the number of variants that succeeded and failed.
+    """
+    completed, failed = 0, 0
+    async for result in results:
+        if "error" in result:
+            failed += 1
+        else:
+            completed += 1
+        yield format_sse("variant", result)
+
+    yield format_sse("done", {"completed": completed, "failed": failed})
+
+
+@router.post("/generate-content/variants")
+async def generate_content_variants(request: ContentVariantsRequest):
+    """
+    Generate several variants of the same source content in one job.
+
+    Each variant is a (content_format, objective, audience, tone) combination.
+    The source text is resolved once and the variants run in parallel; each
+    result is streamed back as a server-sent event as soon as it completes.
+
+    Args:
+        request (ContentVariantsRequest): The variants and the shared source of the content.
+
+    Returns:
+        StreamingResponse: "variant" events in completion order, then a "done" event.
+
+    Raises:
+        HTTPException: If a variant is invalid or the source cannot be resolved.
+    """
+    try:
+        results = await content_generator.generate_variants(
+            variants=[variant.model_dump() for variant in request.variants],
+            text=request.text,
+            image_paths=request.image_paths,
+            document_ids=request.document_ids,
+            workspace_id=request.workspace_id,
+            context_token_budget=request.context_token_budget
+        )
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        log(f"Error in generate_content_variants endpoint: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Content generation failed: {str(e)}"
+        )
+
+    return StreamingResponse(
+        variant_event_stream(results),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
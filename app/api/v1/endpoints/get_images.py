@@ -1,44 +1,55 @@
-from fastapi import APIRouter, HTTPException, Query
-from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException, Response
 from services.s3host import current_s3_client
 from models.images import image_repo
+from models.pagination import NEXT_CURSOR_HEADER
 from services.document_encoder import DocumentEncoder
-import json
+from schemas.base import ListImageIdsRequest
 
 router = APIRouter()
-class ListImageIdsRequest(BaseModel):
-    document_id:str
-    user_id: str
 
 @router.post("/get-document-images")
-async def get_document_images(request:ListImageIdsRequest):
+async def get_document_images(request: ListImageIdsRequest, response: Response):
     """
-    Fetch image URLs for a document saved in S3.
+    Fetch image URLs for a document saved in S3, every image or one page of results at a time.
     
     Args:
+        document_id (str): The document's unique identifier
         user_id (str): The user ID
-        document_name (str): The name of the PDF (e.g., "report.pdf")
+        page_start (Optional[int]): Only images from this document page on
+        page_end (Optional[int]): Only images up to this document page
+        cursor (Optional[str]): next_cursor of the previous response
+        limit (Optional[int]): Maximum number of images
 
     Returns:
-        JSON with image URLs or error
+        list: Presigned URLs of every image. Requests with a cursor or limit get the
+            URLs with the image ids and page numbers instead, and the next cursor in
+            the X-Next-Cursor header
     """
     try:
-        print("Hello world")
-        document_id=request.document_id
-        user_id=request.user_id
-        all_presigned_urls=[]
+        images, next_cursor = await image_repo.get_images_page(
+            request.document_id, request.page_start, request.page_end, request.cursor, request.page_limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        image_ids=await image_repo.get_image_by_document_id(document_id)
-        for image_id in image_ids:
-            decode_user_id, document_name, upload_timestamp=DocumentEncoder.decode_document_id(document_id)
-            splited_id=image_id.split("_")
+    try:
+        image_keys = [DocumentEncoder.get_document_image_file_key(request.document_id, image["id"]) for image in images]
+        # Sign every URL of the page with a single client
+        presigned_urls = await current_s3_client.get_presigned_view_urls(image_keys)
 
-            image_name=f'{splited_id[-2]}_{splited_id[-1]}'
-            image_key=f"DB/USERS/{decode_user_id}/document_images/{document_name}/{image_name}"
-            presigned_url=await current_s3_client.get_presigned_view_url(image_key)
-            all_presigned_urls.append(presigned_url)
+        if not request.paginated:
+            return presigned_urls
 
-        return all_presigned_urls
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
+        return [
+            {
+                "id": image["id"],
+                "url": presigned_url,
+                "page_number": image.get("page_number")
+            }
+            for image, presigned_url in zip(images, presigned_urls)
+        ]
     
     except Exception as e:
         raise HTTPException(status_code=404, detail=f"Images not found: {str(e)}")
@@ -1,43 +1,185 @@
-from fastapi import APIRouter, HTTPException
-from services.s3host import current_s3_client
+from typing import Literal, Optional
+from urllib.parse import urlencode
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import Response
+from configs.config import AppInfo
+from models.pagination import NEXT_CURSOR_HEADER
 from models.preview import preview_repo
 from schemas.base import GetDocumentPreviewRequest
+from utils.document_handling.page_renderer import (
+    DEFAULT_PREVIEW_RENDITION, MAX_RENDER_DPI, MIN_RENDER_DPI, PREVIEW_DPI, PREVIEW_RENDITIONS,
+    PREVIEW_TILE_FORMAT, PREVIEW_TILE_LEVEL_DPIS, PREVIEW_TILE_SIZE, RENDER_MEDIA_TYPES, get_render_page_url,
+    page_render_cache
+)
 
 router = APIRouter()
 
+# Renders are content-addressed and never change
+RENDER_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+
+def get_render_tile_url_template(document_id: str, page_number: int) -> str:
+    """API path rendering a tile of a page, with {dpi}, {column} and {row} placeholders."""
+    query = urlencode({"document_id": document_id, "page_number": page_number})
+    return f"{AppInfo().API_V1_STR}/render-tile?{query}&dpi={{dpi}}&column={{column}}&row={{row}}"
+
+
+def render_response(image: bytes, key: str, image_format: str) -> Response:
+    return Response(
+        content=image,
+        media_type=RENDER_MEDIA_TYPES[image_format],
+        headers={
+            "Cache-Control": RENDER_CACHE_CONTROL,
+            "ETag": f'"{key.split("/", 2)[-1]}"',
+        }
+    )
+
+
 @router.post("/get-document-previews")
-async def get_document_previews(request: GetDocumentPreviewRequest):
+async def get_document_previews(request: GetDocumentPreviewRequest, response: Response):
     """
-    Fetch preview image URLs for a document saved in S3.
+    Fetch preview image URLs for a document, every page or one page of results at a time.
 
     Args:
         document_id (str): The document's unique identifier
         user_id (str): The user ID
+        rendition (Optional[str]): Rendition the page URLs point at ("thumbnail", "screen", "full"),
+            "screen" by default
+        page_start (Optional[int]): First page to return
+        page_end (Optional[int]): Last page to return
+        cursor (Optional[str]): next_cursor of the previous response
+        limit (Optional[int]): Maximum number of pages
 
     Returns:
-        list: List of presigned URLs for preview images
+        list: Per page its render URL, thumbnail URL, pixel size and, when the
+            document has one, its tile pyramid. Requests with a cursor or limit
+            return the next cursor in the X-Next-Cursor header
     """
+    rendition = request.rendition or DEFAULT_PREVIEW_RENDITION
+    if rendition not in PREVIEW_RENDITIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown rendition {rendition}, expected one of {', '.join(PREVIEW_RENDITIONS)}"
+        )
+
     try:
-        document_id = request.document_id
-        user_id = request.user_id
-        all_presigned_urls = []
+        previews, next_cursor = await preview_repo.get_previews_page(
+            request.document_id, request.page_start, request.page_end, request.cursor, request.page_limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        # Get previews from database
-        previews = await preview_repo.get_previews_by_document_id(document_id)
+    try:
+        document_id = request.document_id
+        items = []
 
-        # Generate presigned URLs for each preview
+        # Pages are rendered on their first request
         for preview in previews:
-            presigned_url = await current_s3_client.get_presigned_view_url(preview["id"])
+            page_number = preview.get("page_number")
+            page_rendition = preview.get("renditions", {}).get(rendition, {})
             preview_info = {
-                "url": presigned_url,
-                "page_number": preview.get("page_number"),
+                "url": get_render_page_url(document_id, page_number, rendition),
+                "thumbnail_url": get_render_page_url(document_id, page_number, "thumbnail"),
+                "page_number": page_number,
+                "rendition": rendition,
+                "width": page_rendition.get("width"),
+                "height": page_rendition.get("height"),
             }
-            all_presigned_urls.append(preview_info)
+            if preview.get("tiles"):
+                preview_info["tiles"] = {
+                    **preview["tiles"],
+                    "url_template": get_render_tile_url_template(document_id, page_number),
+                }
+            items.append(preview_info)
 
-        return all_presigned_urls
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
+        return items
 
     except Exception as e:
         raise HTTPException(
             status_code=404,
             detail=f"Preview images not found: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+
+@router.get("/render-page")
+async def render_document_page(
+    document_id: str = Query(..., description="The document's unique identifier"),
+    page_number: int = Query(..., ge=1, description="1-based page number"),
+    rendition: Optional[str] = Query(None, description="Named rendition; overrides dpi and format"),
+    dpi: int = Query(PREVIEW_DPI, ge=MIN_RENDER_DPI, le=MAX_RENDER_DPI, description="Render resolution"),
+    image_format: Literal["png", "jpeg", "webp"] = Query("png", alias="format", description="Image format")
+):
+    """
+    Render a page of a document, from the render cache when it was rendered before.
+
+    Args:
+        document_id (str): The document's unique identifier
+        page_number (int): 1-based page number
+        rendition (Optional[str]): Named rendition ("thumbnail", "screen", "full")
+        dpi (int): Render resolution, when no rendition is given
+        image_format (str): "png", "jpeg" or "webp", when no rendition is given
+
+    Returns:
+        Response: The page image, cacheable as immutable
+    """
+    if rendition is not None:
+        if rendition not in PREVIEW_RENDITIONS:
+            raise HTTPException(status_code=400, detail=f"Unknown rendition {rendition}")
+        dpi = PREVIEW_RENDITIONS[rendition]["dpi"]
+        image_format = PREVIEW_RENDITIONS[rendition]["format"]
+
+    try:
+        image, key = await page_render_cache.get(document_id, page_number, dpi, image_format)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Page preview not found: {str(e)}"
+        )
+
+    return render_response(image, key, image_format)
+
+
+@router.get("/render-tile")
+async def render_document_page_tile(
+    document_id: str = Query(..., description="The document's unique identifier"),
+    page_number: int = Query(..., ge=1, description="1-based page number"),
+    dpi: int = Query(..., description="DPI of a tile pyramid level"),
+    column: int = Query(..., ge=0, description="Tile column, from the left"),
+    row: int = Query(..., ge=0, description="Tile row, from the top")
+):
+    """
+    Render a tile of the hi-res tile pyramid of a page.
+
+    Args:
+        document_id (str): The document's unique identifier
+        page_number (int): 1-based page number
+        dpi (int): DPI of the pyramid level
+        column (int): Tile column
+        row (int): Tile row
+
+    Returns:
+        Response: The tile image, cacheable as immutable
+    """
+    if dpi not in PREVIEW_TILE_LEVEL_DPIS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"No tile level at {dpi} DPI, expected one of {', '.join(map(str, PREVIEW_TILE_LEVEL_DPIS))}"
+        )
+
+    try:
+        image, key = await page_render_cache.get(
+            document_id, page_number, dpi, PREVIEW_TILE_FORMAT, tile=(PREVIEW_TILE_SIZE, column, row)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Page tile not found: {str(e)}"
+        )
+
+    return render_response(image, key, PREVIEW_TILE_FORMAT)
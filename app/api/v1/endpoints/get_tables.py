@@ -1,50 +1,51 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException, Response
 from services.s3host import current_s3_client
+from models.pagination import NEXT_CURSOR_HEADER
 from models.tables import table_repo
-from services.document_encoder import DocumentEncoder
 from schemas.base import ListTableIdsRequest
 router = APIRouter()
 
 @router.post("/get-document-tables")
-async def get_document_tables(request: ListTableIdsRequest):
+async def get_document_tables(request: ListTableIdsRequest, response: Response):
     """
-    Fetch table URLs for a document saved in S3.
+    Fetch table URLs for a document saved in S3, every table or one page of results at a time.
     
     Args:
         document_id (str): The document's unique identifier
         user_id (str): The user ID
+        page_start (Optional[int]): Only tables from this document page on
+        page_end (Optional[int]): Only tables up to this document page
+        cursor (Optional[str]): next_cursor of the previous response
+        limit (Optional[int]): Maximum number of tables
 
     Returns:
-        list: List of presigned URLs for tables
+        list: Presigned URLs of the tables with their page and table numbers. Requests
+            with a cursor or limit return the next cursor in the X-Next-Cursor header
     """
     try:
-        document_id = request.document_id
-        user_id = request.user_id
-        all_presigned_urls = []
+        tables, next_cursor = await table_repo.get_tables_page(
+            request.document_id, request.page_start, request.page_end, request.cursor, request.page_limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        # Get tables from database
-        tables = await table_repo.get_tables_by_document_id(document_id)
-        
-        # Generate presigned URLs for each table
-        for table in tables:
-            decode_user_id, document_name, _ = DocumentEncoder.decode_document_id(document_id)
-            
-            # Get presigned URL for each table
-            presigned_url = await current_s3_client.get_presigned_view_url(table["id"])
-            
-            # Add metadata to the response
-            table_info = {
+    try:
+        # Sign every URL of the page with a single client
+        presigned_urls = await current_s3_client.get_presigned_view_urls([table["id"] for table in tables])
+
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
+        return [
+            {
                 "url": presigned_url,
                 "page_number": table["page_number"],
                 "table_number": table["table_number"]
             }
-            all_presigned_urls.append(table_info)
-
-        return all_presigned_urls
+            for table, presigned_url in zip(tables, presigned_urls)
+        ]
     
     except Exception as e:
         raise HTTPException(
             status_code=404, 
             detail=f"Tables not found: {str(e)}"
-        )
\ No newline at end of file
+        )
@@ -0,0 +1,40 @@
+from typing import Optional
+from fastapi import APIRouter, Query
+from lib.brain import llm_response_cache, llm_request_coalescer, llm_router
+from lib.llm_metrics import llm_metrics
+
+router = APIRouter()
+
+
+@router.get("/llm-metrics")
+async def get_llm_metrics(
+    since_seconds: Optional[float] = Query(None, gt=0, description="Only include calls from the last N seconds"),
+    call_site: Optional[str] = Query(None, description="Only include calls from this call site")
+):
+    """
+    Aggregate the recorded LLM calls of this process.
+
+    Args:
+        since_seconds (Optional[float]): Only include calls started in the last N seconds
+        call_site (Optional[str]): Only include calls from this call site (outline, page_hints, ...)
+
+    Returns:
+        dict: Per call site/provider/model call counts, token usage and latency percentiles,
+            together with the response cache, coalescing and circuit breaker state
+    """
+    return {
+        "call_sites": llm_metrics.aggregate(since_seconds=since_seconds, call_site=call_site),
+        "response_cache": {
+            "entries": len(llm_response_cache),
+            "hits": llm_response_cache.hits,
+            "misses": llm_response_cache.misses,
+        },
+        "coalesced_requests": llm_request_coalescer.coalesced,
+        "providers": {
+            provider: {
+                "circuit": health.state,
+                "latency_p95": health.p95(),
+            }
+            for provider, health in llm_router.providers.items()
+        },
+    }
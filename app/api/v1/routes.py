@@ -20,6 +20,9 @@ from api.v1.endpoints.content_findings import router as content_findings_router
 from api.v1.endpoints.get_prompt_library import router as prompt_library_router
 from api.v1.endpoints.create_workspace import router as workspace_router
 from api.v1.endpoints.google_drive import router as google_drive_router
+from api.v1.endpoints.llm_metrics import router as llm_metrics_router
+from api.v1.endpoints.cache_metrics import router as cache_metrics_router
+from api.v1.endpoints.document_citations import router as document_citations_router
 
 
 # Create main API router
@@ -39,6 +42,9 @@ router.include_router(content_findings_router, tags=["Content Analysis"])
 router.include_router(prompt_library_router, tags=["Prompt Library"])
 router.include_router(workspace_router, tags=["Workspace Management"])
 router.include_router(google_drive_router, tags=["Google Drive Integration"])
+router.include_router(llm_metrics_router, tags=["Monitoring"])
+router.include_router(cache_metrics_router, tags=["Monitoring"])
+router.include_router(document_citations_router, tags=["Document Citations"])
 
 
 @router.get("/health", tags=["Health Check"])
@@ -75,11 +75,17 @@ class OllamaSettings(BaseSettings):
         OLLAMA_EMBEDDING_MODEL: Model name for embeddings
         OLLAMA_ANALYTICAL_MODEL: Primary model for analysis
         OLLAMA_ANALYTICAL_MODEL2: Secondary model for analysis
+        OLLAMA_REQUESTS_PER_MINUTE: Request rate limit for chat calls (0 disables it)
+        OLLAMA_TOKENS_PER_MINUTE: Token rate limit for chat calls (0 disables it)
+        OLLAMA_MAX_CONCURRENCY: Maximum number of chat calls in flight
     """
     OLLAMA_ENDPOINT_URL: str = "http://localhost:11434"
     OLLAMA_EMBEDDING_MODEL: str = "nomic-embed-text"
     OLLAMA_ANALYTICAL_MODEL: str = "gpt-4o"
     OLLAMA_ANALYTICAL_MODEL2: str = "gpt-4o"
+    OLLAMA_REQUESTS_PER_MINUTE: int = 0
+    OLLAMA_TOKENS_PER_MINUTE: int = 0
+    OLLAMA_MAX_CONCURRENCY: int = 2
  
     class Config:
         env_file = ".env"  
@@ -97,12 +103,17 @@ class AWSSettings(BaseSettings):
         qdrant_host_url: Qdrant host URL (deprecated, use QdrantSettings)
         ollama_endpoint_url: Ollama endpoint URL (deprecated, use OllamaSettings)
         document_db_connection_string: MongoDB connection (deprecated, use MongoDBSettings)
+        presigned_url_cache_size: Maximum number of presigned URLs cached per process
+        presigned_url_refresh_fraction: Fraction of its lifetime below which a cached
+            presigned URL is reissued
     """
     access_key: str
     secret_key: str
     qdrant_host_url: str
     ollama_endpoint_url: str
     document_db_connection_string: str
+    presigned_url_cache_size: int = 20000
+    presigned_url_refresh_fraction: float = 0.5
 
     class Config:
         env_file = ".env"
@@ -117,9 +128,15 @@ class OpenAISettings(BaseSettings):
     Attributes:
         OPENAI_API_KEY: OpenAI API key for authentication
         OPENAI_API_MODEL: Default model to use for OpenAI requests
+        OPENAI_REQUESTS_PER_MINUTE: Request rate limit of the account (0 disables it)
+        OPENAI_TOKENS_PER_MINUTE: Token rate limit of the account (0 disables it)
+        OPENAI_MAX_CONCURRENCY: Maximum number of requests in flight
     """
     OPENAI_API_KEY: str
     OPENAI_API_MODEL: str = "gpt-4o"
+    OPENAI_REQUESTS_PER_MINUTE: int = 500
+    OPENAI_TOKENS_PER_MINUTE: int = 30000
+    OPENAI_MAX_CONCURRENCY: int = 16
 
     class Config:
         env_file = ".env"
@@ -135,10 +152,62 @@ class GroqSettings(BaseSettings):
         GROQ_API_KEY: Groq API key for authentication (free tier available)
         GROQ_API_MODEL: Default model to use (llama-3.1-70b-versatile, mixtral-8x7b, etc.)
         GROQ_API_BASE: Groq API base URL
+        GROQ_REQUESTS_PER_MINUTE: Request rate limit of the account (0 disables it)
+        GROQ_TOKENS_PER_MINUTE: Token rate limit of the account (0 disables it)
+        GROQ_MAX_CONCURRENCY: Maximum number of requests in flight
     """
     GROQ_API_KEY: Optional[str] = None
     GROQ_API_MODEL: str = "llama-3.1-70b-versatile"
     GROQ_API_BASE: str = "https://api.groq.com/openai/v1"
+    GROQ_REQUESTS_PER_MINUTE: int = 30
+    GROQ_TOKENS_PER_MINUTE: int = 30000
+    GROQ_MAX_CONCURRENCY: int = 8
+
+    class Config:
+        env_file = ".env"
+        env_file_encoding = "utf-8"
+        extra = "ignore"
+
+class LLMClientSettings(BaseSettings):
+    """
+    Connection pool and timeout configuration shared by all LLM provider clients.
+    
+    Attributes:
+        LLM_MAX_CONNECTIONS: Maximum number of open connections per provider
+        LLM_MAX_KEEPALIVE_CONNECTIONS: Idle connections kept alive per provider
+        LLM_KEEPALIVE_EXPIRY: Seconds an idle connection is kept before closing
+        LLM_CONNECT_TIMEOUT: Seconds allowed to establish a connection
+        LLM_READ_TIMEOUT: Seconds allowed between response bytes for hosted providers
+        LLM_MAX_RETRIES: Retries of a call after a 429, 5xx or connection error
+        LLM_RETRY_BASE_DELAY: Base delay in seconds of the jittered exponential backoff
+        LLM_RETRY_MAX_DELAY: Upper bound in seconds for a single backoff delay
+        LLM_ESTIMATED_COMPLETION_TOKENS: Completion tokens reserved per call by the token limiter
+        OLLAMA_READ_TIMEOUT: Read timeout for Ollama, None disables it for slow local models
+        LLM_RESPONSE_CACHE_ENABLED: Whether identical LLM requests are answered from the response cache
+        LLM_RESPONSE_CACHE_TTL: Seconds a cached LLM response stays valid
+        LLM_RESPONSE_CACHE_MAX_ENTRIES: Maximum number of cached LLM responses
+        LLM_CIRCUIT_FAILURE_THRESHOLD: Consecutive failures that open a provider's circuit breaker
+        LLM_CIRCUIT_RESET_TIMEOUT: Seconds an open circuit breaker waits before a trial call
+        LLM_HEDGE_DEFAULT_DELAY: Hedge delay in seconds until enough latencies are known for a p95
+        LLM_HEDGE_MIN_DELAY: Lower bound in seconds for the hedge delay
+    """
+    LLM_MAX_CONNECTIONS: int = 100
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    LLM_KEEPALIVE_EXPIRY: float = 30.0
+    LLM_CONNECT_TIMEOUT: float = 10.0
+    LLM_READ_TIMEOUT: float = 300.0
+    LLM_MAX_RETRIES: int = 3
+    LLM_RETRY_BASE_DELAY: float = 1.0
+    LLM_RETRY_MAX_DELAY: float = 30.0
+    LLM_ESTIMATED_COMPLETION_TOKENS: int = 1024
+    OLLAMA_READ_TIMEOUT: Optional[float] = None
+    LLM_RESPONSE_CACHE_ENABLED: bool = True
+    LLM_RESPONSE_CACHE_TTL: int = 86400
+    LLM_RESPONSE_CACHE_MAX_ENTRIES: int = 2048
+    LLM_CIRCUIT_FAILURE_THRESHOLD: int = 5
+    LLM_CIRCUIT_RESET_TIMEOUT: float = 30.0
+    LLM_HEDGE_DEFAULT_DELAY: float = 20.0
+    LLM_HEDGE_MIN_DELAY: float = 2.0
 
     class Config:
         env_file = ".env"
@@ -194,6 +263,7 @@ ollama_settings = OllamaSettings()
 aws_settings = AWSSettings()
 openai_settings = OpenAISettings()
 groq_settings = GroqSettings()
+llm_client_settings = LLMClientSettings()
 google_drive_settings = GoogleDriveSettings()
 
 
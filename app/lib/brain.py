@@ -3,16 +3,1129 @@ LLM Interface Module (Brain)
 
 This module provides a unified interface for interacting with different Large Language Models
 (OpenAI, Groq, and Ollama). It supports both streaming and non-streaming responses.
+
+Provider clients are pooled in a single registry that is opened once in the app
+lifespan, so TLS sessions and keep-alive connections are reused across calls.
+
+Every call goes through a per-provider scheduler that enforces request and token
+rate limits, caps concurrency, retries 429/5xx errors with jittered backoff and
+lets interactive requests go ahead of background work.
+
+Completed non-streaming responses are kept in an in-process cache keyed by provider,
+model, messages and sampling options, so identical requests are not paid for twice. Identical requests that are in
+flight at the same time share a single upstream call (single-flight), and a
+shared stream is fanned out to every subscriber.
+
+Each call site has a routing policy with ordered fallback providers guarded by
+per-provider circuit breakers, and can hedge slow calls with a second provider
+once the first has been running longer than its recent p95 latency.
+
+Every call is recorded in lib.llm_metrics with its token usage, time to first
+token and latency.
 """
 
+import asyncio
+import heapq
+import itertools
 import json
-from typing import Optional, AsyncGenerator, Union, List, Dict
+import random
+from collections import deque
+from functools import partial
+from time import monotonic
+from typing import Optional, AsyncGenerator, AsyncIterator, Awaitable, Callable, Union, List, Dict, Tuple
 from fastapi import HTTPException
+from pydantic import BaseModel
 import httpx
-from openai import AsyncOpenAI
+from openai import AsyncOpenAI, OpenAI, APIConnectionError
 
-from configs.config import ollama_settings, openai_settings, groq_settings
+from configs.config import ollama_settings, openai_settings, groq_settings, llm_client_settings
+from lib.hasher import hash_string
+from lib.llm_metrics import LLMCallRecord, llm_metrics
 from lib.logger import log
+from lib.ttl_cache import TTLCache
+
+
+class LLMClientRegistry:
+    """
+    Registry of pooled, long-lived LLM provider clients.
+    
+    Clients are created on startup (or lazily on first use outside the app, e.g. in
+    scripts) and closed on shutdown. All of them share the pool limits and timeouts
+    from LLMClientSettings.
+    """
+
+    def __init__(self):
+        self._groq_client: Optional[AsyncOpenAI] = None
+        self._openai_client: Optional[AsyncOpenAI] = None
+        self._openai_sync_client: Optional[OpenAI] = None
+        self._ollama_client: Optional[httpx.AsyncClient] = None
+
+    @staticmethod
+    def _limits() -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=llm_client_settings.LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=llm_client_settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=llm_client_settings.LLM_KEEPALIVE_EXPIRY,
+        )
+
+    @staticmethod
+    def _timeout(read_timeout: Optional[float]) -> httpx.Timeout:
+        return httpx.Timeout(
+            connect=llm_client_settings.LLM_CONNECT_TIMEOUT,
+            read=read_timeout,
+            write=llm_client_settings.LLM_CONNECT_TIMEOUT,
+            pool=llm_client_settings.LLM_CONNECT_TIMEOUT,
+        )
+
+    def _create_async_openai_client(self, api_key: str, base_url: Optional[str] = None) -> AsyncOpenAI:
+        http_client = httpx.AsyncClient(
+            limits=self._limits(),
+            timeout=self._timeout(llm_client_settings.LLM_READ_TIMEOUT),
+        )
+        # Retries are handled by llm_scheduler so they respect the provider rate limits
+        return AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            max_retries=0,
+            http_client=http_client,
+        )
+
+    @property
+    def groq(self) -> AsyncOpenAI:
+        """Pooled Groq client (OpenAI-compatible API)."""
+        if self._groq_client is None:
+            if not groq_settings.GROQ_API_KEY:
+                raise HTTPException(
+                    status_code=500,
+                    detail="GROQ_API_KEY not configured. Please set it in your .env file."
+                )
+            self._groq_client = self._create_async_openai_client(
+                api_key=groq_settings.GROQ_API_KEY,
+                base_url=groq_settings.GROQ_API_BASE,
+            )
+        return self._groq_client
+
+    @property
+    def openai(self) -> AsyncOpenAI:
+        """Pooled async OpenAI client."""
+        if self._openai_client is None:
+            self._openai_client = self._create_async_openai_client(api_key=openai_settings.OPENAI_API_KEY)
+        return self._openai_client
+
+    @property
+    def openai_sync(self) -> OpenAI:
+        """Pooled sync OpenAI client for callers that are not async yet."""
+        if self._openai_sync_client is None:
+            http_client = httpx.Client(
+                limits=self._limits(),
+                timeout=self._timeout(llm_client_settings.LLM_READ_TIMEOUT),
+            )
+            self._openai_sync_client = OpenAI(
+                api_key=openai_settings.OPENAI_API_KEY,
+                max_retries=llm_client_settings.LLM_MAX_RETRIES,
+                http_client=http_client,
+            )
+        return self._openai_sync_client
+
+    @property
+    def ollama(self) -> httpx.AsyncClient:
+        """Pooled HTTP client for the Ollama API."""
+        if self._ollama_client is None:
+            self._ollama_client = httpx.AsyncClient(
+                base_url=ollama_settings.OLLAMA_ENDPOINT_URL,
+                limits=self._limits(),
+                timeout=self._timeout(llm_client_settings.OLLAMA_READ_TIMEOUT),
+            )
+        return self._ollama_client
+
+    def startup(self) -> None:
+        """Open the clients of every configured provider."""
+        if groq_settings.GROQ_API_KEY:
+            self.groq
+        self.openai
+        self.openai_sync
+        self.ollama
+        log("LLM provider clients initialized")
+
+    async def aclose(self) -> None:
+        """Close all open clients and release their connections."""
+        if self._groq_client is not None:
+            await self._groq_client.close()
+        if self._openai_client is not None:
+            await self._openai_client.close()
+        if self._openai_sync_client is not None:
+            self._openai_sync_client.close()
+        if self._ollama_client is not None:
+            await self._ollama_client.aclose()
+
+        self._groq_client = None
+        self._openai_client = None
+        self._openai_sync_client = None
+        self._ollama_client = None
+        log("LLM provider clients closed")
+
+
+# Global registry shared by use_brain, ContentGenerator and content findings
+llm_clients = LLMClientRegistry()
+
+
+# Priority lanes of the scheduler, lower values are served first
+PRIORITY_LANES = {
+    "interactive": 0,
+    "background": 1,
+}
+
+PROVIDER_LABELS = {
+    "groq": "Groq",
+    "openai": "OpenAI",
+    "ollama": "Ollama",
+}
+
+
+class LLMProviderError(Exception):
+    """Error response from a provider that is not raised by the OpenAI SDK (Ollama)."""
+
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `capacity_per_minute` per minute.
+    
+    A capacity of 0 disables the limit.
+    """
+
+    def __init__(self, capacity_per_minute: int):
+        self.capacity = capacity_per_minute
+        self.tokens = float(capacity_per_minute)
+        self.updated_at = monotonic()
+
+    def _refill(self) -> None:
+        now = monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.capacity / 60)
+        self.updated_at = now
+
+    def time_until_available(self, amount: int) -> float:
+        """Seconds until `amount` tokens can be consumed."""
+        if not self.capacity:
+            return 0.0
+        self._refill()
+        # A single call larger than the bucket is allowed once the bucket is full
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) * 60 / self.capacity
+
+    def consume(self, amount: int) -> None:
+        """Take `amount` tokens; negative amounts give tokens back."""
+        if not self.capacity:
+            return
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class ProviderLimiter:
+    """
+    Admission control for a single provider.
+    
+    Callers wait in a priority queue until a concurrency slot is free and both the
+    request and token buckets can cover the call.
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int, max_concurrency: int):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max(1, max_concurrency)
+        self.active = 0
+        self._waiting: List[Tuple[int, int]] = []
+        self._sequence = itertools.count()
+        self._changed = asyncio.Event()
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _wait_for_change(self, timeout: Optional[float]) -> None:
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def acquire(self, estimated_tokens: int, priority: int) -> None:
+        """Wait for a slot, then reserve one request and `estimated_tokens` tokens."""
+        ticket = (priority, next(self._sequence))
+        heapq.heappush(self._waiting, ticket)
+        try:
+            while True:
+                wait = None
+                if self._waiting[0] == ticket and self.active < self.max_concurrency:
+                    wait = max(
+                        self.requests.time_until_available(1),
+                        self.tokens.time_until_available(estimated_tokens),
+                    )
+                    if wait <= 0:
+                        heapq.heappop(self._waiting)
+                        self.requests.consume(1)
+                        self.tokens.consume(estimated_tokens)
+                        self.active += 1
+                        self._notify()
+                        return
+                await self._wait_for_change(wait)
+        except BaseException:
+            if ticket in self._waiting:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._notify()
+            raise
+
+    def release(self) -> None:
+        """Free the concurrency slot taken by acquire."""
+        self.active -= 1
+        self._notify()
+
+    def record_usage(self, estimated_tokens: int, used_tokens: Optional[int]) -> None:
+        """Correct the token bucket once the real usage of a call is known."""
+        if used_tokens is not None:
+            self.tokens.consume(used_tokens - estimated_tokens)
+
+
+def estimate_prompt_tokens(messages: List[Dict]) -> int:
+    """
+    Rough prompt size estimate (4 characters per token) used for admission control.
+    
+    Args:
+        messages: Chat messages, with string or multi-part content
+        
+    Returns:
+        int: Estimated number of prompt tokens
+    """
+    characters = 0
+    tokens = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            characters += len(content)
+        elif isinstance(content, list):
+            for part in content:
+                text = part.get("text") if isinstance(part, dict) else None
+                if isinstance(text, str):
+                    characters += len(text)
+                else:
+                    # Images and other non-text parts
+                    tokens += 1000
+    return tokens + characters // 4
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """Whether a provider error is a rate limit, server error or connection failure."""
+    if isinstance(error, (APIConnectionError, httpx.TransportError)):
+        return True
+    status_code = getattr(error, "status_code", None)
+    return status_code == 429 or (status_code is not None and status_code >= 500)
+
+
+def is_failover_error(error: Exception) -> bool:
+    """
+    Whether another provider may answer a call that failed with `error`: rate
+    limits, server errors, connection failures and timeouts. A rejected request
+    (400, context length, ...) would be rejected by every provider alike.
+    """
+    return is_retryable_error(error.__cause__ if isinstance(error.__cause__, Exception) else error)
+
+
+def get_retry_delay(error: Exception, attempt: int) -> float:
+    """
+    Backoff before the next attempt: the provider's Retry-After if given, otherwise
+    exponential backoff with full jitter.
+    """
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), llm_client_settings.LLM_RETRY_MAX_DELAY) + random.uniform(0, 1)
+        except ValueError:
+            pass
+    backoff = min(
+        llm_client_settings.LLM_RETRY_MAX_DELAY,
+        llm_client_settings.LLM_RETRY_BASE_DELAY * 2 ** attempt,
+    )
+    return random.uniform(0, backoff)
+
+
+class LLMScheduler:
+    """
+    Runs provider calls under per-provider rate limits, concurrency caps and retries.
+    """
+
+    def __init__(self):
+        self._limiters: Dict[str, ProviderLimiter] = {}
+
+    def limiter(self, provider: str) -> ProviderLimiter:
+        """Get (or create from settings) the limiter of a provider."""
+        if provider not in self._limiters:
+            if provider == "groq":
+                limits = (groq_settings.GROQ_REQUESTS_PER_MINUTE, groq_settings.GROQ_TOKENS_PER_MINUTE,
+                          groq_settings.GROQ_MAX_CONCURRENCY)
+            elif provider == "openai":
+                limits = (openai_settings.OPENAI_REQUESTS_PER_MINUTE, openai_settings.OPENAI_TOKENS_PER_MINUTE,
+                          openai_settings.OPENAI_MAX_CONCURRENCY)
+            else:
+                limits = (ollama_settings.OLLAMA_REQUESTS_PER_MINUTE, ollama_settings.OLLAMA_TOKENS_PER_MINUTE,
+                          ollama_settings.OLLAMA_MAX_CONCURRENCY)
+            self._limiters[provider] = ProviderLimiter(*limits)
+        return self._limiters[provider]
+
+    async def _retry_delay(self, provider: str, error: Exception, attempt: int,
+                           record: Optional[LLMCallRecord] = None) -> bool:
+        """Sleep before the next attempt; returns False when the error should be raised."""
+        if not is_retryable_error(error) or attempt >= llm_client_settings.LLM_MAX_RETRIES:
+            return False
+        if record is not None:
+            record.retries += 1
+        delay = get_retry_delay(error, attempt)
+        log(f"{PROVIDER_LABELS.get(provider, provider)} call failed ({error}), retrying in {delay:.1f}s "
+            f"(attempt {attempt + 1} of {llm_client_settings.LLM_MAX_RETRIES})")
+        await asyncio.sleep(delay)
+        return True
+
+    async def run(
+        self,
+        provider: str,
+        call: Callable[[], Awaitable[Tuple[str, Optional[Tuple[int, int]]]]],
+        estimated_tokens: int,
+        priority: str = "interactive",
+        record: Optional[LLMCallRecord] = None,
+    ) -> Tuple[str, Optional[Tuple[int, int]]]:
+        """
+        Run a non-streaming call and return its text and token usage.
+        
+        Args:
+            provider: Provider name used to pick the limiter
+            call: Coroutine factory returning (text, (prompt_tokens, completion_tokens) or None)
+            estimated_tokens: Tokens reserved before the call starts
+            priority: Scheduler lane, see PRIORITY_LANES
+            record: Telemetry record that counts the retries
+            
+        Returns:
+            Tuple[str, Optional[Tuple[int, int]]]: Text and token usage returned by the call
+        """
+        limiter = self.limiter(provider)
+        attempt = 0
+        while True:
+            await limiter.acquire(estimated_tokens, PRIORITY_LANES[priority])
+            error = None
+            try:
+                text, usage = await call()
+            except Exception as e:
+                error = e
+            finally:
+                limiter.release()
+
+            if error is None:
+                limiter.record_usage(estimated_tokens, sum(usage) if usage else None)
+                return text, usage
+            if not await self._retry_delay(provider, error, attempt, record):
+                raise error
+            attempt += 1
+
+    async def stream(
+        self,
+        provider: str,
+        open_stream: Callable[[], Awaitable[AsyncIterator[str]]],
+        estimated_tokens: int,
+        priority: str = "interactive",
+        record: Optional[LLMCallRecord] = None,
+    ) -> AsyncGenerator[str, None]:
+        """
+        Open a streaming call and yield its chunks.
+        
+        Only opening the stream is retried; the concurrency slot is held until the
+        stream is exhausted or closed.
+        
+        Args:
+            provider: Provider name used to pick the limiter
+            open_stream: Coroutine factory that opens the stream and returns its chunk iterator
+            estimated_tokens: Tokens reserved before the call starts
+            priority: Scheduler lane, see PRIORITY_LANES
+            record: Telemetry record that counts the retries
+        """
+        limiter = self.limiter(provider)
+        attempt = 0
+        while True:
+            await limiter.acquire(estimated_tokens, PRIORITY_LANES[priority])
+            try:
+                chunks = await open_stream()
+                break
+            except Exception as e:
+                limiter.release()
+                if not await self._retry_delay(provider, e, attempt, record):
+                    raise
+                attempt += 1
+            except BaseException:
+                limiter.release()
+                raise
+
+        try:
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            if hasattr(chunks, "aclose"):
+                await chunks.aclose()
+            limiter.release()
+
+
+# Global scheduler shared by every use_brain call
+llm_scheduler = LLMScheduler()
+
+
+def _hash_default(value) -> str:
+    # Image bytes in vision messages are hashed instead of serialized
+    if isinstance(value, (bytes, bytearray)):
+        return hash_string(value.hex())
+    return str(value)
+
+
+def build_cache_key(provider: str, model: str, messages: List[Dict], temperature: Optional[float],
+                    options: Optional[Dict] = None) -> str:
+    """
+    Build the response cache key of a request.
+    
+    Args:
+        provider: Provider name
+        model: Resolved model name
+        messages: Chat messages of the request
+        temperature: Sampling temperature
+        options: Other provider options that change the response (e.g. Ollama's JSON mode)
+        
+    Returns:
+        str: Cache key
+    """
+    messages_hash = hash_string(json.dumps(messages, sort_keys=True, default=_hash_default))
+    options_hash = hash_string(json.dumps(options or {}, sort_keys=True))
+    return f"{provider}:{model}:{temperature}:{options_hash}:{messages_hash}"
+
+
+class LLMResponseCache(TTLCache):
+    """In-process LRU cache of complete LLM responses with a time-to-live, see TTLCache."""
+
+
+async def replay_cached_response(response: str, chunk_size: int = 64) -> AsyncGenerator[str, None]:
+    """Yield a cached response in chunks so streaming callers can consume it unchanged."""
+    for start in range(0, len(response), chunk_size):
+        yield response[start:start + chunk_size]
+
+
+# Global response cache shared by every use_brain call
+llm_response_cache = LLMResponseCache(
+    ttl=llm_client_settings.LLM_RESPONSE_CACHE_TTL,
+    max_entries=llm_client_settings.LLM_RESPONSE_CACHE_MAX_ENTRIES,
+)
+
+
+class StreamAbandoned(Exception):
+    """The shared stream was cancelled because every subscriber had left."""
+
+
+class StreamBroadcast:
+    """
+    Fans one upstream stream out to any number of subscribers.
+    
+    The upstream is opened by the first subscriber. Chunks are buffered so
+    subscribers that join late replay the stream from the start. The upstream is
+    cancelled when the last subscriber leaves early, after which the broadcast
+    is abandoned and turns new subscribers away.
+    """
+
+    def __init__(self, open_source: Callable[[], AsyncGenerator[str, None]],
+                 on_done: Callable[["StreamBroadcast"], None]):
+        self.chunks: List[str] = []
+        self.done = False
+        self.abandoned = False
+        self.error: Optional[Exception] = None
+        self.subscribers = 0
+        self._open_source = open_source
+        self._on_done = on_done
+        self._changed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _pump(self) -> None:
+        source = self._open_source()
+        try:
+            async for chunk in source:
+                self.chunks.append(chunk)
+                self._notify()
+        except asyncio.CancelledError:
+            self.abandoned = True
+            raise
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._on_done(self)
+            self._notify()
+            await source.aclose()
+
+    async def subscribe(self) -> AsyncGenerator[str, None]:
+        """
+        Yield every chunk of the shared stream, re-raising its error if it fails.
+        
+        Raises:
+            StreamAbandoned: If the upstream was cancelled before this subscriber finished
+        """
+        if self.abandoned:
+            raise StreamAbandoned()
+        self.subscribers += 1
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._pump())
+        index = 0
+        try:
+            while True:
+                if index < len(self.chunks):
+                    yield self.chunks[index]
+                    index += 1
+                elif self.done:
+                    if self.error is not None:
+                        raise self.error
+                    if self.abandoned:
+                        raise StreamAbandoned()
+                    return
+                else:
+                    await self._changed.wait()
+        finally:
+            self.subscribers -= 1
+            if not self.subscribers and not self.done:
+                # Nobody can join a stream that is going away
+                self.abandoned = True
+                self._on_done(self)
+                self._task.cancel()
+
+
+class LLMRequestCoalescer:
+    """
+    Single-flight registry of in-flight LLM requests keyed by their cache key.
+    
+    Attributes:
+        coalesced: Number of requests that joined an in-flight upstream call
+    """
+
+    def __init__(self):
+        self.coalesced = 0
+        self._calls: Dict[str, asyncio.Future] = {}
+        self._streams: Dict[str, StreamBroadcast] = {}
+
+    async def run(self, key: str, call: Callable[[], Awaitable]) -> object:
+        """
+        Await the in-flight call for `key`, starting it if there is none.
+        
+        The upstream call runs as its own task, so one caller being cancelled does
+        not cancel it for the others.
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(call())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finish_call(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finish_call(self, key: str, task: asyncio.Future) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark the exception as retrieved when every caller has gone away
+        if not task.cancelled():
+            task.exception()
+
+    def _finish_stream(self, key: str, broadcast: StreamBroadcast) -> None:
+        if self._streams.get(key) is broadcast:
+            del self._streams[key]
+
+    def in_flight(self, key: str) -> bool:
+        """Whether an identical request is already in flight."""
+        return key in self._calls or key in self._streams
+
+    async def stream(self, key: str, open_source: Callable[[], AsyncGenerator[str, None]]) -> AsyncGenerator[str, None]:
+        """
+        Subscribe to the in-flight stream for `key` once iterated, starting it if there is none.
+        
+        A caller that joins a stream just as it is abandoned starts a new one.
+        """
+        while True:
+            broadcast = self._streams.get(key)
+            if broadcast is None:
+                broadcast = StreamBroadcast(open_source, on_done=partial(self._finish_stream, key))
+                self._streams[key] = broadcast
+            else:
+                self.coalesced += 1
+
+            received = 0
+            try:
+                async for chunk in broadcast.subscribe():
+                    received += 1
+                    yield chunk
+                return
+            except StreamAbandoned:
+                if received:
+                    raise
+
+
+# Global single-flight registry shared by every use_brain call
+llm_request_coalescer = LLMRequestCoalescer()
+
+
+def _openai_compatible_params(model: str, messages: List[Dict], stream: bool, temperature: Optional[float]) -> Dict:
+    completion_params = {
+        "model": model,
+        "messages": messages,
+        "stream": stream
+    }
+    if temperature is not None:
+        completion_params["temperature"] = temperature
+    return completion_params
+
+
+async def _openai_compatible_completion(
+    provider: str,
+    client: AsyncOpenAI,
+    model: str,
+    messages: List[Dict],
+    temperature: Optional[float],
+) -> Tuple[str, Optional[Tuple[int, int]]]:
+    label = PROVIDER_LABELS[provider]
+    response = await client.chat.completions.create(
+        **_openai_compatible_params(model, messages, False, temperature)
+    )
+
+    if not response.choices or not response.choices[0].message:
+        raise HTTPException(status_code=500, detail=f"No response from {label}")
+
+    full_text = response.choices[0].message.content
+    if not full_text:
+        raise HTTPException(status_code=500, detail=f"Empty response from {label}")
+
+    usage = (response.usage.prompt_tokens, response.usage.completion_tokens) if response.usage else None
+    return full_text, usage
+
+
+async def _open_openai_compatible_stream(
+    provider: str,
+    client: AsyncOpenAI,
+    model: str,
+    messages: List[Dict],
+    temperature: Optional[float],
+) -> AsyncIterator[str]:
+    response = await client.chat.completions.create(
+        **_openai_compatible_params(model, messages, True, temperature)
+    )
+
+    async def stream_response() -> AsyncGenerator[str, None]:
+        try:
+            async for chunk in response:
+                if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            label = PROVIDER_LABELS[provider]
+            log(f"{label} streaming error: {e}")
+            raise HTTPException(status_code=500, detail=f"{label} streaming error: {e}")
+        finally:
+            await response.close()
+
+    return stream_response()
+
+
+async def _ollama_completion(payload_json: str) -> Tuple[str, Optional[Tuple[int, int]]]:
+    response = await llm_clients.ollama.post(
+        url="/api/chat",
+        content=payload_json,
+    )
+    if response.status_code != 200:
+        msg = f"Ollama Error: {response.status_code} - {response.text}"
+        log(msg)
+        raise LLMProviderError(msg, status_code=response.status_code)
+
+    try:
+        response_json = response.json()
+    except json.JSONDecodeError as e:
+        msg = f"Failed to parse Ollama response: {e}"
+        log(msg)
+        raise HTTPException(status_code=500, detail=msg)
+
+    content = response_json.get("message", {}).get("content")
+    if not content:
+        log("No content in Ollama response.")
+        raise HTTPException(status_code=500, detail="No content in model response.")
+
+    if "eval_count" not in response_json:
+        return content, None
+    return content, (response_json.get("prompt_eval_count", 0), response_json["eval_count"])
+
+
+async def _open_ollama_stream(payload_json: str) -> AsyncIterator[str]:
+    client = llm_clients.ollama
+    request = client.build_request("POST", "/api/chat", content=payload_json)
+    response = await client.send(request, stream=True)
+    if response.status_code != 200:
+        msg = f"Ollama Error: {response.status_code} - {await response.aread()}"
+        await response.aclose()
+        log(msg)
+        raise LLMProviderError(msg, status_code=response.status_code)
+
+    async def stream_response() -> AsyncGenerator[str, None]:
+        try:
+            async for line in response.aiter_lines():
+                if line:
+                    try:
+                        response_json = json.loads(line)
+                        content = response_json.get("message", {}).get("content")
+                        if content:
+                            yield content
+                    except json.JSONDecodeError as e:
+                        log(f"JSON decode error: {e}")
+            log("Streaming complete.")
+        finally:
+            await response.aclose()
+
+    return stream_response()
+
+
+def _to_http_exception(inference: str, error: Exception) -> HTTPException:
+    """Map a provider error that survived the retries to the API error of use_brain."""
+    if isinstance(error, HTTPException):
+        return error
+
+    if inference == "ollama":
+        if isinstance(error, httpx.TimeoutException):
+            msg = f"Ollama request timed out: {error}"
+            log(msg)
+            return HTTPException(status_code=504, detail=msg)
+        if isinstance(error, LLMProviderError):
+            return HTTPException(status_code=500, detail=str(error))
+        msg = f"Unexpected error: {error}"
+        log(msg)
+        return HTTPException(status_code=500, detail=msg)
+
+    label = PROVIDER_LABELS[inference]
+    log(f"{label} Error: {error}")
+    return HTTPException(status_code=500, detail=f"{label} error: {error}")
+
+
+class LLMRoutingPolicy(BaseModel):
+    """
+    Failover and hedging policy of a use_brain call site.
+    
+    Attributes:
+        fallbacks: Providers tried in order after the requested one fails with a
+            rate limit, server or connection error
+        fallback_models: Model to call on a fallback provider, its configured
+            default model when not listed
+        hedge: Send a second request to the next provider when the first one is
+            slower than its recent p95 latency, and keep whichever answers first.
+            Only interactive calls are hedged; background work waits for its provider
+    """
+    fallbacks: List[str] = []
+    fallback_models: Dict[str, str] = {}
+    hedge: bool = False
+
+
+# Routing policy per call site; unknown call sites use "default", which does not fail over
+LLM_ROUTING_POLICIES: Dict[str, LLMRoutingPolicy] = {
+    "default": LLMRoutingPolicy(),
+    "outline": LLMRoutingPolicy(fallbacks=["openai", "groq"], hedge=True),
+    "chat": LLMRoutingPolicy(fallbacks=["openai", "groq"], hedge=True),
+    # Page hints send images in a provider specific format, so they never fail over
+    "page_hints": LLMRoutingPolicy(fallbacks=[]),
+}
+
+
+class ProviderHealth:
+    """
+    Circuit breaker and latency window of a single provider.
+    
+    The breaker opens after LLM_CIRCUIT_FAILURE_THRESHOLD consecutive failures.
+    After LLM_CIRCUIT_RESET_TIMEOUT seconds it lets a single trial call through
+    (half-open) and closes again when that call succeeds.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float, window: int = 200):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.latencies = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        """Whether a call may be sent to the provider now."""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self, latency: float) -> None:
+        self.latencies.append(latency)
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        self.trial_in_flight = False
+        if self.consecutive_failures >= self.failure_threshold:
+            self.opened_at = monotonic()
+
+    def record_inconclusive(self) -> None:
+        # A hedged call that lost the race, or a request the provider rejected,
+        # says nothing about the provider's health
+        self.trial_in_flight = False
+
+    def p95(self) -> Optional[float]:
+        """95th percentile latency of recent successful calls, None until enough samples exist."""
+        if len(self.latencies) < 20:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+
+class LLMRouter:
+    """
+    Picks providers for a call according to its routing policy, failing over on
+    errors and hedging slow calls.
+    """
+
+    def __init__(self):
+        self._health: Dict[str, ProviderHealth] = {}
+
+    @property
+    def providers(self) -> Dict[str, ProviderHealth]:
+        """Health of every provider that has been called."""
+        return dict(self._health)
+
+    def health(self, provider: str) -> ProviderHealth:
+        if provider not in self._health:
+            self._health[provider] = ProviderHealth(
+                failure_threshold=llm_client_settings.LLM_CIRCUIT_FAILURE_THRESHOLD,
+                reset_timeout=llm_client_settings.LLM_CIRCUIT_RESET_TIMEOUT,
+            )
+        return self._health[provider]
+
+    def hedge_delay(self, provider: str) -> float:
+        """Seconds to wait for `provider` before sending a hedged request elsewhere."""
+        p95 = self.health(provider).p95()
+        if p95 is None:
+            p95 = llm_client_settings.LLM_HEDGE_DEFAULT_DELAY
+        return max(p95, llm_client_settings.LLM_HEDGE_MIN_DELAY)
+
+    def _next_available(self, remaining: List[str]) -> Optional[str]:
+        while remaining:
+            provider = remaining.pop(0)
+            if self.health(provider).allow():
+                return provider
+            log(f"Skipping {PROVIDER_LABELS[provider]}, its circuit breaker is open")
+        return None
+
+    async def route(
+        self,
+        providers: List[str],
+        policy: LLMRoutingPolicy,
+        attempt: Callable[[str], Awaitable],
+        discard: Optional[Callable[[object], None]] = None,
+        record: Optional[LLMCallRecord] = None,
+    ) -> Tuple[object, str]:
+        """
+        Run `attempt` on the providers in order until one succeeds. Only rate
+        limits, server and connection errors fail over to the next provider.
+        
+        Args:
+            providers: Candidate providers, the requested one first
+            policy: Routing policy of the call site
+            attempt: Coroutine factory running the call on one provider
+            discard: Releases the result of an attempt that finished but lost a hedge race
+            record: Telemetry record that is marked when the call is hedged or fails over
+            
+        Returns:
+            Tuple[object, str]: (result of the winning attempt, provider that produced it)
+        """
+        remaining = list(providers)
+        pending: Dict[asyncio.Future, str] = {}
+        last_error: Optional[Exception] = None
+
+        try:
+            while True:
+                if not pending:
+                    provider = self._next_available(remaining)
+                    if provider is None:
+                        break
+                    pending[asyncio.ensure_future(attempt(provider))] = provider
+
+                timeout = None
+                if policy.hedge and len(pending) == 1 and remaining:
+                    timeout = self.hedge_delay(next(iter(pending.values())))
+
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    provider = self._next_available(remaining)
+                    if provider is not None:
+                        log(f"Hedging slow LLM call with {PROVIDER_LABELS[provider]} after {timeout:.1f}s")
+                        pending[asyncio.ensure_future(attempt(provider))] = provider
+                        if record is not None:
+                            record.hedged = True
+                    continue
+
+                for task in done:
+                    provider = pending.pop(task)
+                    if task.exception() is None:
+                        return task.result(), provider
+                    last_error = task.exception()
+                    if not is_failover_error(last_error):
+                        # The request itself was rejected; only a call already in flight may still answer
+                        remaining.clear()
+                        continue
+                    if record is not None:
+                        record.failovers += 1
+                    if remaining or pending:
+                        log(f"{PROVIDER_LABELS[provider]} failed ({last_error}), failing over")
+        finally:
+            for task in pending:
+                if not task.done():
+                    task.cancel()
+                elif discard is not None and not task.cancelled() and task.exception() is None:
+                    discard(task.result())
+
+        if last_error is not None:
+            raise last_error
+        raise HTTPException(status_code=503, detail="No LLM provider available, all circuit breakers are open.")
+
+
+# Global router shared by every use_brain call
+llm_router = LLMRouter()
+
+
+async def _record_stream(chunks: AsyncGenerator[str, None], record: LLMCallRecord) -> AsyncGenerator[str, None]:
+    """Pass a stream through while recording its time to first token and latency."""
+    characters = 0
+    error = None
+    try:
+        async for chunk in chunks:
+            record.mark_first_token()
+            characters += len(chunk)
+            yield chunk
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        await chunks.aclose()
+        # Streams do not report usage, so the completion size is estimated from its text
+        if not record.cached and not record.coalesced and characters:
+            record.completion_tokens = characters // 4
+        record.finish(error)
+        llm_metrics.record(record)
+
+
+def record_attempt_error(health: ProviderHealth, error: Exception) -> None:
+    """Count an error of a provider attempt against its circuit breaker, unless the request itself was at fault."""
+    if is_failover_error(error):
+        health.record_failure()
+    else:
+        health.record_inconclusive()
+
+
+class ProviderCall(BaseModel):
+    """Everything needed to send one request to one provider."""
+    model: str
+    call: Callable
+    open_stream: Callable
+    cache_options: Optional[Dict] = None
+
+
+class CompletionResult(BaseModel):
+    """A non-streaming answer with the provider, model and usage every caller sharing it records."""
+    response: str
+    provider: str
+    model: str
+    prompt_tokens: int
+    completion_tokens: int
+    usage_estimated: bool = False
+
+
+def _is_configured(provider: str) -> bool:
+    if provider == "groq":
+        return bool(groq_settings.GROQ_API_KEY)
+    if provider == "openai":
+        return bool(openai_settings.OPENAI_API_KEY)
+    return True
+
+
+def _prepare_provider_call(
+    provider: str,
+    model: Optional[str],
+    messages: List[Dict],
+    stream: bool,
+    respond_in_json: bool,
+    ctx_window: int,
+    prediction: int,
+    temperature: Optional[float],
+) -> ProviderCall:
+    """
+    Build the request of one provider. `model` is None for fallback providers
+    without a model in the routing policy, which then use their configured default model.
+    """
+    if provider in ("groq", "openai"):
+        client = llm_clients.groq if provider == "groq" else llm_clients.openai
+
+        # Use Groq's default model if not specified
+        if provider == "groq" and model in (None, "gpt-4o"):
+            model = groq_settings.GROQ_API_MODEL
+        elif model is None:
+            model = openai_settings.OPENAI_API_MODEL
+
+        return ProviderCall(
+            model=model,
+            call=partial(_openai_compatible_completion, provider, client, model, messages, temperature),
+            open_stream=partial(_open_openai_compatible_stream, provider, client, model, messages, temperature),
+        )
+
+    payload = {
+        "model": "llama3.3:70b",
+        "messages": messages,
+        "stream": stream,
+        "options": {
+            "num_ctx": ctx_window,
+            "num_predict": prediction,
+            "temperature": temperature if temperature is not None else 0.3,
+            "top_p": 0.95
+        }
+    }
+    
+    if respond_in_json:
+        payload["format"] = "json"
+
+    payload_json = json.dumps(payload)
+    log(f"Sending request to Ollama at {ollama_settings.OLLAMA_ENDPOINT_URL} with model {payload['model']}")
+
+    return ProviderCall(
+        model=payload["model"],
+        call=partial(_ollama_completion, payload_json),
+        open_stream=partial(_open_ollama_stream, payload_json),
+        cache_options={"options": payload["options"], "format": payload.get("format")},
+    )
 
 
 async def use_brain(
@@ -24,12 +1137,18 @@ async def use_brain(
     prediction: int = -2,
     inference: str = "groq",
     temperature: Optional[float] = None,
+    priority: str = "interactive",
+    use_cache: Optional[bool] = None,
+    call_site: str = "default",
 ) -> Union[AsyncGenerator[str, None], str]:
     """
     Execute LLM inference using OpenAI, Groq, or Ollama backends.
     
     This function provides a unified interface for multiple LLM providers,
-    supporting both streaming and non-streaming responses.
+    supporting both streaming and non-streaming responses. Calls are admitted
+    by llm_scheduler, which rate limits and retries them per provider, and are
+    routed by llm_router, which fails over to the fallback providers of the
+    call site's policy and hedges slow interactive calls when the policy asks for it.
 
     Args:
         messages: List of message dictionaries with 'role' and 'content' keys
@@ -40,6 +1159,15 @@ async def use_brain(
         prediction: Number of tokens to predict, -2 for unlimited (Ollama only)
         inference: Backend provider - "groq" (default), "openai", or "ollama"
         temperature: Sampling temperature (0.0-1.0), controls randomness
+        priority: Scheduler lane - "interactive" (default) or "background" for
+            pipeline work that can wait behind user-facing requests
+        use_cache: Share responses with identical requests: answer from the response
+            cache and join identical in-flight calls. Only non-streaming answers of
+            the requested provider are stored; streaming calls replay a cached answer
+            as a stream. None (default) shares only deterministic calls, with a
+            temperature of 0 or unset; pass True to share sampled calls too
+        call_site: Name of the calling feature, selects the routing policy in
+            LLM_ROUTING_POLICIES
 
     Returns:
         Union[AsyncGenerator[str, None], str]: 
@@ -54,200 +1182,160 @@ async def use_brain(
     if not messages:
         raise HTTPException(status_code=400, detail="Messages cannot be empty.")
 
-    if inference == "groq":
-        try:
-            # Groq uses OpenAI-compatible API with custom base URL
-            if not groq_settings.GROQ_API_KEY:
-                raise HTTPException(
-                    status_code=500, 
-                    detail="GROQ_API_KEY not configured. Please set it in your .env file."
-                )
-            
-            client = AsyncOpenAI(
-                api_key=groq_settings.GROQ_API_KEY,
-                base_url=groq_settings.GROQ_API_BASE
-            )
-            
-            # Use Groq's default model if not specified
-            if model == "gpt-4o":
-                model = groq_settings.GROQ_API_MODEL
+    if inference not in PROVIDER_LABELS:
+        raise HTTPException(status_code=400, detail=f"Inference type '{inference}' not supported.")
 
-            if stream:
-                async def stream_response() -> AsyncGenerator[str, None]:
-                    try:
-                        completion_params = {
-                            "model": model,
-                            "messages": messages,
-                            "stream": True
-                        }
-                        if temperature is not None:
-                            completion_params["temperature"] = temperature
-
-                        response = await client.chat.completions.create(**completion_params)
-                        async for chunk in response:
-                            if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
-                                yield chunk.choices[0].delta.content
-                    except Exception as e:
-                        log(f"Groq streaming error: {e}")
-                        raise HTTPException(status_code=500, detail=f"Groq streaming error: {e}")
-
-                return stream_response()
+    if priority not in PRIORITY_LANES:
+        raise HTTPException(status_code=400, detail=f"Priority '{priority}' not supported.")
 
-            else:
-                completion_params = {
-                    "model": model,
-                    "messages": messages,
-                    "stream": False
-                }
-                if temperature is not None:
-                    completion_params["temperature"] = temperature
-
-                response = await client.chat.completions.create(**completion_params)
-                
-                if not response.choices or not response.choices[0].message:
-                    raise HTTPException(status_code=500, detail="No response from Groq")
-                
-                full_text = response.choices[0].message.content
-                if not full_text:
-                    raise HTTPException(status_code=500, detail="Empty response from Groq")
-                
-                return full_text
-
-        except HTTPException:
-            raise
-        except Exception as e:
-            log(f"Groq Error: {e}")
-            raise HTTPException(status_code=500, detail=f"Groq error: {e}")
+    policy = LLM_ROUTING_POLICIES.get(call_site, LLM_ROUTING_POLICIES["default"])
+    if policy.hedge and priority != "interactive":
+        # Nobody is waiting on background work, so a second paid request buys nothing
+        policy = policy.model_copy(update={"hedge": False})
+    providers = [inference] + [
+        provider for provider in policy.fallbacks
+        if provider != inference and _is_configured(provider)
+    ]
 
-    elif inference == "openai":
-        try:
-            client = AsyncOpenAI(api_key=openai_settings.OPENAI_API_KEY)
+    def prepare(provider: str) -> ProviderCall:
+        return _prepare_provider_call(
+            provider,
+            model if provider == inference else policy.fallback_models.get(provider),
+            messages, stream, respond_in_json, ctx_window, prediction, temperature,
+        )
 
-            if stream:
-                async def stream_response() -> AsyncGenerator[str, None]:
-                    try:
-                        completion_params = {
-                            "model": model,
-                            "messages": messages,
-                            "stream": True
-                        }
-                        if temperature is not None:
-                            completion_params["temperature"] = temperature
-
-                        response = await client.chat.completions.create(**completion_params)
-                        async for chunk in response:
-                            if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
-                                yield chunk.choices[0].delta.content
-                    except Exception as e:
-                        log(f"OpenAI streaming error: {e}")
-                        raise HTTPException(status_code=500, detail=f"OpenAI streaming error: {e}")
-
-                return stream_response()
+    primary_call = prepare(inference)
+    prompt_tokens = estimate_prompt_tokens(messages)
+    estimated_tokens = prompt_tokens + llm_client_settings.LLM_ESTIMATED_COMPLETION_TOKENS
+    record = LLMCallRecord(call_site=call_site, provider=inference, model=primary_call.model, stream=stream)
 
-            else:
-                completion_params = {
-                    "model": model,
-                    "messages": messages,
-                    "stream": False
-                }
-                if temperature is not None:
-                    completion_params["temperature"] = temperature
-
-                response = await client.chat.completions.create(**completion_params)
-                
-                if not response.choices or not response.choices[0].message:
-                    raise HTTPException(status_code=500, detail="No response from OpenAI")
-                
-                full_text = response.choices[0].message.content
-                if not full_text:
-                    raise HTTPException(status_code=500, detail="Empty response from OpenAI")
-                
-                return full_text
-
-        except HTTPException:
-            raise
-        except Exception as e:
-            log(f"OpenAI Error: {e}")
-            raise HTTPException(status_code=500, detail=f"OpenAI error: {e}")
-
-    elif inference == "ollama":
-        payload = {
-            "model": "llama3.3:70b",
-            "messages": messages,
-            "stream": stream,
-            "options": {
-                "num_ctx": ctx_window,
-                "num_predict": prediction,
-                "temperature": temperature if temperature is not None else 0.3,
-                "top_p": 0.95
-            }
-        }
-        
-        if respond_in_json:
-            payload["format"] = "json"
+    if use_cache is None:
+        # A sampled answer replayed for the cache TTL would stop being a fresh sample
+        use_cache = not temperature
 
-        payload_json = json.dumps(payload)
-        log(f"Sending request to Ollama at {ollama_settings.OLLAMA_ENDPOINT_URL} with model {payload['model']}")
+    cache_key = None
+    if use_cache:
+        cache_key = build_cache_key(inference, primary_call.model, messages, temperature, primary_call.cache_options)
+        if llm_client_settings.LLM_RESPONSE_CACHE_ENABLED:
+            cached_response = llm_response_cache.get(cache_key)
+            if cached_response is not None:
+                log(f"Serving {inference} response for model={primary_call.model} from cache")
+                record.cached = True
+                if stream:
+                    return _record_stream(replay_cached_response(cached_response), record)
+                record.finish()
+                llm_metrics.record(record)
+                return cached_response
+        record.coalesced = llm_request_coalescer.in_flight(cache_key)
 
-        try:
-            if stream:
-                async def stream_response() -> AsyncGenerator[str, None]:
-                    async with httpx.AsyncClient(timeout=None) as client:
-                        async with client.stream(
-                            "POST",
-                            f'{ollama_settings.OLLAMA_ENDPOINT_URL}/api/chat',
-                            data=payload_json,
-                        ) as response:
-                            if response.status_code != 200:
-                                msg = f"Ollama Error: {response.status_code} - {await response.aread()}"
-                                log(msg)
-                                raise HTTPException(status_code=500, detail=msg)
-
-                            async for line in response.aiter_lines():
-                                if line:
-                                    try:
-                                        response_json = json.loads(line)
-                                        content = response_json.get("message", {}).get("content")
-                                        if content:
-                                            yield content
-                                    except json.JSONDecodeError as e:
-                                        log(f"JSON decode error: {e}")
-                    log("Streaming complete.")
-
-                return stream_response()
+    prepared_calls = {inference: primary_call}
 
-            else:
-                async with httpx.AsyncClient(timeout=None) as client:
-                    response = await client.post(
-                        url=f'{ollama_settings.OLLAMA_ENDPOINT_URL}/api/chat',
-                        data=payload_json,
-                    )
-                    if response.status_code != 200:
-                        msg = f"Ollama Error: {response.status_code} - {response.text}"
-                        log(msg)
-                        raise HTTPException(status_code=500, detail=msg)
+    def provider_call(provider: str) -> ProviderCall:
+        if provider not in prepared_calls:
+            prepared_calls[provider] = prepare(provider)
+        return prepared_calls[provider]
 
-                    try:
-                        response_json = response.json()
-                        content = response_json.get("message", {}).get("content")
-                        if content:
-                            return content
-                        else:
-                            log("No content in Ollama response.")
-                            raise HTTPException(status_code=500, detail="No content in model response.")
-                    except json.JSONDecodeError as e:
-                        msg = f"Failed to parse Ollama response: {e}"
-                        log(msg)
-                        raise HTTPException(status_code=500, detail=msg)
+    if stream:
+        async def attempt_stream(provider: str) -> Tuple[AsyncGenerator[str, None], Optional[str]]:
+            # Failover and hedging only apply until the first chunk has arrived
+            health = llm_router.health(provider)
+            started_at = monotonic()
+            chunks = llm_scheduler.stream(
+                provider, provider_call(provider).open_stream, estimated_tokens, priority, record
+            )
+            try:
+                first_chunk = await chunks.__anext__()
+            except StopAsyncIteration:
+                first_chunk = None
+            except asyncio.CancelledError:
+                health.record_inconclusive()
+                await chunks.aclose()
+                raise
+            except Exception as e:
+                record_attempt_error(health, e)
+                await chunks.aclose()
+                raise _to_http_exception(provider, e) from e
+            health.record_success(monotonic() - started_at)
+            return chunks, first_chunk
 
-        except httpx.TimeoutException as e:
-            msg = f"Ollama request timed out: {e}"
-            log(msg)
-            raise HTTPException(status_code=504, detail=msg)
+        def discard_stream(result: Tuple[AsyncGenerator[str, None], Optional[str]]) -> None:
+            asyncio.ensure_future(result[0].aclose())
+
+        async def stream_response() -> AsyncGenerator[str, None]:
+            (chunks, first_chunk), provider = await llm_router.route(
+                providers, policy, attempt_stream, discard=discard_stream, record=record
+            )
+            record.provider = provider
+            record.model = provider_call(provider).model
+            record.prompt_tokens = prompt_tokens
+            record.usage_estimated = True
+
+            try:
+                if first_chunk is not None:
+                    yield first_chunk
+                async for chunk in chunks:
+                    yield chunk
+            except Exception as e:
+                raise _to_http_exception(provider, e)
+            finally:
+                await chunks.aclose()
+
+        if cache_key is None:
+            return _record_stream(stream_response(), record)
+        return _record_stream(llm_request_coalescer.stream(cache_key, stream_response), record)
+
+    async def attempt_completion(provider: str) -> Tuple[str, Optional[Tuple[int, int]]]:
+        health = llm_router.health(provider)
+        started_at = monotonic()
+        try:
+            result = await llm_scheduler.run(
+                provider, provider_call(provider).call, estimated_tokens, priority, record
+            )
+        except asyncio.CancelledError:
+            health.record_inconclusive()
+            raise
         except Exception as e:
-            msg = f"Unexpected error: {e}"
-            log(msg)
-            raise HTTPException(status_code=500, detail=msg)
+            record_attempt_error(health, e)
+            raise _to_http_exception(provider, e) from e
+        health.record_success(monotonic() - started_at)
+        return result
 
-    else:
-        raise HTTPException(status_code=400, detail=f"Inference type '{inference}' not supported.")
\ No newline at end of file
+    async def run_call() -> CompletionResult:
+        (response, usage), provider = await llm_router.route(
+            providers, policy, attempt_completion, record=record
+        )
+        if usage:
+            result = CompletionResult(
+                response=response, provider=provider, model=provider_call(provider).model,
+                prompt_tokens=usage[0], completion_tokens=usage[1],
+            )
+        else:
+            result = CompletionResult(
+                response=response, provider=provider, model=provider_call(provider).model,
+                prompt_tokens=prompt_tokens, completion_tokens=len(response) // 4, usage_estimated=True,
+            )
+
+        # The key names the requested provider and model, so a fallback's answer is not stored under it
+        if cache_key is not None and provider == inference and llm_client_settings.LLM_RESPONSE_CACHE_ENABLED:
+            llm_response_cache.set(cache_key, response)
+        return result
+
+    try:
+        if cache_key is None:
+            result = await run_call()
+        else:
+            result = await llm_request_coalescer.run(cache_key, run_call)
+    except Exception as e:
+        record.finish(e)
+        llm_metrics.record(record)
+        raise
+
+    # Callers that joined an in-flight call record the answer they were given too
+    record.provider = result.provider
+    record.model = result.model
+    record.prompt_tokens = result.prompt_tokens
+    record.completion_tokens = result.completion_tokens
+    record.usage_estimated = result.usage_estimated
+    record.finish()
+    llm_metrics.record(record)
+    return result.response
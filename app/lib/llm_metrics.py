@@ -0,0 +1,158 @@
+"""
+LLM Call Telemetry
+
+In-process registry of per-call LLM metrics recorded by use_brain: provider,
+model, call site, token usage, time to first token, latency and whether the call
+was retried, served from cache, coalesced or hedged. The registry keeps a bounded
+window of recent calls and aggregates them per call site, provider and model.
+"""
+
+from collections import deque
+from time import monotonic, time
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+
+class LLMCallRecord(BaseModel):
+    """
+    Metrics of a single use_brain call.
+
+    Attributes:
+        call_site: Feature that issued the call (outline, page_hints, ...)
+        provider: Provider that produced the answer
+        model: Model that produced the answer
+        stream: Whether the call was streamed
+        prompt_tokens: Prompt tokens reported by the provider, or estimated
+        completion_tokens: Completion tokens reported by the provider, or estimated
+        usage_estimated: True when the token counts are estimates
+        time_to_first_token: Seconds until the first chunk (streaming calls only)
+        latency: Seconds until the call completed
+        retries: Number of retried attempts
+        cached: Answered from the response cache
+        coalesced: Joined an identical in-flight call
+        hedged: A hedged request was sent to a second provider
+        failovers: Number of providers that failed before one answered
+        error: Error message if the call failed
+        timestamp: Unix time the call started
+    """
+    call_site: str
+    provider: str
+    model: str
+    stream: bool = False
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    usage_estimated: bool = False
+    time_to_first_token: Optional[float] = None
+    latency: Optional[float] = None
+    retries: int = 0
+    cached: bool = False
+    coalesced: bool = False
+    hedged: bool = False
+    failovers: int = 0
+    error: Optional[str] = None
+    timestamp: float = Field(default_factory=time)
+    started_at: float = Field(default_factory=monotonic, exclude=True)
+
+    def mark_first_token(self) -> None:
+        if self.time_to_first_token is None:
+            self.time_to_first_token = monotonic() - self.started_at
+
+    def finish(self, error: Optional[Exception] = None) -> None:
+        self.latency = monotonic() - self.started_at
+        if error is not None:
+            self.error = str(getattr(error, "detail", error))
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """
+    Nearest-rank percentile of a list of values.
+
+    Args:
+        values: Sample values
+        q: Percentile between 0 and 1
+
+    Returns:
+        Optional[float]: The percentile, or None for an empty sample
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[int(q * (len(ordered) - 1))]
+
+
+class LLMMetricsRegistry:
+    """
+    Bounded in-memory store of recent LLM call records.
+
+    Attributes:
+        records: The most recent call records, oldest first
+    """
+
+    def __init__(self, max_records: int = 10000):
+        self.records = deque(maxlen=max_records)
+
+    def record(self, call_record: LLMCallRecord) -> None:
+        """Store a finished call record."""
+        self.records.append(call_record)
+
+    def clear(self) -> None:
+        """Drop every stored record."""
+        self.records.clear()
+
+    def aggregate(self, since_seconds: Optional[float] = None, call_site: Optional[str] = None) -> List[Dict]:
+        """
+        Aggregate the stored records per call site, provider and model.
+
+        Args:
+            since_seconds: Only include calls started in the last N seconds
+            call_site: Only include calls from this call site
+
+        Returns:
+            List[Dict]: One summary per group, slowest p95 latency first
+        """
+        cutoff = time() - since_seconds if since_seconds else None
+        groups: Dict[tuple, List[LLMCallRecord]] = {}
+        for call_record in list(self.records):
+            if cutoff is not None and call_record.timestamp < cutoff:
+                continue
+            if call_site is not None and call_record.call_site != call_site:
+                continue
+            key = (call_record.call_site, call_record.provider, call_record.model)
+            groups.setdefault(key, []).append(call_record)
+
+        summaries = []
+        for (group_call_site, provider, model), group in groups.items():
+            latencies = [r.latency for r in group if r.latency is not None and not r.cached]
+            first_token_times = [r.time_to_first_token for r in group if r.time_to_first_token is not None and not r.cached]
+            generation_rates = [
+                r.completion_tokens / (r.latency - (r.time_to_first_token or 0))
+                for r in group
+                if r.completion_tokens and r.latency and not r.cached and r.latency > (r.time_to_first_token or 0)
+            ]
+
+            summaries.append({
+                "call_site": group_call_site,
+                "provider": provider,
+                "model": model,
+                "calls": len(group),
+                "errors": sum(1 for r in group if r.error),
+                "cached": sum(1 for r in group if r.cached),
+                "coalesced": sum(1 for r in group if r.coalesced),
+                "retried": sum(1 for r in group if r.retries),
+                "hedged": sum(1 for r in group if r.hedged),
+                "failed_over": sum(1 for r in group if r.failovers),
+                "prompt_tokens": sum(r.prompt_tokens or 0 for r in group),
+                "completion_tokens": sum(r.completion_tokens or 0 for r in group),
+                "latency_p50": percentile(latencies, 0.5),
+                "latency_p95": percentile(latencies, 0.95),
+                "time_to_first_token_p50": percentile(first_token_times, 0.5),
+                "time_to_first_token_p95": percentile(first_token_times, 0.95),
+                "tokens_per_second_p50": percentile(generation_rates, 0.5),
+            })
+
+        return sorted(summaries, key=lambda summary: summary["latency_p95"] or 0, reverse=True)
+
+
+# Global registry filled by use_brain
+llm_metrics = LLMMetricsRegistry()
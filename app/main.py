@@ -3,14 +3,53 @@ Healthcare Document Assistant API - Main Application
 
 This module initializes and configures the FastAPI application for the
 Healthcare Document Assistant. It sets up CORS middleware, routes, and
-provides the main application instance.
+provides the main application instance together with its lifespan hooks.
 """
 
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from api.v1.routes import router
 from configs.config import AppInfo
+from lib.brain import llm_clients
+from lib.logger import log
+from models.extracted_text import extracted_text_repo
+from models.images import image_repo
+from models.pagination import NEXT_CURSOR_HEADER
+from models.preview import preview_repo
+from models.tables import table_repo
+from utils.document_handling.page_renderer import page_render_cache
+from utils.document_handling.table_detector import table_detector
+
+
+@asynccontextmanager
+async def lifespan(application: FastAPI):
+    """
+    Open shared resources on startup and release them on shutdown.
+    
+    Args:
+        application: The FastAPI application instance
+    """
+    llm_clients.startup()
+    try:
+        await extracted_text_repo.ensure_indexes()
+    except Exception as e:
+        log(f"WARNING: Could not create the extracted text indexes: {e}")
+    try:
+        await asyncio.gather(preview_repo.ensure_indexes(), table_repo.ensure_indexes(), image_repo.ensure_indexes())
+    except Exception as e:
+        log(f"WARNING: Could not create the preview, table and image indexes: {e}")
+    try:
+        await table_detector.start()
+    except Exception as e:
+        log(f"WARNING: Could not load the table detection model, retrying on first use: {e}")
+    yield
+    await table_detector.close()
+    page_render_cache.close()
+    await llm_clients.aclose()
 
 
 def create_application() -> FastAPI:
@@ -30,7 +69,8 @@ def create_application() -> FastAPI:
         description=app_config.DESCRIPTION,
         openapi_url=f"{app_config.API_V1_STR}/openapi.json",
         docs_url=f"{app_config.API_V1_STR}/docs",
-        redoc_url=f"{app_config.API_V1_STR}/redoc"
+        redoc_url=f"{app_config.API_V1_STR}/redoc",
+        lifespan=lifespan
     )
     
     # Configure CORS middleware
@@ -40,6 +80,7 @@ def create_application() -> FastAPI:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=[NEXT_CURSOR_HEADER],
     )
     
     # Include API routes
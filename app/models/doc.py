@@ -4,6 +4,8 @@ from pydantic import BaseModel, Field
 from services.document_db import get_database
 from services.document_encoder import DocumentEncoder
 from models.summary import summary_repo  
+from models.extracted_text import extracted_text_repo
+from models.tables import table_repo
 
 class DocModel(BaseModel):
     id: str = Field(..., alias="_id")
@@ -82,9 +84,9 @@ class DocRepository:
         }
     
     async def delete_doc_by_document_id(self, document_id: str) -> bool:
-        await self.summary_repo.delete_summary_by_document_id(document_id)
-        await self.extracted_text_repo.delete_texts_by_document_id(document_id)
-        await self.tables_repo.delete_tables_by_document_id(document_id)
+        await summary_repo.delete_summary_by_document_id(document_id)
+        await extracted_text_repo.delete_texts_by_document_id(document_id)
+        await table_repo.delete_tables_by_document_id(document_id)
         result = await self.collection.delete_one({"_id": document_id})
         return result.deleted_count > 0
 
@@ -0,0 +1,132 @@
+import json
+import zlib
+from typing import Dict, List, Literal, Optional
+from bson import Binary
+from pydantic import BaseModel
+from pymongo import ASCENDING
+from services.document_db import get_database
+from utils.document_handling.document_extraction import ExtractedDocument, ExtractedPage
+
+try:
+    import zstandard
+except ImportError:  # zlib is always available
+    zstandard = None
+
+CompressionCodec = Literal['zstd', 'zlib']
+DEFAULT_CODEC: CompressionCodec = 'zstd' if zstandard else 'zlib'
+
+
+def compress(data: bytes, codec: CompressionCodec = DEFAULT_CODEC) -> bytes:
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=6).compress(data)
+    return zlib.compress(data, 6)
+
+
+def decompress(data: bytes, codec: CompressionCodec) -> bytes:
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd-compressed extracted text")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+class ExtractedTextModel(BaseModel):
+    """
+    Extracted content of one document page, stored compressed.
+
+    `text` holds the page text and `layout` the JSON of its line and word boxes,
+    both compressed with `codec`, so text-only reads can skip the layout.
+    """
+    document_id: str
+    page_number: int
+    pdf_name: str
+    codec: CompressionCodec
+    char_count: int
+    text: bytes
+    layout: bytes
+
+
+class ExtractedTextRepository:
+    def __init__(self, database):
+        self.collection = database['extracted_texts']
+
+    async def ensure_indexes(self):
+        await self.collection.create_index(
+            [("document_id", ASCENDING), ("page_number", ASCENDING)],
+            unique=True
+        )
+
+    async def save_extracted_document(self, document_id: str, extracted_document: ExtractedDocument) -> int:
+        """Replace the stored pages of a document with a fresh extraction; returns the number of pages stored."""
+        codec = DEFAULT_CODEC
+        records = []
+        for page in extracted_document.pages:
+            layout = json.dumps({"lines": page.lines, "words": page.words}, separators=(",", ":"))
+            record = ExtractedTextModel(
+                document_id=document_id,
+                page_number=page.page_number,
+                pdf_name=extracted_document.pdf_name,
+                codec=codec,
+                char_count=len(page.text),
+                text=compress(page.text.encode("utf-8"), codec),
+                layout=compress(layout.encode("utf-8"), codec)
+            ).model_dump()
+            record["text"] = Binary(record["text"])
+            record["layout"] = Binary(record["layout"])
+            records.append(record)
+
+        await self.collection.delete_many({"document_id": document_id})
+        if records:
+            await self.collection.insert_many(records, ordered=False)
+        return len(records)
+
+    def _query(self, document_id: str, page_numbers: Optional[List[int]]) -> Dict:
+        query = {"document_id": document_id}
+        if page_numbers is not None:
+            query["page_number"] = {"$in": list(page_numbers)}
+        return query
+
+    async def get_page_texts(self, document_id: str, page_numbers: Optional[List[int]] = None) -> Dict[int, str]:
+        """Text of the stored pages of a document, by page number, without loading the layout."""
+        cursor = self.collection.find(
+            self._query(document_id, page_numbers),
+            {"_id": 0, "page_number": 1, "codec": 1, "text": 1}
+        ).sort("page_number", ASCENDING)
+        records = await cursor.to_list(length=None)
+        return {
+            record["page_number"]: decompress(record["text"], record["codec"]).decode("utf-8")
+            for record in records
+        }
+
+    async def get_extracted_document(self, document_id: str, page_numbers: Optional[List[int]] = None) -> Optional[ExtractedDocument]:
+        """
+        The stored extraction of a document, or of some of its pages.
+
+        Returns:
+            Optional[ExtractedDocument]: None if nothing is stored for the document
+        """
+        cursor = self.collection.find(
+            self._query(document_id, page_numbers), {"_id": 0}
+        ).sort("page_number", ASCENDING)
+        records = await cursor.to_list(length=None)
+        if not records:
+            return None
+
+        pages = []
+        for record in records:
+            layout = json.loads(decompress(record["layout"], record["codec"]))
+            pages.append(ExtractedPage(
+                page_number=record["page_number"],
+                text=decompress(record["text"], record["codec"]).decode("utf-8"),
+                lines=[(line_text, tuple(bbox)) for line_text, bbox in layout["lines"]],
+                words=[tuple(word) for word in layout["words"]]
+            ))
+        return ExtractedDocument(pdf_name=records[0]["pdf_name"], pages=pages)
+
+    async def delete_texts_by_document_id(self, document_id: str):
+        result = await self.collection.delete_many({"document_id": document_id})
+        return result.deleted_count > 0
+
+
+db = get_database()
+extracted_text_repo = ExtractedTextRepository(db)
@@ -1,19 +1,25 @@
 
+from typing import Optional
 from pydantic import BaseModel
 from services.document_db import get_database
 from services.document_encoder import DocumentEncoder
 from services.document_db import get_database
+from models.pagination import DEFAULT_PAGE_SIZE, ensure_document_page_index, find_document_records_page
 
 
 class ImageModel(BaseModel):
     id: str
     document_id: str
+    page_number: Optional[int] = None  # Not recorded for images extracted before pagination
 
 
 class ImageRepository:
     def __init__(self, database):
         self.collection = database['images']
 
+    async def ensure_indexes(self):
+        await ensure_document_page_index(self.collection)
+
     async def add_new_image(self,image_data:ImageModel):
         image_data_dict = image_data.model_dump(by_alias=True)
         result = await self.collection.insert_one(image_data_dict)
@@ -26,6 +32,10 @@ class ImageRepository:
         images = await images_cursor.to_list(length=None)
         return [image["id"] for image in images]
 
+    async def get_images_page(self, document_id: str, page_start: Optional[int] = None, page_end: Optional[int] = None,
+                              cursor: Optional[str] = None, limit: Optional[int] = DEFAULT_PAGE_SIZE):
+        return await find_document_records_page(self.collection, document_id, page_start, page_end, cursor, limit)
+
 
 db=get_database()
 image_repo=ImageRepository(db)
\ No newline at end of file
@@ -0,0 +1,65 @@
+from typing import Dict, List, Optional, Tuple
+from bson import ObjectId
+from pymongo import ASCENDING
+
+DEFAULT_PAGE_SIZE = 50
+# Response header carrying the cursor of the next page of a paginated listing
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+async def ensure_document_page_index(collection) -> None:
+    """Create the index serving find_document_records_page: equality on document_id, sort on _id."""
+    await collection.create_index([("document_id", ASCENDING), ("_id", ASCENDING)])
+
+
+async def find_document_records_page(
+    collection,
+    document_id: str,
+    page_start: Optional[int] = None,
+    page_end: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = DEFAULT_PAGE_SIZE
+) -> Tuple[List[Dict], Optional[str]]:
+    """
+    One page of the records of a document, in insertion order, which is page order.
+
+    Args:
+        collection: The collection holding the records
+        document_id (str): The document's unique identifier
+        page_start (Optional[int]): Only records from this 1-based document page on
+        page_end (Optional[int]): Only records up to this document page, inclusive
+        cursor (Optional[str]): The next_cursor of the previous page
+        limit (Optional[int]): Maximum number of records, None for every record
+
+    Returns:
+        Tuple[List[Dict], Optional[str]]: The records, without _id, and the cursor
+            of the next page, None on the last page
+
+    Raises:
+        ValueError: If the cursor is not one returned by this function
+    """
+    query: Dict = {"document_id": document_id}
+    if page_start is not None or page_end is not None:
+        query["page_number"] = {}
+        if page_start is not None:
+            query["page_number"]["$gte"] = page_start
+        if page_end is not None:
+            query["page_number"]["$lte"] = page_end
+    if cursor:
+        if not ObjectId.is_valid(cursor):
+            raise ValueError(f"Invalid cursor {cursor}")
+        query["_id"] = {"$gt": ObjectId(cursor)}
+
+    if limit is None:
+        records = await collection.find(query).sort("_id", ASCENDING).to_list(length=None)
+        for record in records:
+            record.pop("_id", None)
+        return records, None
+
+    # One extra record tells whether there is a next page
+    records = await collection.find(query).sort("_id", ASCENDING).limit(limit + 1).to_list(length=limit + 1)
+    next_cursor = str(records[limit - 1]["_id"]) if len(records) > limit else None
+    records = records[:limit]
+    for record in records:
+        record.pop("_id", None)
+    return records, next_cursor
@@ -1,24 +1,68 @@
-from pydantic import BaseModel
+from typing import Dict, List
+from pydantic import BaseModel, Field
 from services.document_db import get_database
+from models.pagination import DEFAULT_PAGE_SIZE, ensure_document_page_index, find_document_records_page
+
+class PreviewRendition(BaseModel):
+    id: str  # Content-addressed S3 key of the render
+    dpi: int
+    format: str
+    width: int
+    height: int
+
+class PreviewTileLevel(BaseModel):
+    dpi: int
+    columns: int
+    rows: int
+
+class PreviewTiles(BaseModel):
+    tile_size: int
+    format: str
+    levels: List[PreviewTileLevel]
 
 class PreviewModel(BaseModel):
     id: str
     document_id: str
     page_number: int | None = None  # Optional, if you want to store page number
+    document_hash: str | None = None  # SHA-256 of the PDF, addresses the page renders
+    renditions: Dict[str, PreviewRendition] = Field(default_factory=dict)
+    tiles: PreviewTiles | None = None
 
 class PreviewRepository:
     def __init__(self, database):
         self.collection = database['previews']
 
+    async def ensure_indexes(self):
+        await ensure_document_page_index(self.collection)
+
     async def add_new_preview(self, preview_data: PreviewModel):
         preview_data_dict = preview_data.model_dump(by_alias=True)
         result = await self.collection.insert_one(preview_data_dict)
         return str(result.inserted_id)
 
+    async def add_new_previews(self, previews: list[PreviewModel]) -> int:
+        if not previews:
+            return 0
+        result = await self.collection.insert_many(
+            [preview.model_dump(by_alias=True) for preview in previews], ordered=False
+        )
+        return len(result.inserted_ids)
+
     async def get_previews_by_document_id(self, document_id: str):
         previews_cursor = self.collection.find({"document_id": document_id}, {"_id": 0})
         previews = await previews_cursor.to_list(length=None)
         return previews
 
+    async def get_previews_page(self, document_id: str, page_start: int | None = None, page_end: int | None = None,
+                                cursor: str | None = None, limit: int | None = DEFAULT_PAGE_SIZE):
+        return await find_document_records_page(self.collection, document_id, page_start, page_end, cursor, limit)
+
+    async def get_document_hash(self, document_id: str) -> str | None:
+        preview = await self.collection.find_one(
+            {"document_id": document_id, "document_hash": {"$ne": None}},
+            {"_id": 0, "document_hash": 1}
+        )
+        return preview["document_hash"] if preview else None
+
 db = get_database()
 preview_repo = PreviewRepository(db)
\ No newline at end of file
@@ -1,10 +1,12 @@
-from typing import List
+from typing import List, Optional
 from pydantic import BaseModel, Field
 from services.document_db import get_database
 
 class HighlightedImage(BaseModel):
     id: str
     page_number: int
+    rects: List[List[float]] = Field(default_factory=list)
+    crop: Optional[List[float]] = None
 
 class Summary(BaseModel):
     text: str
@@ -1,5 +1,7 @@
 from pydantic import BaseModel
+from typing import Optional
 from services.document_db import get_database
+from models.pagination import DEFAULT_PAGE_SIZE, ensure_document_page_index, find_document_records_page
 
 
 class TableModel(BaseModel):
@@ -13,11 +15,22 @@ class TableRepository:
     def __init__(self, database):
         self.collection = database['tables']
 
+    async def ensure_indexes(self):
+        await ensure_document_page_index(self.collection)
+
     async def add_new_table(self, table_data: TableModel):
         table_data_dict = table_data.model_dump(by_alias=True)
         result = await self.collection.insert_one(table_data_dict)
         return str(result.inserted_id)
 
+    async def add_new_tables(self, tables: list[TableModel]) -> int:
+        if not tables:
+            return 0
+        result = await self.collection.insert_many(
+            [table.model_dump(by_alias=True) for table in tables], ordered=False
+        )
+        return len(result.inserted_ids)
+
     async def get_tables_by_document_id(self, document_id: str):
         tables_cursor = self.collection.find(
             {"document_id": document_id}, 
@@ -26,10 +39,18 @@ class TableRepository:
         tables = await tables_cursor.to_list(length=None)
         return tables
     
+    async def get_tables_page(self, document_id: str, page_start: Optional[int] = None, page_end: Optional[int] = None,
+                              cursor: Optional[str] = None, limit: Optional[int] = DEFAULT_PAGE_SIZE):
+        return await find_document_records_page(self.collection, document_id, page_start, page_end, cursor, limit)
+
     async def get_table_count_by_document_id(self, document_id: str):
         count = await self.collection.count_documents({"document_id": document_id})
         return count
 
+    async def delete_tables_by_document_id(self, document_id: str):
+        result = await self.collection.delete_many({"document_id": document_id})
+        return result.deleted_count > 0
+
 
 # Initialize the repository
 db = get_database()
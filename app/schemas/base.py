@@ -1,6 +1,7 @@
 from datetime import datetime
 from typing import List, Literal, Optional , Dict
 from pydantic import BaseModel, Field
+from models.pagination import DEFAULT_PAGE_SIZE
 
 
 class StateModel(BaseModel):
@@ -37,6 +38,8 @@ class MyDocumentTables(BaseModel):
 class HighlightedImage(BaseModel):
     id: str
     page_number: int
+    rects: List[List[float]] = Field(default_factory=list)
+    crop: Optional[List[float]] = None
 
 class Summary(BaseModel):
     text: str
@@ -155,14 +158,52 @@ class ImageRequest(BaseModel):
     user_id: str
     document_name: str
 
-class ListTableIdsRequest(BaseModel):
+class DocumentPageRangeRequest(BaseModel):
+    """
+    Pagination of per-page document records: a page range and/or a cursor.
+
+    Requests without a cursor or limit list every record, as before pagination.
+    """
+    page_start: Optional[int] = Field(default=None, ge=1)
+    page_end: Optional[int] = Field(default=None, ge=1)
+    cursor: Optional[str] = None
+    limit: Optional[int] = Field(default=None, ge=1, le=200)
+
+    @property
+    def paginated(self) -> bool:
+        return self.cursor is not None or self.limit is not None
+
+    @property
+    def page_limit(self) -> Optional[int]:
+        """Records per response: the limit, DEFAULT_PAGE_SIZE when only a cursor is given, None for every record."""
+        if not self.paginated:
+            return None
+        return self.limit or DEFAULT_PAGE_SIZE
+
+class ListTableIdsRequest(DocumentPageRangeRequest):
     document_id: str
     user_id: str
 
-class GetDocumentPreviewRequest(BaseModel):
+class ListImageIdsRequest(DocumentPageRangeRequest):
     document_id: str
     user_id: str
 
+class GetDocumentPreviewRequest(DocumentPageRangeRequest):
+    document_id: str
+    user_id: str
+    rendition: Optional[str] = None
+
+class LocatePhraseRequest(BaseModel):
+    document_id: str
+    phrase: str
+    page_numbers: Optional[List[int]] = None
+    limit: int = Field(default=10, gt=0, le=100)
+
+class LinesInRectRequest(BaseModel):
+    document_id: str
+    page_number: int = Field(gt=0)
+    rect: List[float] = Field(min_length=4, max_length=4)
+
 class ContentFlowState(BaseModel):
     current_state: Dict[str, str]
     step_index: Optional[int] = None
@@ -172,9 +213,27 @@ class ContentGenerationRequest(BaseModel):
     objective: str
     audience: str
     tone: str
-    text: str
+    text: Optional[str] = None
+    userId: str
+    image_paths: Optional[List[str]] = []
+    document_ids: Optional[List[str]] = None
+    workspace_id: Optional[str] = None
+    context_token_budget: Optional[int] = Field(default=None, gt=0)
+
+class ContentVariant(BaseModel):
+    content_format: str
+    objective: str
+    audience: str
+    tone: str
+
+class ContentVariantsRequest(BaseModel):
+    variants: List[ContentVariant]
+    text: Optional[str] = None
     userId: str
     image_paths: Optional[List[str]] = []
+    document_ids: Optional[List[str]] = None
+    workspace_id: Optional[str] = None
+    context_token_budget: Optional[int] = Field(default=None, gt=0)
 
 class ContentGenerationResponse(BaseModel):
     generated_content: str
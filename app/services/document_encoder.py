@@ -105,6 +105,24 @@ class DocumentEncoder:
         user_id, document_name, _ = DocumentEncoder.decode_document_id(document_id)
         return f'DB/USERS/{user_id}/doc_preview_images/{document_name}/Page 1.png'
 
+    @staticmethod
+    def get_document_image_file_key(document_id: str, image_id: str) -> str:
+        """
+        Get S3 key for an image extracted from a document.
+        
+        Image ID format: {document_name}_pg{page_number}_img{image_number}.{ext}
+        
+        Args:
+            document_id: Encoded document identifier
+            image_id: Extracted image identifier
+            
+        Returns:
+            str: S3 key path for the image
+        """
+        user_id, document_name, _ = DocumentEncoder.decode_document_id(document_id)
+        image_name = "_".join(image_id.split("_")[-2:])
+        return f'DB/USERS/{user_id}/document_images/{document_name}/{image_name}'
+
     @staticmethod
     def get_original_document_file_key(encoded_string: str) -> str:
         """
@@ -204,7 +222,8 @@ class DocumentEncoder:
         """
         Get S3 key for a document outline source image.
         
-        Image ID format: {document_id}_PN{page_number}_DOSI
+        Image ID format: {document_id}_PN{page_number}_DOSI for a highlighted page,
+        {document_id}_PN{page_number}_CR{crop_number}_DOSI for a highlight crop
         
         Args:
             document_outline_source_image_id: Encoded outline source image identifier
@@ -212,12 +231,14 @@ class DocumentEncoder:
         Returns:
             Optional[str]: S3 key path for the outline source image, or None if invalid ID
         """
-        match = re.match(r"^(.*)_PN(\d+)_DOSI$", document_outline_source_image_id)
+        match = re.match(r"^(.*)_PN(\d+)(?:_CR(\d+))?_DOSI$", document_outline_source_image_id)
         
         if match:
             document_id = match.group(1)
             page_number = int(match.group(2))
             user_id, document_name, _ = DocumentEncoder.decode_document_id(document_id)
+            if match.group(3):
+                return f'DB/USERS/{user_id}/document_outline_sources/{document_name}/Page_{page_number}_Crop_{match.group(3)}.png'
             return f'DB/USERS/{user_id}/document_outline_sources/{document_name}/Page_{page_number}.png'
         
         return None
@@ -225,7 +246,7 @@ class DocumentEncoder:
     @staticmethod
     def get_highlight_helper_table_file_key(encoded_string: str) -> str:
         """
-        Get S3 key for highlight helper table CSV file.
+        Get S3 key for the packed highlight helper table file.
         
         Args:
             encoded_string: Encoded document identifier
@@ -234,4 +255,27 @@ class DocumentEncoder:
             str: S3 key path for the highlight helper table
         """
         user_id, document_name, _ = DocumentEncoder.decode_document_id(encoded_string)
-        return f'DB/USERS/{user_id}/highlight_helper_tables/{document_name}.csv'
\ No newline at end of file
+        return f'DB/USERS/{user_id}/highlight_helper_tables/{document_name}.bin'
+
+    @staticmethod
+    def get_page_render_file_key(document_hash: str, page_number: int, dpi: int, image_format: str, tile: Optional[Tuple[int, int, int]] = None) -> str:
+        """
+        Get the content-addressed S3 key of a rendered page image or page tile.
+        
+        Renders are keyed by the hash of the PDF content rather than by user and
+        document name, so identical uploads share their renders.
+        
+        Args:
+            document_hash: SHA-256 hex digest of the PDF content
+            page_number: Page number (1-indexed)
+            dpi: Render resolution
+            image_format: Image format extension (png, jpeg, webp)
+            tile: (tile_size, column, row) for a tile of the page, None for the whole page
+            
+        Returns:
+            str: S3 key path for the rendered page or tile
+        """
+        if tile:
+            tile_size, column, row = tile
+            return f'DB/RENDERS/{document_hash}/page_{page_number}_{dpi}dpi_tiles{tile_size}/{column}_{row}.{image_format}'
+        return f'DB/RENDERS/{document_hash}/page_{page_number}_{dpi}dpi.{image_format}'
@@ -0,0 +1,93 @@
+"""
+Presigned URL Cache
+
+In-process cache of presigned S3 URLs keyed by (key, operation). A URL is reused
+until less than the configured refresh fraction of its lifetime is left, so a
+client receives the same URL for an object across requests (and its browser
+cache keeps hitting) while every returned URL still has a useful lifetime.
+"""
+
+from collections import OrderedDict
+from time import time
+from typing import Dict, Optional, Tuple
+
+from configs.config import aws_settings
+
+
+class PresignedUrlCache:
+    """
+    LRU cache of presigned URLs with expiry-aware reuse.
+
+    Attributes:
+        max_entries: Maximum number of cached URLs
+        refresh_fraction: Fraction of the lifetime below which a URL is reissued
+        hits: Lookups answered from the cache
+        misses: Lookups with no cached URL
+        refreshes: Lookups whose cached URL was too close to its expiry
+        evictions: URLs evicted to stay within max_entries
+    """
+
+    def __init__(self, max_entries: int, refresh_fraction: float):
+        self.max_entries = max_entries
+        self.refresh_fraction = refresh_fraction
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.evictions = 0
+        # (key, operation) -> (expires_at, url)
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, str]]" = OrderedDict()
+
+    def get(self, key: str, operation: str, expire_in_n_seconds: int) -> Optional[str]:
+        """
+        The cached URL of `key` for `operation`, or None if there is none or it is due for refresh.
+
+        A URL is only reused while more than refresh_fraction of the requested
+        lifetime is left on it.
+        """
+        entry = self._entries.get((key, operation))
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, url = entry
+        if expires_at - time() < expire_in_n_seconds * self.refresh_fraction:
+            del self._entries[(key, operation)]
+            self.refreshes += 1
+            return None
+        self._entries.move_to_end((key, operation))
+        self.hits += 1
+        return url
+
+    def set(self, key: str, operation: str, url: str, expire_in_n_seconds: int, issued_at: Optional[float] = None) -> None:
+        """Store a URL signed at `issued_at` (now by default), valid for expire_in_n_seconds."""
+        self._entries[(key, operation)] = ((issued_at or time()) + expire_in_n_seconds, url)
+        self._entries.move_to_end((key, operation))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key_prefix: str) -> None:
+        """Drop the URLs of a key, or of every key under a folder when key_prefix ends with '/'."""
+        if not key_prefix.endswith("/"):
+            for cache_key in [cache_key for cache_key in self._entries if cache_key[0] == key_prefix]:
+                del self._entries[cache_key]
+            return
+        for cache_key in [cache_key for cache_key in self._entries if cache_key[0].startswith(key_prefix)]:
+            del self._entries[cache_key]
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses + self.refreshes
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "hit_rate": self.hits / lookups if lookups else None,
+            "evictions": self.evictions,
+        }
+
+
+presigned_url_cache = PresignedUrlCache(
+    max_entries=aws_settings.presigned_url_cache_size,
+    refresh_fraction=aws_settings.presigned_url_refresh_fraction,
+)
@@ -8,10 +8,13 @@ from utils.document_handling.logger import log
 from services.document_encoder import DocumentEncoder
 import pandas as pd
 import io
+from typing import List, Optional
+from time import time
 from configs.config import aws_settings
+from services.presigned_url_cache import PresignedUrlCache, presigned_url_cache
 
 class AsyncS3Host:
-    def __init__(self):
+    def __init__(self, presigned_urls: PresignedUrlCache = presigned_url_cache):
         my_config_global = Config(
             region_name="us-east-1",
             signature_version="s3v4",
@@ -26,6 +29,8 @@ class AsyncS3Host:
         self.config = my_config_global
         # Use environment variable for bucket name with a fallback
         self.bucket_name = os.getenv("BUCKET_NAME", "pharma-ai-suite")
+        # Shared by every endpoint returning view URLs; upload URLs are single-use and not cached
+        self.presigned_urls = presigned_urls
 
     async def _upload_to_s3(self, key, data, content_type=None):
         try:
@@ -57,17 +62,43 @@ class AsyncS3Host:
             raise e
 
     async def get_presigned_view_url(self, key: str, expire_in_n_seconds: int = 18000):
+        return (await self.get_presigned_view_urls([key], expire_in_n_seconds))[0]
+
+    async def get_presigned_view_urls(self, keys: List[str], expire_in_n_seconds: int = 18000) -> List[str]:
+        """
+        Presigned view URLs of several keys.
+
+        URLs are reused from the presigned URL cache while enough of their
+        lifetime is left; the others are signed locally with a single client.
+
+        Args:
+            keys (List[str]): The S3 keys to sign
+            expire_in_n_seconds (int): Validity of the URLs
+
+        Returns:
+            List[str]: The URLs, in the order of keys
+        """
+        urls = {}
+        for key in keys:
+            if key not in urls:
+                urls[key] = self.presigned_urls.get(key, "get_object", expire_in_n_seconds)
+        missing = [key for key, url in urls.items() if url is None]
+        if not missing:
+            return [urls[key] for key in keys]
+
         try:
+            issued_at = time()
             async with self.session.client("s3", config=self.config) as s3_client:
-                presigned_url = await s3_client.generate_presigned_url(
-                    "get_object", 
-                    Params={"Bucket": self.bucket_name, "Key": key}, 
-                    ExpiresIn=expire_in_n_seconds
-                )
-            print("key obtained: ", key)
-            return presigned_url
+                for key in missing:
+                    urls[key] = await s3_client.generate_presigned_url(
+                        "get_object",
+                        Params={"Bucket": self.bucket_name, "Key": key},
+                        ExpiresIn=expire_in_n_seconds
+                    )
+                    self.presigned_urls.set(key, "get_object", urls[key], expire_in_n_seconds, issued_at)
+            return [urls[key] for key in keys]
         except ClientError as e:
-            log(f"Error generating presigned view URL: {e}")
+            log(f"Error generating presigned view URLs: {e}")
             raise e
 
     async def check_document_exists(self, document_id: str) -> bool:
@@ -173,6 +204,7 @@ class AsyncS3Host:
         Args:
             key (str): The S3 key of the file or folder to delete.
         """
+        self.presigned_urls.invalidate(key)
         try:
             async with self.session.client("s3", config=self.config) as s3_client:
                 if key.endswith("/"):  # If it's a folder
@@ -212,6 +244,46 @@ class AsyncS3Host:
             log(f"Unexpected error deleting from S3: {e}")
             raise e
         
+    async def get_object_range(self, key: str, start: int, end: int) -> bytes:
+        """
+        Downloads a byte range of an object from S3.
+
+        Args:
+            key (str): The S3 key of the object.
+            start (int): First byte to read.
+            end (int): Last byte to read, inclusive.
+
+        Returns:
+            bytes: The requested bytes, fewer if the object ends before `end`.
+        """
+        try:
+            async with self.session.client("s3", config=self.config) as s3_client:
+                response = await s3_client.get_object(Bucket=self.bucket_name, Key=key, Range=f"bytes={start}-{end}")
+                return await response["Body"].read()
+        except ClientError as e:
+            log(f"Error reading byte range {start}-{end} of {key} from S3: {e}")
+            raise e
+
+    async def get_object_if_exists(self, key: str) -> Optional[bytes]:
+        """
+        Downloads an object from S3.
+
+        Args:
+            key (str): The S3 key of the object.
+
+        Returns:
+            Optional[bytes]: The object content, or None if there is no object with this key.
+        """
+        try:
+            async with self.session.client("s3", config=self.config) as s3_client:
+                response = await s3_client.get_object(Bucket=self.bucket_name, Key=key)
+                return await response["Body"].read()
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                return None
+            log(f"Error reading {key} from S3: {e}")
+            raise e
+
     async def load_csv_as_dataframe(self, key: str) -> pd.DataFrame:
         """
         Downloads a CSV file from S3 and loads it into a pandas DataFrame.
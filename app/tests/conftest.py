@@ -0,0 +1,22 @@
+"""
+Shared test setup.
+
+Tests import the app modules the way main.py does, from the app directory, with
+placeholder values for the settings that have no default.
+"""
+
+import os
+import sys
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+for name, value in {
+    "QDRANT_HOST_URL": "http://localhost:6333",
+    "DOCUMENT_DB_CONNECTION_STRING": "mongodb://localhost:27017",
+    "ACCESS_KEY": "test",
+    "SECRET_KEY": "test",
+    "OLLAMA_ENDPOINT_URL": "http://localhost:11434",
+    "OPENAI_API_KEY": "test",
+}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,409 @@
+"""
+Tests of the use_brain pipeline (response cache, single-flight, failover,
+hedging, stream fan-out and call telemetry) against fake providers.
+"""
+
+import asyncio
+
+import pytest
+
+from lib import brain, ttl_cache
+from fastapi import HTTPException
+from lib.brain import LLMResponseCache, LLMProviderError, LLMRoutingPolicy, ProviderCall
+from lib.llm_metrics import LLMMetricsRegistry
+
+MESSAGES = [{"role": "user", "content": "Summarize the discharge letter."}]
+
+
+class FakeProvider:
+    """Provider answering `answer` (as `chunks` when streamed) after `delay` seconds, or raising `error`."""
+
+    def __init__(self, answer: str = "answer", error: Exception = None, delay: float = 0, chunks=None):
+        self.answer = answer
+        self.error = error
+        self.delay = delay
+        self.chunks = chunks
+        self.models = []
+        self.calls = 0
+        self.streams = 0
+        self.closed_streams = 0
+
+    async def call(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return self.answer, (10, 5)
+
+    async def open_stream(self):
+        self.streams += 1
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+
+        async def chunks():
+            try:
+                for chunk in self.chunks or [self.answer[:3], self.answer[3:]]:
+                    await asyncio.sleep(self.delay)
+                    yield chunk
+            finally:
+                self.closed_streams += 1
+
+        return chunks()
+
+
+@pytest.fixture
+def providers(monkeypatch):
+    """Fake groq, openai and ollama providers behind fresh scheduler, cache, coalescer and router state."""
+    fakes = {"groq": FakeProvider(), "openai": FakeProvider(), "ollama": FakeProvider()}
+
+    def prepare(provider, model, *args):
+        fake = fakes[provider]
+        fake.models.append(model)
+        return ProviderCall(
+            model=model or f"{provider}-default",
+            call=lambda: fake.call(),
+            open_stream=lambda: fake.open_stream(),
+        )
+
+    monkeypatch.setattr(brain, "_prepare_provider_call", prepare)
+    monkeypatch.setattr(brain, "_is_configured", lambda provider: True)
+    monkeypatch.setattr(brain, "llm_scheduler", brain.LLMScheduler())
+    monkeypatch.setattr(brain, "llm_response_cache", LLMResponseCache(ttl=60, max_entries=16))
+    monkeypatch.setattr(brain, "llm_request_coalescer", brain.LLMRequestCoalescer())
+    monkeypatch.setattr(brain, "llm_router", brain.LLMRouter())
+    monkeypatch.setattr(brain, "llm_metrics", LLMMetricsRegistry())
+    monkeypatch.setattr(brain.llm_client_settings, "LLM_MAX_RETRIES", 0)
+    monkeypatch.setattr(brain.llm_client_settings, "LLM_RESPONSE_CACHE_ENABLED", True)
+    return fakes
+
+
+async def collect(chunks):
+    return [chunk async for chunk in chunks]
+
+
+def unavailable():
+    return LLMProviderError("Service unavailable", status_code=503)
+
+
+# Response cache
+
+def test_response_cache_expires_entries_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ttl_cache, "monotonic", lambda: now[0])
+    cache = LLMResponseCache(ttl=60, max_entries=4)
+
+    cache.set("key", "answer")
+    now[0] += 59
+    assert cache.get("key") == "answer"
+    now[0] += 2
+    assert cache.get("key") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert len(cache) == 0
+
+
+def test_response_cache_evicts_least_recently_used():
+    cache = LLMResponseCache(ttl=60, max_entries=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.get("a")
+    cache.set("c", "3")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+
+
+def test_identical_call_is_answered_from_cache(providers):
+    async def run():
+        first = await brain.use_brain(MESSAGES, stream=False)
+        second = await brain.use_brain(MESSAGES, stream=False)
+        return first, second
+
+    assert asyncio.run(run()) == ("answer", "answer")
+    assert providers["groq"].calls == 1
+    assert brain.llm_response_cache.hits == 1
+
+
+def test_use_cache_false_bypasses_cache(providers):
+    async def run():
+        await brain.use_brain(MESSAGES, stream=False, use_cache=False)
+        await brain.use_brain(MESSAGES, stream=False, use_cache=False)
+
+    asyncio.run(run())
+    assert providers["groq"].calls == 2
+    assert len(brain.llm_response_cache) == 0
+
+
+def test_only_deterministic_calls_are_cached_by_default(providers):
+    async def run():
+        for temperature in (0.7, 0.7, 0, 0):
+            await brain.use_brain(MESSAGES, stream=False, temperature=temperature)
+
+    asyncio.run(run())
+    assert providers["groq"].calls == 3
+    assert brain.llm_response_cache.hits == 1
+
+
+def test_sampled_calls_are_cached_when_opted_in(providers):
+    async def run():
+        for _ in range(2):
+            await brain.use_brain(MESSAGES, stream=False, temperature=0.7, use_cache=True)
+
+    asyncio.run(run())
+    assert providers["groq"].calls == 1
+
+
+def test_concurrent_sampled_calls_are_not_coalesced_by_default(providers):
+    providers["groq"].delay = 0.01
+
+    async def run():
+        await asyncio.gather(*[brain.use_brain(MESSAGES, stream=False, temperature=0.7) for _ in range(2)])
+
+    asyncio.run(run())
+    assert providers["groq"].calls == 2
+
+
+def test_cached_answer_is_replayed_to_streaming_callers(providers):
+    async def run():
+        await brain.use_brain(MESSAGES, stream=False)
+        return "".join(await collect(await brain.use_brain(MESSAGES, stream=True)))
+
+    assert asyncio.run(run()) == "answer"
+    assert providers["groq"].streams == 0
+
+
+def test_streamed_answer_is_not_cached(providers):
+    async def run():
+        await collect(await brain.use_brain(MESSAGES, stream=True))
+        await brain.use_brain(MESSAGES, stream=False)
+
+    asyncio.run(run())
+    assert providers["groq"].streams == 1
+    assert providers["groq"].calls == 1
+
+
+def test_fallback_answer_is_not_cached_under_requested_provider(providers):
+    providers["groq"].error = unavailable()
+    providers["openai"].answer = "fallback answer"
+
+    async def run():
+        answer = await brain.use_brain(MESSAGES, stream=False, call_site="chat")
+        providers["groq"].error = None
+        return answer, await brain.use_brain(MESSAGES, stream=False, call_site="chat")
+
+    assert asyncio.run(run()) == ("fallback answer", "answer")
+    assert providers["groq"].calls == 2
+
+
+# Single-flight
+
+def test_concurrent_identical_calls_share_one_upstream_call(providers):
+    providers["groq"].delay = 0.05
+
+    async def run():
+        return await asyncio.gather(*[brain.use_brain(MESSAGES, stream=False) for _ in range(3)])
+
+    assert asyncio.run(run()) == ["answer"] * 3
+    assert providers["groq"].calls == 1
+    assert brain.llm_request_coalescer.coalesced == 2
+
+
+def test_stream_is_not_opened_until_iterated(providers):
+    async def run():
+        await brain.use_brain(MESSAGES, stream=True)
+        await asyncio.sleep(0.01)
+
+    asyncio.run(run())
+    assert providers["groq"].streams == 0
+
+
+def test_concurrent_identical_streams_share_one_upstream_stream(providers):
+    providers["groq"].delay = 0.01
+
+    async def run():
+        streams = [await brain.use_brain(MESSAGES, stream=True) for _ in range(3)]
+        return await asyncio.gather(*[collect(chunks) for chunks in streams])
+
+    assert asyncio.run(run()) == [["ans", "wer"]] * 3
+    assert providers["groq"].streams == 1
+
+
+def test_stream_continues_for_remaining_subscribers_when_one_leaves(providers):
+    providers["groq"].delay = 0.01
+
+    async def leave_after_first_chunk(chunks):
+        first = await chunks.__anext__()
+        await chunks.aclose()
+        return first
+
+    async def run():
+        leaving = await brain.use_brain(MESSAGES, stream=True)
+        staying = await brain.use_brain(MESSAGES, stream=True)
+        return await asyncio.gather(leave_after_first_chunk(leaving), collect(staying))
+
+    assert asyncio.run(run()) == ["ans", ["ans", "wer"]]
+    assert providers["groq"].streams == 1
+
+
+def test_abandoned_stream_is_cancelled_and_not_joined_again(providers):
+    providers["groq"].delay = 0.01
+
+    async def run():
+        chunks = await brain.use_brain(MESSAGES, stream=True)
+        await chunks.__anext__()
+        await chunks.aclose()
+        await asyncio.sleep(0.05)
+        closed = providers["groq"].closed_streams
+        return closed, await collect(await brain.use_brain(MESSAGES, stream=True))
+
+    closed, chunks = asyncio.run(run())
+    assert closed == 1
+    assert chunks == ["ans", "wer"]
+    assert providers["groq"].streams == 2
+
+
+# Failover and hedging
+
+def test_default_call_site_does_not_fail_over(providers):
+    providers["groq"].error = unavailable()
+
+    with pytest.raises(HTTPException):
+        asyncio.run(brain.use_brain(MESSAGES, stream=False))
+    assert providers["openai"].calls == 0
+
+
+def test_rejected_request_does_not_fail_over(providers):
+    providers["groq"].error = LLMProviderError("Context length exceeded", status_code=400)
+
+    with pytest.raises(HTTPException):
+        asyncio.run(brain.use_brain(MESSAGES, stream=False, call_site="chat"))
+    assert providers["openai"].calls == 0
+    assert brain.llm_router.health("groq").consecutive_failures == 0
+
+
+def test_failover_opens_circuit_breaker_of_failing_provider(providers, monkeypatch):
+    monkeypatch.setattr(brain.llm_client_settings, "LLM_CIRCUIT_FAILURE_THRESHOLD", 2)
+    providers["groq"].error = unavailable()
+    providers["openai"].answer = "fallback answer"
+
+    async def run():
+        return [await brain.use_brain(MESSAGES, stream=False, use_cache=False, call_site="chat") for _ in range(3)]
+
+    assert asyncio.run(run()) == ["fallback answer"] * 3
+    # The third call skips Groq, its breaker opened after two failures
+    assert providers["groq"].calls == 2
+    assert providers["openai"].calls == 3
+    assert brain.llm_router.health("groq").state == "open"
+
+
+def test_fallback_uses_model_of_routing_policy(providers, monkeypatch):
+    monkeypatch.setitem(
+        brain.LLM_ROUTING_POLICIES, "chat",
+        LLMRoutingPolicy(fallbacks=["openai"], fallback_models={"openai": "gpt-4o-mini"})
+    )
+    providers["groq"].error = unavailable()
+
+    asyncio.run(brain.use_brain(MESSAGES, stream=False, call_site="chat"))
+    assert providers["openai"].models == ["gpt-4o-mini"]
+
+
+def test_slow_call_is_hedged_and_loser_discarded(providers, monkeypatch):
+    monkeypatch.setattr(brain.llm_client_settings, "LLM_HEDGE_DEFAULT_DELAY", 0.02)
+    monkeypatch.setattr(brain.llm_client_settings, "LLM_HEDGE_MIN_DELAY", 0.01)
+    providers["groq"].delay = 0.5
+    providers["openai"].answer = "hedged answer"
+
+    assert asyncio.run(brain.use_brain(MESSAGES, stream=False, call_site="chat")) == "hedged answer"
+    assert providers["groq"].calls == 1
+    assert providers["openai"].calls == 1
+    # The cancelled loser does not count against its provider
+    assert brain.llm_router.health("groq").consecutive_failures == 0
+    assert len(brain.llm_response_cache) == 0
+
+
+def test_slow_background_call_is_not_hedged(providers, monkeypatch):
+    monkeypatch.setattr(brain.llm_client_settings, "LLM_HEDGE_DEFAULT_DELAY", 0.02)
+    monkeypatch.setattr(brain.llm_client_settings, "LLM_HEDGE_MIN_DELAY", 0.01)
+    providers["groq"].delay = 0.1
+
+    assert asyncio.run(brain.use_brain(MESSAGES, stream=False, priority="background", call_site="outline")) == "answer"
+    assert (providers["groq"].calls, providers["openai"].calls) == (1, 0)
+    assert not brain.llm_metrics.records[0].hedged
+
+
+def test_slow_stream_is_hedged_and_loser_closed(providers, monkeypatch):
+    monkeypatch.setattr(brain.llm_client_settings, "LLM_HEDGE_DEFAULT_DELAY", 0.02)
+    monkeypatch.setattr(brain.llm_client_settings, "LLM_HEDGE_MIN_DELAY", 0.01)
+    providers["groq"].delay = 0.1
+    providers["openai"].answer = "hedged answer"
+
+    async def run():
+        chunks = await collect(await brain.use_brain(MESSAGES, stream=True, call_site="chat"))
+        await asyncio.sleep(0.3)
+        return chunks
+
+    assert "".join(asyncio.run(run())) == "hedged answer"
+    assert (providers["groq"].streams, providers["openai"].streams) == (1, 1)
+    assert brain.llm_router.health("groq").consecutive_failures == 0
+
+
+# Telemetry
+
+def test_calls_are_recorded_with_usage_and_cache_flag(providers):
+    async def run():
+        await brain.use_brain(MESSAGES, stream=False, call_site="findings")
+        await brain.use_brain(MESSAGES, stream=False, call_site="findings")
+
+    asyncio.run(run())
+    first, second = brain.llm_metrics.records
+    assert (first.call_site, first.provider, first.model) == ("findings", "groq", "gpt-4o")
+    assert (first.prompt_tokens, first.completion_tokens, first.usage_estimated) == (10, 5, False)
+    assert not first.cached and second.cached
+    assert first.latency is not None
+
+
+def test_coalesced_calls_record_the_shared_answer(providers, monkeypatch):
+    providers["groq"].error = unavailable()
+    providers["openai"].delay = 0.01
+    monkeypatch.setitem(brain.LLM_ROUTING_POLICIES, "chat", LLMRoutingPolicy(fallbacks=["openai"]))
+
+    async def run():
+        await asyncio.gather(*[brain.use_brain(MESSAGES, stream=False, call_site="chat") for _ in range(2)])
+
+    asyncio.run(run())
+    assert providers["openai"].calls == 1
+    records = brain.llm_metrics.records
+    for record in records:
+        assert (record.provider, record.model) == ("openai", "openai-default")
+        assert (record.prompt_tokens, record.completion_tokens, record.usage_estimated) == (10, 5, False)
+    assert sorted(record.coalesced for record in records) == [False, True]
+
+
+def test_failed_over_call_is_recorded_under_answering_provider(providers):
+    providers["groq"].error = unavailable()
+
+    asyncio.run(brain.use_brain(MESSAGES, stream=False, call_site="chat"))
+    record, = brain.llm_metrics.records
+    assert (record.provider, record.model, record.failovers) == ("openai", "openai-default", 1)
+
+
+def test_streamed_call_records_time_to_first_token(providers):
+    async def run():
+        await collect(await brain.use_brain(MESSAGES, stream=True))
+
+    asyncio.run(run())
+    record, = brain.llm_metrics.records
+    assert record.stream and record.usage_estimated
+    assert record.time_to_first_token is not None
+    assert record.latency >= record.time_to_first_token
+    assert record.error is None
+
+
+def test_failed_call_is_recorded_with_error(providers):
+    providers["groq"].error = LLMProviderError("Bad request", status_code=400)
+
+    with pytest.raises(HTTPException):
+        asyncio.run(brain.use_brain(MESSAGES, stream=False))
+    record, = brain.llm_metrics.records
+    assert record.error == "Groq error: Bad request"
@@ -0,0 +1,111 @@
+"""
+Tests of generating several content variants from one request.
+"""
+
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+pytest.importorskip("requests")
+pytest.importorskip("qdrant_client")
+
+from utils.document_handling import content_generation  # noqa: E402
+from utils.document_handling.content_generation import MAX_CONTENT_VARIANTS, content_generator  # noqa: E402
+
+REPORT = {
+    "content_format": "Clinical Trial Report",
+    "objective": "Promotional - Commercial",
+    "audience": "Regulatory Authorities (e.g., FDA, EMA)",
+}
+SUMMARY = {
+    "content_format": "Clinical Summaries",
+    "objective": "Non promotional - Scientific",
+    "audience": "HTA Bodies (Health Technology Assessment)",
+}
+VARIANTS = [
+    {**REPORT, "tone": "Formal and Objective"},
+    {**REPORT, "tone": "Concise and Analytical"},
+    {**SUMMARY, "tone": "Precise and Data-Driven"},
+]
+
+
+@pytest.fixture
+def retrievals(monkeypatch):
+    retrievals = []
+
+    async def retrieve_context(query, document_ids=None, workspace_id=None, token_budget=None):
+        retrievals.append(query)
+        return "Median progression-free survival was 11.2 months."
+
+    monkeypatch.setattr(content_generation, "retrieve_context", retrieve_context)
+    return retrievals
+
+
+def generate(variants, **kwargs):
+    async def run():
+        results = await content_generator.generate_variants(variants, **kwargs)
+        return [result async for result in results]
+
+    return asyncio.run(run())
+
+
+def test_more_variants_than_the_limit_are_rejected(monkeypatch, retrievals):
+    async def use_brain(**kwargs):
+        raise AssertionError("no variant should be generated")
+
+    monkeypatch.setattr(content_generation, "use_brain", use_brain)
+    variants = [VARIANTS[0]] * (MAX_CONTENT_VARIANTS + 1)
+
+    with pytest.raises(HTTPException) as error:
+        generate(variants, document_ids=["document"])
+
+    assert error.value.status_code == 400
+    assert retrievals == []
+
+
+def test_variants_share_a_single_retrieval(monkeypatch, retrievals):
+    prompts = []
+
+    async def use_brain(messages, **kwargs):
+        prompts.append(messages[1]["content"][0]["text"])
+        return "content"
+
+    monkeypatch.setattr(content_generation, "use_brain", use_brain)
+
+    results = generate(VARIANTS, document_ids=["document"])
+
+    assert len(results) == len(VARIANTS)
+    # Repeated targets appear once in the query
+    assert retrievals == [
+        "Clinical Trial Report: Promotional - Commercial for Regulatory Authorities (e.g., FDA, EMA); "
+        "Clinical Summaries: Non promotional - Scientific for HTA Bodies (Health Technology Assessment)"
+    ]
+    assert all("11.2 months" in prompt for prompt in prompts)
+
+
+def test_failing_variant_reports_an_error_while_the_others_complete(monkeypatch, retrievals):
+    calls = []
+
+    async def use_brain(messages, **kwargs):
+        calls.append(messages)
+        call_number = len(calls)
+        if call_number == 2:
+            raise HTTPException(status_code=503, detail="All providers are unavailable")
+        await asyncio.sleep(0)
+        return f"content {call_number}"
+
+    monkeypatch.setattr(content_generation, "use_brain", use_brain)
+
+    results = sorted(generate(VARIANTS, text="Source text"), key=lambda result: result["index"])
+
+    assert [result["variant"] for result in results] == VARIANTS
+    assert results[1] == {
+        "index": 1,
+        "variant": VARIANTS[1],
+        "error": "Content generation failed: All providers are unavailable",
+    }
+    assert "error" not in results[0] and "error" not in results[2]
+    assert {results[0]["generated_content"], results[2]["generated_content"]} == {"content 1", "content 3"}
+    # Text sent by the client is used as is
+    assert retrievals == []
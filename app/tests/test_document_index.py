@@ -0,0 +1,182 @@
+"""
+Tests of the per-document line index, its cache and the citation endpoints.
+"""
+
+import asyncio
+import random
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from api.v1.endpoints import document_citations
+from utils.document_handling.document_index import DocumentIndex, DocumentIndexCache
+
+
+def row(page_number, line_number, content, bbox):
+    return {"Page Number": page_number, "Line Number": line_number, "Content": content, "Coordinates": bbox}
+
+
+ROWS = [
+    row(1, 1, "Results of the phase III trial", (72, 100, 400, 112)),
+    row(1, 2, "The primary endpoint was met with a", (72, 114, 420, 126)),
+    row(1, 3, "signiﬁcant reduction in relapse rate.", (72, 128, 380, 140)),
+    row(1, 4, "Side column", (450, 100, 540, 112)),
+    row(2, 1, "Patients continued the treat-", (72, 100, 300, 112)),
+    row(2, 2, "ment plan for 24 weeks.", (72, 114, 260, 126)),
+    row(3, 1, "A significant reduction was also observed.", (72, 300, 420, 312)),
+]
+
+
+@pytest.fixture
+def index():
+    return DocumentIndex("document", ROWS)
+
+
+def line_texts(lines):
+    return [line["text"] for line in lines]
+
+
+# Rectangle queries
+
+def test_lines_in_rect_returns_overlapping_lines_top_to_bottom(index):
+    assert line_texts(index.lines_in_rect(1, (60, 110, 430, 130))) == [
+        "Results of the phase III trial",
+        "The primary endpoint was met with a",
+        "signiﬁcant reduction in relapse rate.",
+    ]
+
+
+def test_lines_in_rect_skips_lines_outside_horizontally(index):
+    assert line_texts(index.lines_in_rect(1, (440, 90, 560, 150))) == ["Side column"]
+
+
+def test_lines_in_rect_finds_tall_line_starting_above_rect():
+    tall = DocumentIndex("document", [
+        row(1, 1, "Figure caption spanning a tall box", (72, 100, 300, 400)),
+        row(1, 2, "Body text", (72, 410, 300, 420)),
+    ])
+    assert line_texts(tall.lines_in_rect(1, (72, 350, 300, 360))) == ["Figure caption spanning a tall box"]
+
+
+def test_lines_in_rect_of_unknown_page_is_empty(index):
+    assert index.lines_in_rect(9, (0, 0, 600, 800)) == []
+
+
+def test_lines_in_rect_matches_brute_force():
+    generator = random.Random(7)
+    rows = []
+    for line_number in range(1, 301):
+        x0, y0 = generator.uniform(0, 500), generator.uniform(0, 780)
+        rows.append(row(1, line_number, f"line {line_number}", (x0, y0, x0 + generator.uniform(5, 100), y0 + generator.uniform(2, 40))))
+    random_index = DocumentIndex("document", rows)
+
+    for _ in range(200):
+        x0, y0 = generator.uniform(0, 600), generator.uniform(0, 800)
+        rect = (x0, y0, x0 + generator.uniform(0, 200), y0 + generator.uniform(0, 200))
+        expected = {
+            line["text"] for line in random_index.lines
+            if line["bbox"][0] <= rect[2] and line["bbox"][2] >= rect[0]
+            and line["bbox"][1] <= rect[3] and line["bbox"][3] >= rect[1]
+        }
+        assert set(line_texts(random_index.lines_in_rect(1, rect))) == expected
+
+
+# Phrase search
+
+def test_find_phrase_ignores_case_and_punctuation(index):
+    matches = index.find_phrase("results of the Phase-III trial")
+    assert [(match["page_number"], line_texts(match["lines"])) for match in matches] == [
+        (1, ["Results of the phase III trial"])
+    ]
+
+
+def test_find_phrase_across_lines_and_ligatures(index):
+    matches = index.find_phrase("met with a significant reduction")
+    assert [(match["page_number"], line_texts(match["lines"])) for match in matches] == [
+        (1, ["The primary endpoint was met with a", "signiﬁcant reduction in relapse rate."])
+    ]
+
+
+def test_find_phrase_across_hyphenated_line_break(index):
+    matches = index.find_phrase("continued the treatment plan")
+    assert [(match["page_number"], line_texts(match["lines"])) for match in matches] == [
+        (2, ["Patients continued the treat-", "ment plan for 24 weeks."])
+    ]
+
+
+def test_find_phrase_reports_a_match_on_its_own_line_only_once(index):
+    matches = index.find_phrase("significant reduction")
+    assert [(match["page_number"], line_texts(match["lines"])) for match in matches] == [
+        (1, ["signiﬁcant reduction in relapse rate."]),
+        (3, ["A significant reduction was also observed."]),
+    ]
+
+
+def test_find_phrase_filters_pages_and_limits_matches(index):
+    assert [match["page_number"] for match in index.find_phrase("significant reduction", page_numbers=[3])] == [3]
+    assert len(index.find_phrase("significant reduction", limit=1)) == 1
+
+
+def test_find_phrase_without_match_is_empty(index):
+    assert index.find_phrase("placebo arm") == []
+    assert index.find_phrase("...") == []
+
+
+# Index cache
+
+def test_cache_builds_each_document_once(monkeypatch):
+    loads = []
+
+    async def loader(document_id):
+        loads.append(document_id)
+        await asyncio.sleep(0.01)
+        return ROWS
+
+    cache = DocumentIndexCache(max_documents=1, loader=loader)
+
+    async def run():
+        first = await asyncio.gather(*[cache.get("a") for _ in range(3)])
+        await cache.get("a")
+        await cache.get("b")
+        await cache.get("a")
+        return first
+
+    first = asyncio.run(run())
+    assert first[0] is first[1] is first[2]
+    assert loads == ["a", "b", "a"]
+    assert cache.stats()["evictions"] == 2
+
+
+# Citation endpoints
+
+@pytest.fixture
+def client(monkeypatch):
+    async def loader(document_id):
+        if document_id == "missing":
+            raise FileNotFoundError("No highlight helper table")
+        if document_id == "broken":
+            raise RuntimeError("Database unavailable")
+        return ROWS
+
+    monkeypatch.setattr(document_citations, "document_index_cache", DocumentIndexCache(loader=loader))
+    app = FastAPI()
+    app.include_router(document_citations.router)
+    return TestClient(app, raise_server_exceptions=False)
+
+
+def test_locate_phrase_endpoint(client):
+    response = client.post("/locate-phrase", json={"document_id": "document", "phrase": "treatment plan"})
+    assert response.status_code == 200
+    assert [match["page_number"] for match in response.json()["matches"]] == [2]
+
+
+def test_lines_in_rect_endpoint(client):
+    response = client.post("/lines-in-rect", json={"document_id": "document", "page_number": 1, "rect": [440, 90, 560, 150]})
+    assert response.status_code == 200
+    assert line_texts(response.json()["lines"]) == ["Side column"]
+
+
+def test_missing_document_is_404_and_other_errors_are_500(client):
+    assert client.post("/locate-phrase", json={"document_id": "missing", "phrase": "trial"}).status_code == 404
+    assert client.post("/locate-phrase", json={"document_id": "broken", "phrase": "trial"}).status_code == 500
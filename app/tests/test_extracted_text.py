@@ -0,0 +1,159 @@
+"""
+Tests of the compressed extracted text store.
+"""
+
+import asyncio
+
+import pytest
+from bson import Binary
+
+from models import doc, extracted_text
+from models.extracted_text import ExtractedTextRepository
+from utils.document_handling.document_extraction import ExtractedDocument, ExtractedPage
+
+
+class DeleteResult:
+    def __init__(self, deleted_count):
+        self.deleted_count = deleted_count
+
+
+class FakeCursor:
+    def __init__(self, records):
+        self.records = records
+
+    def sort(self, field, direction):
+        self.records = sorted(self.records, key=lambda record: record[field], reverse=direction < 0)
+        return self
+
+    async def to_list(self, length):
+        return self.records[:length] if length else self.records
+
+
+class FakeCollection:
+    """In-memory collection evaluating the equality and $in filters of the repository."""
+
+    def __init__(self):
+        self.records = []
+
+    def _matches(self, record, query):
+        for field, condition in query.items():
+            if isinstance(condition, dict):
+                if record.get(field) not in condition["$in"]:
+                    return False
+            elif record.get(field) != condition:
+                return False
+        return True
+
+    async def insert_many(self, records, ordered=True):
+        self.records.extend(dict(record) for record in records)
+
+    async def delete_many(self, query):
+        kept = [record for record in self.records if not self._matches(record, query)]
+        deleted, self.records = len(self.records) - len(kept), kept
+        return DeleteResult(deleted)
+
+    def find(self, query, projection):
+        fields = [field for field, include in projection.items() if include]
+        return FakeCursor([
+            {field: value for field, value in record.items() if not fields or field in fields}
+            for record in self.records if self._matches(record, query)
+        ])
+
+
+def page(page_number, text):
+    return ExtractedPage(
+        page_number=page_number,
+        text=text,
+        lines=[(text, (72.0, 100.5, 300.25, 112.0))],
+        words=[(72.0, 100.5, 120.0, 112.0, word, 0, 0, position) for position, word in enumerate(text.split())]
+    )
+
+
+DOCUMENT = ExtractedDocument(pdf_name="report.pdf", pages=[
+    page(1, "Discharge summary"),
+    page(2, "Café owner, 54 — signiﬁcant relapse"),
+    page(3, "Follow-up in 6 weeks"),
+])
+
+
+@pytest.fixture
+def repo():
+    return ExtractedTextRepository({"extracted_texts": FakeCollection()})
+
+
+@pytest.mark.parametrize("codec", [
+    "zlib",
+    pytest.param("zstd", marks=pytest.mark.skipif(extracted_text.zstandard is None, reason="zstandard not installed")),
+])
+def test_extracted_document_round_trips(repo, monkeypatch, codec):
+    monkeypatch.setattr(extracted_text, "DEFAULT_CODEC", codec)
+
+    async def run():
+        stored = await repo.save_extracted_document("document", DOCUMENT)
+        return stored, await repo.get_extracted_document("document")
+
+    stored, loaded = asyncio.run(run())
+    assert stored == 3
+    assert loaded == DOCUMENT
+    record = repo.collection.records[0]
+    assert record["codec"] == codec
+    assert isinstance(record["text"], Binary) and isinstance(record["layout"], Binary)
+    assert record["char_count"] == len("Discharge summary")
+
+
+def test_pages_written_with_another_codec_are_still_read(repo, monkeypatch):
+    async def run():
+        await repo.save_extracted_document("document", DOCUMENT)
+        monkeypatch.setattr(extracted_text, "DEFAULT_CODEC", "zstd")
+        return await repo.get_page_texts("document")
+
+    monkeypatch.setattr(extracted_text, "DEFAULT_CODEC", "zlib")
+    assert asyncio.run(run()) == {1: "Discharge summary", 2: "Café owner, 54 — signiﬁcant relapse", 3: "Follow-up in 6 weeks"}
+
+
+def test_page_texts_are_in_page_order_and_filtered(repo):
+    shuffled = ExtractedDocument(pdf_name="report.pdf", pages=[DOCUMENT.pages[2], DOCUMENT.pages[0], DOCUMENT.pages[1]])
+
+    async def run():
+        await repo.save_extracted_document("document", shuffled)
+        return await repo.get_page_texts("document"), await repo.get_page_texts("document", page_numbers=[3, 1])
+
+    all_pages, some_pages = asyncio.run(run())
+    assert list(all_pages) == [1, 2, 3]
+    assert list(some_pages.items()) == [(1, "Discharge summary"), (3, "Follow-up in 6 weeks")]
+
+
+def test_saving_replaces_a_previous_extraction(repo):
+    async def run():
+        await repo.save_extracted_document("document", DOCUMENT)
+        await repo.save_extracted_document("document", ExtractedDocument(pdf_name="report.pdf", pages=[page(1, "Revised")]))
+        return await repo.get_extracted_document("document"), await repo.get_extracted_document("other")
+
+    document, missing = asyncio.run(run())
+    assert [extracted_page.text for extracted_page in document.pages] == ["Revised"]
+    assert missing is None
+
+
+def test_deleting_a_document_deletes_its_extracted_text(repo, monkeypatch):
+    deleted = []
+
+    async def delete_other(document_id):
+        deleted.append(document_id)
+
+    class Docs:
+        async def delete_one(self, query):
+            return DeleteResult(1)
+
+    monkeypatch.setattr(doc, "extracted_text_repo", repo)
+    monkeypatch.setattr(doc.summary_repo, "delete_summary_by_document_id", delete_other)
+    monkeypatch.setattr(doc.table_repo, "delete_tables_by_document_id", delete_other)
+    monkeypatch.setattr(doc.doc_repo, "collection", Docs())
+
+    async def run():
+        await repo.save_extracted_document("document", DOCUMENT)
+        await repo.save_extracted_document("other", DOCUMENT)
+        return await doc.doc_repo.delete_doc_by_document_id("document")
+
+    assert asyncio.run(run())
+    assert {record["document_id"] for record in repo.collection.records} == {"other"}
+    assert deleted == ["document", "document"]
@@ -0,0 +1,116 @@
+"""
+Tests of the packed highlight helper table and its ranged reader.
+"""
+
+import asyncio
+import csv
+import io
+
+import pytest
+from botocore.exceptions import ClientError
+
+from utils.document_handling import helper_table
+from utils.document_handling.helper_table import (
+    HelperTableReader, pack_helper_table, parse_header, unpack_helper_table
+)
+
+KEY = "DB/USERS/user/highlight_helper_tables/report.pdf.bin"
+
+ROWS = [
+    {"Page Number": 1, "Line Number": 1, "Content": "Discharge summary", "Coordinates": (72.0, 70.5, 300.25, 84.0)},
+    {"Page Number": 1, "Line Number": 2, "Content": "Patient: café owner, 54", "Coordinates": (72.0, 90.0, 250.0, 102.5)},
+    {"Page Number": 3, "Line Number": 1, "Content": "Follow-up in 6 weeks", "Coordinates": (80.0, 500.0, 260.0, 512.0)},
+]
+
+
+class FakeS3:
+    """In-memory stand-in for AsyncS3Host that records the byte ranges it serves."""
+
+    def __init__(self, objects=None):
+        self.objects = dict(objects or {})
+        self.ranges = []
+
+    async def get_object_range(self, key, start, end):
+        if key not in self.objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey", "Message": "Not found"}}, "GetObject")
+        self.ranges.append((key, start, end))
+        return self.objects[key][start:end + 1]
+
+    async def get_object_if_exists(self, key):
+        return self.objects.get(key)
+
+    async def save_to_s3(self, file_data, key):
+        self.objects[key] = file_data
+
+
+def to_legacy_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=["Page Number", "Line Number", "Content", "Coordinates"])
+    writer.writeheader()
+    for row in rows:
+        writer.writerow({**row, "Coordinates": str(row["Coordinates"])})
+    return buffer.getvalue().encode("utf-8")
+
+
+def test_packed_table_round_trips():
+    assert unpack_helper_table(pack_helper_table(ROWS)) == ROWS
+
+
+def test_unpack_reads_only_requested_pages():
+    assert unpack_helper_table(pack_helper_table(ROWS), page_numbers=[3, 7]) == ROWS[2:]
+
+
+def test_header_indexes_pages():
+    header, body_start = parse_header(pack_helper_table(ROWS))
+
+    assert header["line_count"] == 3
+    assert sorted(header["pages"]) == [1, 3]
+    assert header["pages"][1]["line_count"] == 2
+    assert header["pages"][1]["offset"] == 0
+    assert header["pages"][3]["offset"] == header["pages"][1]["coordinates_length"] + header["pages"][1]["text_length"]
+    assert body_start > helper_table.HELPER_TABLE_PREFIX.size
+
+
+def test_header_rejects_other_formats():
+    with pytest.raises(ValueError):
+        parse_header(to_legacy_csv(ROWS))
+
+
+def test_reader_fetches_one_page_with_a_ranged_read():
+    s3 = FakeS3({KEY: pack_helper_table(ROWS)})
+    reader = HelperTableReader(s3)
+
+    async def run():
+        first = await reader.get_page_rows(KEY, 3)
+        s3.ranges.clear()
+        return first, await reader.get_page_rows(KEY, 1), await reader.get_page_rows(KEY, 2)
+
+    page_3, page_1, page_2 = asyncio.run(run())
+    assert page_3 == ROWS[2:]
+    assert page_1 == ROWS[:2]
+    assert page_2 == []
+    # With the header cached, a page costs one ranged read of its own segment
+    header, body_start = parse_header(s3.objects[KEY])
+    page = header["pages"][1]
+    assert s3.ranges == [(KEY, body_start, body_start + page["coordinates_length"] + page["text_length"] - 1)]
+
+
+def test_reader_completes_headers_longer_than_the_probe(monkeypatch):
+    monkeypatch.setattr(helper_table, "HELPER_TABLE_HEADER_PROBE_BYTES", 16)
+    s3 = FakeS3({KEY: pack_helper_table(ROWS)})
+
+    assert asyncio.run(HelperTableReader(s3).get_rows(KEY)) == ROWS
+    assert s3.ranges[0] == (KEY, 0, 15)
+    assert s3.ranges[1][1] == 16
+
+
+def test_reader_packs_legacy_csv_on_first_access():
+    s3 = FakeS3({KEY[:-len(".bin")] + ".csv": to_legacy_csv(ROWS)})
+
+    assert asyncio.run(HelperTableReader(s3).get_rows(KEY)) == ROWS
+    assert unpack_helper_table(s3.objects[KEY]) == ROWS
+
+
+def test_reader_raises_for_document_without_helper_table():
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(HelperTableReader(FakeS3()).get_rows(KEY))
@@ -0,0 +1,97 @@
+"""
+Tests of the map-reduce document outline.
+"""
+
+import asyncio
+import re
+
+import pytest
+
+from utils.document_handling import generate_save_document_ouline as outline
+
+
+def marked_text(page_count, words_per_page=50):
+    return ''.join(
+        f'PAGE NUMBER {page} STARTS HERE\n{"finding " * words_per_page}\nPAGE NUMBER {page} ENDS HERE\n'
+        for page in range(1, page_count + 1)
+    )
+
+
+class FakeBrain:
+    """Answers map, merge and outline prompts with page-tagged notes, recording every prompt."""
+
+    def __init__(self, fail_merges_covering=None):
+        self.prompts = []
+        self.fail_merges_covering = fail_merges_covering
+
+    async def __call__(self, messages, **kwargs):
+        prompt, content = messages[0]["content"], messages[1]["content"]
+        self.prompts.append((prompt, content))
+
+        if prompt.startswith("The user will provide you with the extracted text of pages"):
+            pages = [int(page) for page in re.findall(r'PAGE NUMBER (\d+) STARTS HERE', content)]
+        else:
+            pages = sorted({int(page) for page in re.findall(r'\(p\. (\d+)\)', content)})
+            if "page-tagged notes about pages" in prompt and self.fail_merges_covering in pages:
+                raise RuntimeError("Merge failed")
+
+        if "page-tagged notes about pages" in prompt:
+            notes = '- Condensed findings ' + ' '.join(f'(p. {page})' for page in pages)
+        else:
+            notes = '\n'.join(f'- A long note about the findings on this page {"detail " * 40}(p. {page})' for page in pages)
+        return f'{notes}\n```\n[{", ".join(str(page) for page in pages)}]\n```'
+
+    def prompts_of(self, kind):
+        return [content for prompt, content in self.prompts if kind in prompt]
+
+
+@pytest.fixture
+def brain(monkeypatch):
+    brain = FakeBrain()
+    monkeypatch.setattr(outline, "use_brain", brain)
+    monkeypatch.setattr(outline, "OUTLINE_REDUCE_MAX_PROMPT_TOKENS", 2000)
+    monkeypatch.setattr(outline, "OUTLINE_NOTES_PER_MERGE", 3)
+    return brain
+
+
+def test_short_notes_go_straight_to_the_outline(brain, monkeypatch):
+    monkeypatch.setattr(outline, "OUTLINE_REDUCE_MAX_PROMPT_TOKENS", 100000)
+
+    _, source_pages = asyncio.run(outline.generate_hierarchical_document_outline(marked_text(40), "report.pdf"))
+
+    assert brain.prompts_of("page-tagged notes about pages") == []
+    assert len(brain.prompts_of("600 word Document Overview")) == 1
+    assert source_pages == list(range(1, 41))
+
+
+def test_long_notes_are_merged_until_the_outline_prompt_fits(brain):
+    _, source_pages = asyncio.run(outline.generate_hierarchical_document_outline(marked_text(200), "report.pdf"))
+
+    merges = brain.prompts_of("page-tagged notes about pages")
+    # 25 groups of 8 pages are merged 3 at a time over several levels
+    assert len(merges) > 25 // 3
+    [final_notes] = brain.prompts_of("600 word Document Overview")
+    assert outline.estimate_prompt_tokens([{"content": final_notes}]) <= outline.OUTLINE_REDUCE_MAX_PROMPT_TOKENS
+    # Provenance survives every level
+    assert sorted({int(page) for page in re.findall(r'\(p\. (\d+)\)', final_notes)}) == list(range(1, 201))
+    assert source_pages == list(range(1, 201))
+
+
+def test_merged_notes_keep_their_page_range(brain):
+    summaries = [
+        {"first_page": 1, "last_page": 8, "notes": "- Note (p. 2)", "source_pages": [2]},
+        {"first_page": 9, "last_page": 16, "notes": "- Note (p. 12)", "source_pages": [12]},
+    ]
+
+    merged = asyncio.run(outline.merge_group_notes(summaries, "report.pdf", asyncio.Semaphore(1)))
+
+    assert (merged["first_page"], merged["last_page"], merged["source_pages"]) == (1, 16, [2, 12])
+
+
+def test_failed_merge_drops_only_its_batch(brain):
+    brain.fail_merges_covering = 1
+
+    _, source_pages = asyncio.run(outline.generate_hierarchical_document_outline(marked_text(200), "report.pdf"))
+
+    assert 1 not in source_pages
+    assert 200 in source_pages
@@ -0,0 +1,79 @@
+"""
+Tests of pre-rendering previews through the page render cache.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from utils.document_handling import page_renderer
+from utils.document_handling.page_renderer import PageRenderCache
+
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+
+    async def get_object_if_exists(self, key):
+        return self.objects.get(key)
+
+    async def save_to_s3(self, file_data, key):
+        self.objects[key] = file_data
+
+
+@pytest.fixture
+def renders(monkeypatch):
+    """Replace page rendering with a fake recording each batch and whether it ran in the worker pool."""
+    batches = []
+
+    def render_pages(pdf_content, page_numbers, dpi, image_format="png"):
+        batches.append((list(page_numbers), threading.current_thread().name.startswith("render-pool")))
+        return [f"page {page_number}".encode() for page_number in page_numbers]
+
+    monkeypatch.setattr(page_renderer, "render_pages", render_pages)
+    return batches
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = PageRenderCache(FakeS3())
+    pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="render-pool")
+    monkeypatch.setattr(cache, "_get_pool", lambda: pool)
+    yield cache
+    pool.shutdown()
+
+
+def warm(cache, page_numbers):
+    return asyncio.run(cache.warm_many(b"%PDF", "hash", page_numbers, 72, "png"))
+
+
+def test_few_pages_render_in_one_batch_on_a_thread(cache, renders):
+    keys = warm(cache, [1, 2, 3])
+
+    assert renders == [([1, 2, 3], False)]
+    assert [cache.s3_client.objects[key] for key in keys] == [b"page 1", b"page 2", b"page 3"]
+
+
+def test_pages_up_to_the_threshold_stay_on_the_thread(cache, renders):
+    warm(cache, list(range(1, page_renderer.RENDER_POOL_MIN_PAGES + 1)))
+
+    assert [in_pool for _, in_pool in renders] == [False]
+
+
+def test_many_pages_render_in_batches_in_the_worker_pool(cache, renders):
+    page_count = 2 * page_renderer.RENDER_BATCH_PAGES + 1
+    keys = warm(cache, list(range(1, page_count + 1)))
+
+    assert sorted(len(batch) for batch, _ in renders) == [1, page_renderer.RENDER_BATCH_PAGES, page_renderer.RENDER_BATCH_PAGES]
+    assert all(in_pool for _, in_pool in renders)
+    assert len(cache.s3_client.objects) == len(keys) == page_count
+
+
+def test_pages_already_in_s3_are_not_rendered(cache, renders):
+    keys = warm(cache, [1, 2])
+    renders.clear()
+
+    assert warm(PageRenderCache(cache.s3_client), [1, 2, 3])[:2] == keys
+    assert renders == [([3], False)]
@@ -0,0 +1,188 @@
+"""
+Tests of cursor pagination over the per-document preview, table and image records.
+"""
+
+import asyncio
+
+import pytest
+from bson import ObjectId
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from api.v1.endpoints import get_images, get_tables
+from models.pagination import NEXT_CURSOR_HEADER, find_document_records_page
+from services.document_encoder import DocumentEncoder
+
+
+class FakeCursor:
+    def __init__(self, records):
+        self.records = records
+
+    def sort(self, field, direction):
+        self.records = sorted(self.records, key=lambda record: record[field], reverse=direction < 0)
+        return self
+
+    def limit(self, count):
+        self.records = self.records[:count]
+        return self
+
+    async def to_list(self, length):
+        return [dict(record) for record in self.records[:length]]
+
+
+class FakeCollection:
+    """In-memory collection evaluating the equality, $gt, $gte and $lte filters the pagination uses."""
+
+    OPERATORS = {
+        "$gt": lambda value, bound: value > bound,
+        "$gte": lambda value, bound: value >= bound,
+        "$lte": lambda value, bound: value <= bound,
+    }
+
+    def __init__(self, records):
+        self.records = records
+
+    def _matches(self, record, query):
+        for field, condition in query.items():
+            if isinstance(condition, dict):
+                if not all(self.OPERATORS[operator](record[field], bound) for operator, bound in condition.items()):
+                    return False
+            elif record[field] != condition:
+                return False
+        return True
+
+    def find(self, query):
+        return FakeCursor([record for record in self.records if self._matches(record, query)])
+
+
+def table_records():
+    records = []
+    for page_number in range(1, 6):
+        for table_number in (1, 2):
+            records.append({
+                "_id": ObjectId(),
+                "id": f"DB/USERS/user/document_tables/report.pdf/page_{page_number}_table_{table_number}.png",
+                "document_id": "document",
+                "page_number": page_number,
+                "table_number": table_number,
+            })
+    records.append({**records[0], "_id": ObjectId(), "document_id": "other"})
+    return records
+
+
+@pytest.fixture
+def collection():
+    return FakeCollection(table_records())
+
+
+def fetch_all(collection, limit, **filters):
+    async def run():
+        pages, cursor = [], None
+        while True:
+            records, cursor = await find_document_records_page(collection, "document", cursor=cursor, limit=limit, **filters)
+            pages.append(records)
+            if cursor is None:
+                return pages
+
+    return asyncio.run(run())
+
+
+def test_cursor_walks_every_record_once_in_order(collection):
+    pages = fetch_all(collection, limit=3)
+
+    assert [len(records) for records in pages] == [3, 3, 3, 1]
+    records = [record for records in pages for record in records]
+    assert [(record["page_number"], record["table_number"]) for record in records] == [
+        (page_number, table_number) for page_number in range(1, 6) for table_number in (1, 2)
+    ]
+    assert all("_id" not in record for record in records)
+
+
+def test_exact_last_page_has_no_next_cursor(collection):
+    pages = fetch_all(collection, limit=5)
+    assert [len(records) for records in pages] == [5, 5]
+
+
+def test_page_range_limits_records(collection):
+    pages = fetch_all(collection, limit=3, page_start=2, page_end=3)
+    records = [record for records in pages for record in records]
+    assert [(record["page_number"], record["table_number"]) for record in records] == [(2, 1), (2, 2), (3, 1), (3, 2)]
+
+
+def test_invalid_cursor_is_rejected(collection):
+    with pytest.raises(ValueError):
+        asyncio.run(find_document_records_page(collection, "document", cursor="not-a-cursor"))
+
+
+def test_without_limit_every_record_is_returned(collection):
+    records, next_cursor = asyncio.run(find_document_records_page(collection, "document", limit=None))
+    assert len(records) == 10
+    assert next_cursor is None
+
+
+IMAGE_DOCUMENT_ID = DocumentEncoder.encode_document_id("user", "report.pdf")
+
+
+def image_records():
+    return [
+        {"_id": ObjectId(), "id": f"report.pdf_pg{page_number}_img1.png", "document_id": IMAGE_DOCUMENT_ID, "page_number": page_number}
+        for page_number in range(1, 4)
+    ]
+
+
+@pytest.fixture
+def client(collection, monkeypatch):
+    async def sign(keys, expire_in_n_seconds=18000):
+        return [f"https://signed/{key}" for key in keys]
+
+    monkeypatch.setattr(get_tables.table_repo, "collection", collection)
+    monkeypatch.setattr(get_images.image_repo, "collection", FakeCollection(image_records()))
+    monkeypatch.setattr(get_tables.current_s3_client, "get_presigned_view_urls", sign)
+    app = FastAPI()
+    app.include_router(get_tables.router)
+    app.include_router(get_images.router)
+    return TestClient(app)
+
+
+def test_tables_endpoint_lists_every_table_without_cursor_or_limit(client):
+    response = client.post("/get-document-tables", json={"document_id": "document", "user_id": "user"})
+
+    assert response.status_code == 200
+    assert [(table["page_number"], table["table_number"]) for table in response.json()] == [
+        (page_number, table_number) for page_number in range(1, 6) for table_number in (1, 2)
+    ]
+    assert NEXT_CURSOR_HEADER not in response.headers
+
+
+def test_tables_endpoint_pages_with_cursor_header(client):
+    request = {"document_id": "document", "user_id": "user", "limit": 4, "page_start": 2}
+    first = client.post("/get-document-tables", json=request)
+    assert first.status_code == 200
+    assert [table["page_number"] for table in first.json()] == [2, 2, 3, 3]
+    assert first.json()[0]["url"].startswith("https://signed/")
+
+    second = client.post("/get-document-tables", json={**request, "cursor": first.headers[NEXT_CURSOR_HEADER]})
+    assert [table["page_number"] for table in second.json()] == [4, 4, 5, 5]
+    assert NEXT_CURSOR_HEADER not in second.headers
+
+
+def test_tables_endpoint_rejects_invalid_cursor(client):
+    response = client.post("/get-document-tables", json={"document_id": "document", "user_id": "user", "cursor": "bogus"})
+    assert response.status_code == 400
+
+
+def test_images_endpoint_keeps_url_list_without_cursor_or_limit(client):
+    response = client.post("/get-document-images", json={"document_id": IMAGE_DOCUMENT_ID, "user_id": "user"})
+
+    assert response.json() == [
+        f"https://signed/{DocumentEncoder.get_document_image_file_key(IMAGE_DOCUMENT_ID, image['id'])}" for image in image_records()
+    ]
+
+
+def test_images_endpoint_pages_with_ids_and_page_numbers(client):
+    response = client.post("/get-document-images", json={"document_id": IMAGE_DOCUMENT_ID, "user_id": "user", "limit": 2})
+
+    assert [(image["id"], image["page_number"]) for image in response.json()] == [
+        ("report.pdf_pg1_img1.png", 1), ("report.pdf_pg2_img1.png", 2)
+    ]
+    assert NEXT_CURSOR_HEADER in response.headers
@@ -0,0 +1,131 @@
+"""
+Tests of presigned view URL reuse and its invalidation on delete.
+"""
+
+import asyncio
+
+import pytest
+
+from services import presigned_url_cache as presigned_url_cache_module, s3host
+from services.presigned_url_cache import PresignedUrlCache
+from services.s3host import AsyncS3Host
+
+
+@pytest.fixture
+def now(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(presigned_url_cache_module, "time", lambda: now[0])
+    monkeypatch.setattr(s3host, "time", lambda: now[0])
+    return now
+
+
+class FakeS3Client:
+    def __init__(self, session):
+        self.session = session
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def generate_presigned_url(self, operation, Params, ExpiresIn):
+        self.session.signed += 1
+        return f"https://signed/{Params['Key']}?v={self.session.signed}"
+
+    async def list_objects_v2(self, Bucket, Prefix, **kwargs):
+        return {"Contents": [{"Key": key} for key in self.session.keys if key.startswith(Prefix)]}
+
+    async def delete_objects(self, Bucket, Delete):
+        deleted = {item["Key"] for item in Delete["Objects"]}
+        self.session.keys = [key for key in self.session.keys if key not in deleted]
+
+    async def delete_object(self, Bucket, Key):
+        self.session.keys.remove(Key)
+
+
+class FakeSession:
+    def __init__(self, keys):
+        self.keys = list(keys)
+        self.signed = 0
+
+    def client(self, service, config=None):
+        return FakeS3Client(self)
+
+
+def test_url_is_reused_until_the_refresh_point(now):
+    cache = PresignedUrlCache(max_entries=8, refresh_fraction=0.5)
+    cache.set("a.png", "get_object", "url-1", expire_in_n_seconds=100)
+
+    now[0] += 49
+    assert cache.get("a.png", "get_object", 100) == "url-1"
+    now[0] += 2
+    assert cache.get("a.png", "get_object", 100) is None
+    assert (cache.hits, cache.refreshes) == (1, 1)
+
+
+def test_url_is_per_operation(now):
+    cache = PresignedUrlCache(max_entries=8, refresh_fraction=0.5)
+    cache.set("a.png", "get_object", "url-1", expire_in_n_seconds=100)
+
+    assert cache.get("a.png", "put_object", 100) is None
+
+
+def test_least_recently_used_url_is_evicted(now):
+    cache = PresignedUrlCache(max_entries=2, refresh_fraction=0.5)
+    cache.set("a.png", "get_object", "url-a", 100)
+    cache.set("b.png", "get_object", "url-b", 100)
+    cache.get("a.png", "get_object", 100)
+    cache.set("c.png", "get_object", "url-c", 100)
+
+    assert cache.get("b.png", "get_object", 100) is None
+    assert cache.get("a.png", "get_object", 100) == "url-a"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_view_urls_are_signed_once_then_reissued_after_the_refresh_point(now):
+    host = AsyncS3Host(PresignedUrlCache(max_entries=8, refresh_fraction=0.5))
+    host.session = FakeSession([])
+
+    async def sign():
+        return await host.get_presigned_view_urls(["a.png", "b.png", "a.png"], expire_in_n_seconds=100)
+
+    first = asyncio.run(sign())
+    assert first[0] == first[2]
+    assert host.session.signed == 2
+
+    assert asyncio.run(sign()) == first
+    now[0] += 51
+    assert asyncio.run(sign()) != first
+    assert host.session.signed == 4
+
+
+def test_deleting_a_folder_invalidates_the_urls_under_it(now):
+    folder = "DB/USERS/user/document_tables/report.pdf/"
+    keys = [f"{folder}page_1_table_1.png", f"{folder}page_2_table_1.png", "DB/USERS/user/docs/report.pdf"]
+    host = AsyncS3Host(PresignedUrlCache(max_entries=8, refresh_fraction=0.5))
+    host.session = FakeSession(keys)
+
+    async def run():
+        before = await host.get_presigned_view_urls(keys)
+        await host.delete_from_s3(folder)
+        return before, await host.get_presigned_view_urls(keys)
+
+    before, after = asyncio.run(run())
+    assert after[0] != before[0] and after[1] != before[1]
+    assert after[2] == before[2]
+
+
+def test_deleting_a_file_invalidates_only_its_url(now):
+    keys = ["DB/USERS/user/docs/report.pdf", "DB/USERS/user/docs/report.pdf.bak"]
+    host = AsyncS3Host(PresignedUrlCache(max_entries=8, refresh_fraction=0.5))
+    host.session = FakeSession(keys)
+
+    async def run():
+        before = await host.get_presigned_view_urls(keys)
+        await host.delete_from_s3(keys[0])
+        return before, await host.get_presigned_view_urls(keys)
+
+    before, after = asyncio.run(run())
+    assert after[0] != before[0]
+    assert after[1] == before[1]
@@ -0,0 +1,106 @@
+"""
+Tests of cropping detected tables and saving them a detection batch at a time.
+"""
+
+import asyncio
+
+import fitz
+import numpy as np
+import pytest
+
+from utils.document_handling.page_rasterizer import get_region_clip, render_regions
+
+LETTER = fitz.Rect(0, 0, 612, 792)
+
+
+def make_pdf(page_count):
+    pdf_document = fitz.open()
+    for _ in range(page_count):
+        pdf_document.new_page(width=LETTER.width, height=LETTER.height)
+    try:
+        return pdf_document.tobytes()
+    finally:
+        pdf_document.close()
+
+
+def test_box_at_detection_dpi_maps_to_points_with_margin():
+    # 96 DPI pixels are 0.75 points
+    assert get_region_clip(LETTER, (96, 192, 480, 384), boxes_dpi=96, margin=4) == fitz.Rect(68, 140, 364, 292)
+
+
+def test_clip_is_clamped_to_the_page():
+    assert get_region_clip(LETTER, (0, 2, 900, 1100), boxes_dpi=96, margin=4) == fitz.Rect(0, 0, 612, 792)
+
+
+def test_clip_is_offset_by_the_page_origin():
+    page_rect = fitz.Rect(10, 20, 622, 812)
+    assert get_region_clip(page_rect, (96, 192, 480, 384), boxes_dpi=96) == fitz.Rect(82, 164, 370, 308)
+
+
+def test_regions_are_rendered_at_the_crop_dpi():
+    [image] = render_regions(make_pdf(1), 1, [(96, 192, 480, 384)], 96, 300, "png", 4)
+
+    pixmap = fitz.Pixmap(image)
+    # 296 x 152 points at 300 DPI
+    assert abs(pixmap.width - 296 * 300 / 72) <= 1
+    assert abs(pixmap.height - 152 * 300 / 72) <= 1
+
+
+class InsertManyResult:
+    def __init__(self, inserted_ids):
+        self.inserted_ids = inserted_ids
+
+
+class FakeTables:
+    def __init__(self):
+        self.inserts = []
+
+    async def insert_many(self, records, ordered=True):
+        self.inserts.append([(record["page_number"], record["table_number"]) for record in records])
+        return InsertManyResult(list(range(len(records))))
+
+
+def test_tables_are_saved_with_one_insert_per_detection_batch(monkeypatch):
+    pytest.importorskip("torch")
+    from utils.document_handling import extraction_engine
+
+    # Two tables on page 1, none on pages 2-4, one on page 5
+    tables_per_page = {1: 2, 5: 1}
+    uploads = []
+
+    async def detect(images):
+        return [np.zeros((tables_per_page.get(image.page_number, 0), 4)) for image in images]
+
+    def render_page_images(pdf_content, page_numbers, dpi):
+        class Image:
+            def __init__(self, page_number):
+                self.page_number = page_number
+
+            def close(self):
+                pass
+
+        return [Image(page_number) for page_number in page_numbers]
+
+    def render_regions(pdf_content, page_number, boxes, boxes_dpi, dpi, image_format, margin):
+        return [b"png"] * len(boxes)
+
+    async def save_to_s3(data, key):
+        uploads.append(key)
+
+    tables = FakeTables()
+    monkeypatch.setattr(extraction_engine, "TABLE_DETECTION_BATCH_PAGES", 2)
+    monkeypatch.setattr(extraction_engine.table_detector, "detect", detect)
+    monkeypatch.setattr(extraction_engine, "render_page_images", render_page_images)
+    monkeypatch.setattr(extraction_engine, "render_regions", render_regions)
+    monkeypatch.setattr(extraction_engine.current_s3_client, "save_to_s3", save_to_s3)
+    monkeypatch.setattr(extraction_engine.table_repo, "collection", tables)
+
+    keys = asyncio.run(extraction_engine.extract_and_save_tables_from_pdf(make_pdf(5), "report.pdf", "document", "user"))
+
+    # Batches are pages 1-2, 3-4 and 5; the batch without tables writes nothing
+    assert tables.inserts == [[(1, 1), (1, 2)], [(5, 1)]]
+    assert sorted(uploads) == sorted(keys) == sorted([
+        "DB/USERS/user/document_tables/report.pdf/page_1_table_1.png",
+        "DB/USERS/user/document_tables/report.pdf/page_1_table_2.png",
+        "DB/USERS/user/document_tables/report.pdf/page_5_table_1.png",
+    ])
@@ -0,0 +1,135 @@
+"""
+Tests of aligning generated text to source lines and of locating phrases on a page.
+"""
+
+from utils.document_handling import text_alignment
+from utils.document_handling.text_alignment import PageWordIndex, align_text_to_pages, normalize_word
+
+
+def row(page_number, line_number, content):
+    return {
+        "Page Number": page_number,
+        "Line Number": line_number,
+        "Content": content,
+        "Coordinates": (72, 100 + 14 * line_number, 500, 112 + 14 * line_number),
+    }
+
+
+def page_rows(page_number, lines):
+    return [row(page_number, line_number, content) for line_number, content in enumerate(lines, start=1)]
+
+
+FILLER = [
+    "Copyright of the publisher, all rights reserved",
+    "Table of contents and list of abbreviations",
+    "Acknowledgements to the study investigators",
+]
+
+
+def matched_lines(alignment, rows):
+    line_of = {tuple(row["Coordinates"]): row["Line Number"] for row in rows}
+    return [line_of[rect] for rect in alignment["rects"]]
+
+
+# Sentence alignment
+
+def test_sentence_is_aligned_to_a_window_of_consecutive_lines():
+    rows = page_rows(1, [
+        FILLER[0],
+        "The median progression-free survival was 11.2 months",
+        "in the pembrolizumab arm compared with 6.4 months",
+        "in the chemotherapy arm of the trial.",
+        FILLER[1],
+    ])
+    text = "# Key Findings\n- **PFS:** The median progression-free survival was 11.2 months in the pembrolizumab arm compared with 6.4 months in the chemotherapy arm."
+
+    [alignment] = align_text_to_pages(text, rows, [1])
+
+    assert alignment["page_number"] == 1
+    assert matched_lines(alignment, rows) == [2, 3, 4]
+    assert alignment["score"] >= text_alignment.ALIGNMENT_MIN_SCORE
+
+
+def test_matches_per_page_are_capped_and_do_not_overlap():
+    findings = [
+        "Grade three neutropenia occurred in twelve percent of patients",
+        "Nausea was reported by thirty patients during induction",
+        "Hepatic enzymes rose above normal limits in four cases",
+        "Quality of life scores improved after twelve weeks",
+        "Dose reductions were needed for eight participants overall",
+    ]
+    rows = page_rows(1, [line for finding in findings for line in (finding, FILLER[2])])
+    text = " ".join(f"{finding}." for finding in findings)
+
+    [alignment] = align_text_to_pages(text, rows, [1])
+
+    lines = matched_lines(alignment, rows)
+    assert len(lines) == len(set(lines))
+    assert lines == sorted(lines)
+    matched_findings = {rows[line - 1]["Content"] for line in lines} & set(findings)
+    assert len(matched_findings) == text_alignment.ALIGNMENT_MAX_MATCHES_PER_PAGE
+
+
+def test_sentences_below_the_minimum_length_are_not_aligned():
+    rows = page_rows(1, ["Dosing was halted.", FILLER[0]])
+    assert len("Dosing was halted".split()) < text_alignment.ALIGNMENT_MIN_SENTENCE_WORDS
+
+    assert align_text_to_pages("## Purpose\nDosing was halted.", rows, [1]) == []
+
+
+def test_page_without_a_matching_passage_is_left_out():
+    rows = page_rows(1, ["The primary endpoint was overall survival at two years", FILLER[0]]) + page_rows(2, FILLER)
+    text = "The primary endpoint was overall survival at two years."
+
+    alignments = align_text_to_pages(text, rows, [1, 2, 3])
+
+    assert [alignment["page_number"] for alignment in alignments] == [1]
+
+
+# Phrase lookup
+
+def page_words(*texts):
+    return [(72 + 40 * position, 100, 100 + 40 * position, 112, text, 0, 0, position) for position, text in enumerate(texts)]
+
+
+def test_normalize_word_unfolds_ligatures_and_drops_soft_hyphens_and_punctuation():
+    assert normalize_word("Signiﬁcant,") == "significant"
+    assert normalize_word("treat­ment") == "treatment"
+    assert normalize_word("(p<0.05)") == "p005"
+
+
+def test_find_phrase_matches_ligatures_and_soft_hyphens():
+    index = PageWordIndex(page_words("A", "signiﬁcant", "reduction", "of", "treat­ment", "failure"))
+
+    assert index.find_phrase("significant reduction") == 1
+    assert index.find_phrase("treatment failure") == 4
+
+
+def test_find_phrase_matches_word_hyphenated_across_lines():
+    index = PageWordIndex(page_words("Patients", "continued", "the", "treat-", "ment", "plan"))
+
+    # Anchored on "plan", the phrase starts one word earlier than its offset suggests
+    assert index.find_phrase("treatment plan") == 3
+
+
+def test_find_phrase_matches_phrase_hyphenated_where_the_page_is_not():
+    index = PageWordIndex(page_words("Scheduled", "postoperative", "visits", "were", "kept"))
+
+    # Anchored on "visits", the phrase starts one word later than its offset suggests
+    assert index.find_phrase("post- operative visits") == 1
+
+
+def test_find_phrase_matches_close_ocr_spelling():
+    index = PageWordIndex(page_words("A", "signiflcant", "reductlon", "in", "relapse"))
+
+    assert index.lookup("reduction") == [2]
+    assert index.find_phrase("significant reduction in relapse") == 1
+
+
+def test_find_phrase_rejects_text_below_the_minimum_ratio():
+    index = PageWordIndex(page_words("A", "significant", "reduction", "in", "relapse", "rate"))
+    phrase = "significant increase of hospital admissions"
+
+    assert index.phrase_score([normalize_word(word) for word in phrase.split()], 1) < text_alignment.PHRASE_MATCH_MIN_RATIO
+    assert index.find_phrase(phrase) is None
+    assert index.find_phrase("placebo") is None
@@ -1,37 +1,134 @@
-from openai import OpenAI
-from configs.config import OpenAISettings
+import asyncio
+import hashlib
+import re
+from typing import Dict, List, Optional
+from fastapi import HTTPException
+from lib.brain import use_brain
+from lib.ttl_cache import TTLCache
+from utils.document_handling.document_retrieval import get_document_text
+from utils.document_handling.logger import log
 
-# Load API key from .env via config
-openai_settings = OpenAISettings()
-client = OpenAI(api_key=openai_settings.OPENAI_API_KEY)
+FINDINGS_MODEL = "gpt-4o"
+FINDINGS_TEMPERATURE = 0.7
+FINDINGS_TEXT_CACHE_TTL = 3600
+FINDINGS_TEXT_CACHE_MAX_ENTRIES = 64
+
+# Preprocessed source texts, keyed by document_id or text digest, shared by the
+# per-format calls of a batch and by follow-up requests on the same document
+preprocessed_text_cache = TTLCache(
+    ttl=FINDINGS_TEXT_CACHE_TTL,
+    max_entries=FINDINGS_TEXT_CACHE_MAX_ENTRIES,
+)
 
 def build_prompt(content_format: str, text: str) -> str:
+    # The source text comes before the format so the per-format prompts of a
+    # batch share one prefix, which providers can serve from their prompt cache
     return f"""
 You are a professional medical content analyst.
 
-Your task is to analyze the following text and extract **findings** specifically tailored for the given content format.
-
-- **Content Format**: {content_format}
+Your task is to analyze the following text and extract **findings** specifically tailored for the content format given after it.
 
 ### Original Text:
 {text}
 
+- **Content Format**: {content_format}
+
 Please return a clear and concise list of findings that match the format and context of the content type.
 """
 
-def send_to_openai(prompt: str) -> str:
-    messages = [
+def build_messages(prompt: str) -> List[dict]:
+    return [
         {"role": "system", "content": "You are a helpful assistant for extracting findings from medical content."},
         {"role": "user", "content": prompt}
     ]
 
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=messages,
-        temperature=0.7
+def preprocess_text(text: str) -> str:
+    """Collapse runs of blank lines and spaces, which only cost prompt tokens."""
+    text = re.sub(r'[ \t]+', ' ', text)
+    text = re.sub(r'\n\s*\n+', '\n\n', text)
+    return text.strip()
+
+async def resolve_source_text(text: Optional[str] = None, document_id: Optional[str] = None) -> str:
+    """
+    Return the preprocessed source text of a findings request.
+
+    Args:
+        text: Raw text sent by the client
+        document_id: Processed document to read the text from instead
+
+    Returns:
+        str: The preprocessed text, served from the cache when already prepared
+
+    Raises:
+        HTTPException: 400 if neither text nor document_id is given
+    """
+    if document_id:
+        cache_key = f"document:{document_id}"
+    elif text:
+        cache_key = f"text:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+    else:
+        raise HTTPException(status_code=400, detail="Either text or document_id is required")
+
+    cached = preprocessed_text_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    if document_id:
+        text = await get_document_text(document_id)
+
+    preprocessed = preprocess_text(text)
+    preprocessed_text_cache.set(cache_key, preprocessed)
+    return preprocessed
+
+async def send_to_openai(prompt: str) -> str:
+    return await use_brain(
+        messages=build_messages(prompt),
+        model=FINDINGS_MODEL,
+        stream=False,
+        inference="openai",
+        temperature=FINDINGS_TEMPERATURE,
+        call_site="findings"
     )
-    return response.choices[0].message.content
 
-def generate_findings_from_text(content_format: str, text: str) -> str:
+async def generate_findings_from_text(content_format: str, text: str) -> str:
     prompt = build_prompt(content_format, text)
-    return send_to_openai(prompt)
+    return await send_to_openai(prompt)
+
+async def generate_findings(
+    content_formats: List[str],
+    text: Optional[str] = None,
+    document_id: Optional[str] = None
+) -> Dict[str, Dict[str, str]]:
+    """
+    Extract findings for several content formats from one source text.
+
+    The source text is resolved and preprocessed once, then one call per format
+    runs in parallel. A failing format does not fail the others.
+
+    Args:
+        content_formats: The content formats to extract findings for
+        text: Raw source text
+        document_id: Processed document to use as the source instead of text
+
+    Returns:
+        dict: `findings` per successful format and `errors` per failed format
+    """
+    source_text = await resolve_source_text(text=text, document_id=document_id)
+    formats = list(dict.fromkeys(content_formats))
+    log(f"Extracting findings for {len(formats)} formats from {len(source_text)} characters")
+
+    results = await asyncio.gather(
+        *(generate_findings_from_text(content_format, source_text) for content_format in formats),
+        return_exceptions=True
+    )
+
+    findings, errors = {}, {}
+    for content_format, result in zip(formats, results):
+        if isinstance(result, Exception):
+            detail = getattr(result, "detail", str(result))
+            log(f"Findings extraction failed for {content_format}: {detail}")
+            errors[content_format] = str(detail)
+        else:
+            findings[content_format] = result
+
+    return {"findings": findings, "errors": errors}
@@ -1,18 +1,18 @@
+import asyncio
 import requests
-from typing import List, Optional
-from openai import OpenAI
-from configs.config import OpenAISettings
+from typing import AsyncGenerator, Dict, List, Optional
+from lib.brain import use_brain
+from utils.document_handling.document_retrieval import retrieve_context
 from utils.document_handling.logger import log
 from fastapi import HTTPException
 from utils.document_handling.content_type import CONTENT_HIERARCHY
 from utils.document_handling.prompt_builder import build_prompt 
 
+GENERATION_MODEL = "gpt-4o"
+GENERATION_TEMPERATURE = 0.7
+MAX_CONTENT_VARIANTS = 12
 
 class ContentGenerator:
-    def __init__(self):
-        openai_settings = OpenAISettings()
-        self.client = OpenAI(api_key=openai_settings.OPENAI_API_KEY)
-
     @staticmethod
     def validate_parameters(content_format: str, objective: str, audience: str, tone: str):
         log(f"Validating parameters: format={content_format}, objective={objective}, audience={audience}, tone={tone}")
@@ -32,63 +32,125 @@ class ContentGenerator:
             log("Invalid tone")
             raise HTTPException(status_code=400, detail="Invalid tone")
 
+    @staticmethod
+    async def resolve_source_text(
+        content_format: str,
+        objective: str,
+        audience: str,
+        text: Optional[str] = None,
+        document_ids: Optional[List[str]] = None,
+        workspace_id: Optional[str] = None,
+        context_token_budget: Optional[int] = None
+    ) -> str:
+        """
+        Return the source text of a request: the text sent by the client, or the
+        chunks of the given documents or workspace most relevant to the requested
+        format, objective and audience, packed to the context token budget.
+        """
+        if text:
+            return text
+
+        if not document_ids and not workspace_id:
+            log("No source text, document IDs or workspace ID provided")
+            raise HTTPException(status_code=400, detail="One of text, document_ids or workspace_id is required")
+
+        query = f"{content_format}: {objective} for {audience}"
+        return await retrieve_context(
+            query=query,
+            document_ids=document_ids,
+            workspace_id=workspace_id,
+            token_budget=context_token_budget
+        )
+
+    async def prepare_messages(
+        self,
+        content_format: str,
+        objective: str,
+        audience: str,
+        tone: str,
+        text: Optional[str] = None,
+        image_paths: Optional[List[str]] = None,
+        document_ids: Optional[List[str]] = None,
+        workspace_id: Optional[str] = None,
+        context_token_budget: Optional[int] = None
+    ) -> List[dict]:
+        log(f"Received params: format={content_format}, objective={objective}, audience={audience}, tone={tone}, text_length={len(text or '')}, document_ids={document_ids}, workspace_id={workspace_id}, image_paths={image_paths}")
+
+        # Validate before retrieving, so invalid requests never hit the vector store
+        self.validate_parameters(content_format, objective, audience, tone)
+
+        source_text = await self.resolve_source_text(
+            content_format, objective, audience, text, document_ids, workspace_id, context_token_budget
+        )
+        return self.build_messages(content_format, objective, audience, tone, source_text, image_paths)
+
+    def build_messages(
+        self,
+        content_format: str,
+        objective: str,
+        audience: str,
+        tone: str,
+        text: str,
+        image_paths: Optional[List[str]] = None
+    ) -> List[dict]:
+        # Build prompts
+        system_prompt, user_prompt = build_prompt(content_format, objective, audience, tone, text)
+        log("Prompt built successfully")
+
+        # Add system instruction for strict raw S3 link handling
+        system_prompt += (
+            '''\n\nInstruction: Must return only the content. If any of the provided S3 image URLs are relevant, insert them exactly as they are (including query parameters) at the appropriate place in the content. 
+            Do not change, shorten, reformat, or replace the URL. Do not use HTML, markdown, base64, or placeholders. Just insert the full original URL where it fits naturally. In the link do not add anything just send the raw link'''
+        )
+
+        if image_paths:
+            for image_url in image_paths:
+                if not image_url.startswith("https://") or "s3" not in image_url:
+                    log(f"Invalid S3 image URL: {image_url}")
+                    raise HTTPException(status_code=400, detail=f"Invalid S3 image URL: {image_url}")
+            user_prompt += "\n\nUse the following image links if they are relevant:\n" + "\n".join(image_paths)
+
+        # Prepare messages
+        return [
+            {
+                "role": "system",
+                "content": system_prompt
+            },
+            {
+                "role": "user",
+                "content": [{"type": "text", "text": user_prompt}]
+            }
+        ]
+
     async def generate_content(
         self, 
         content_format: str, 
         objective: str, 
         audience: str, 
         tone: str, 
-        text: str,
-        image_paths: Optional[List[str]] = None
+        text: Optional[str] = None,
+        image_paths: Optional[List[str]] = None,
+        document_ids: Optional[List[str]] = None,
+        workspace_id: Optional[str] = None,
+        context_token_budget: Optional[int] = None
     ) -> dict:
         try:
             log("Starting content generation")
-            log(f"Received params: format={content_format}, objective={objective}, audience={audience}, tone={tone}, text_length={len(text)}, image_paths={image_paths}")
-
-            self.validate_parameters(content_format, objective, audience, tone)
-
-            # Build prompts
-            system_prompt, user_prompt = build_prompt(content_format, objective, audience, tone, text)
-            log("Prompt built successfully")
-
-            # Add system instruction for strict raw S3 link handling
-            system_prompt += (
-                '''\n\nInstruction: Must return only the content. If any of the provided S3 image URLs are relevant, insert them exactly as they are (including query parameters) at the appropriate place in the content. 
-                Do not change, shorten, reformat, or replace the URL. Do not use HTML, markdown, base64, or placeholders. Just insert the full original URL where it fits naturally. In the link do not add anything just send the raw link'''
+            messages = await self.prepare_messages(
+                content_format, objective, audience, tone, text, image_paths,
+                document_ids, workspace_id, context_token_budget
             )
 
-            
-            if image_paths:
-                for image_url in image_paths:
-                    if not image_url.startswith("https://") or "s3" not in image_url:
-                        log(f"Invalid S3 image URL: {image_url}")
-                        raise HTTPException(status_code=400, detail=f"Invalid S3 image URL: {image_url}")
-                user_prompt += "\n\nUse the following image links if they are relevant:\n" + "\n".join(image_paths)
-
-            # Prepare messages
-            messages = [
-                {
-                    "role": "system",
-                    "content": system_prompt
-                },
-                {
-                    "role": "user",
-                    "content": [{"type": "text", "text": user_prompt}]
-                }
-            ]
-
             log("Calling OpenAI API")
-            response = self.client.chat.completions.create(
-                model="gpt-4o",
+            content = await use_brain(
                 messages=messages,
-                temperature=0.7
+                model=GENERATION_MODEL,
+                stream=False,
+                inference="openai",
+                temperature=GENERATION_TEMPERATURE,
+                use_cache=False,
+                call_site="content_generation"
             )
-
-            if not response.choices or not response.choices[0].message.content:
-                log("No content generated from OpenAI")
-                raise HTTPException(status_code=500, detail="No content generated from OpenAI")
-
-            content = response.choices[0].message.content
             log("Content generated successfully")
 
             return {
@@ -102,6 +164,147 @@ class ContentGenerator:
             log(f"Error in content generation: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Content generation failed: {str(e)}")
 
+    async def stream_content(
+        self,
+        content_format: str,
+        objective: str,
+        audience: str,
+        tone: str,
+        text: Optional[str] = None,
+        image_paths: Optional[List[str]] = None,
+        document_ids: Optional[List[str]] = None,
+        workspace_id: Optional[str] = None,
+        context_token_budget: Optional[int] = None
+    ) -> AsyncGenerator[str, None]:
+        """
+        Validate the request and open a token stream of the generated content.
+
+        Validation errors are raised here, before the first token, so the endpoint
+        can still answer them with a regular error response.
+        """
+        log("Starting streamed content generation")
+        messages = await self.prepare_messages(
+            content_format, objective, audience, tone, text, image_paths,
+            document_ids, workspace_id, context_token_budget
+        )
+
+        return await use_brain(
+            messages=messages,
+            model=GENERATION_MODEL,
+            stream=True,
+            inference="openai",
+            temperature=GENERATION_TEMPERATURE,
+            use_cache=False,
+            call_site="content_generation"
+        )
+
+    async def prepare_variant_messages(
+        self,
+        variants: List[Dict[str, str]],
+        text: Optional[str] = None,
+        image_paths: Optional[List[str]] = None,
+        document_ids: Optional[List[str]] = None,
+        workspace_id: Optional[str] = None,
+        context_token_budget: Optional[int] = None
+    ) -> List[List[dict]]:
+        """
+        Validate every variant, resolve the source text once for all of them and
+        build the messages of each variant.
+
+        Args:
+            variants: Dicts with content_format, objective, audience and tone
+
+        Returns:
+            List[List[dict]]: The messages of each variant, in request order
+        """
+        if not variants:
+            raise HTTPException(status_code=400, detail="At least one variant is required")
+        if len(variants) > MAX_CONTENT_VARIANTS:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_CONTENT_VARIANTS} variants can be generated at once")
+
+        for variant in variants:
+            self.validate_parameters(variant["content_format"], variant["objective"], variant["audience"], variant["tone"])
+
+        # One retrieval whose query covers every requested variant
+        unique_targets = dict.fromkeys(
+            (variant["content_format"], variant["objective"], variant["audience"]) for variant in variants
+        )
+        source_text = text
+        if not source_text:
+            if not document_ids and not workspace_id:
+                raise HTTPException(status_code=400, detail="One of text, document_ids or workspace_id is required")
+            query = "; ".join(f"{content_format}: {objective} for {audience}" for content_format, objective, audience in unique_targets)
+            source_text = await retrieve_context(
+                query=query,
+                document_ids=document_ids,
+                workspace_id=workspace_id,
+                token_budget=context_token_budget
+            )
+
+        return [
+            self.build_messages(
+                variant["content_format"], variant["objective"], variant["audience"], variant["tone"],
+                source_text, image_paths
+            )
+            for variant in variants
+        ]
+
+    async def generate_variants(
+        self,
+        variants: List[Dict[str, str]],
+        text: Optional[str] = None,
+        image_paths: Optional[List[str]] = None,
+        document_ids: Optional[List[str]] = None,
+        workspace_id: Optional[str] = None,
+        context_token_budget: Optional[int] = None
+    ) -> AsyncGenerator[dict, None]:
+        """
+        Validate the variants and start generating them in parallel.
+
+        Validation and retrieval happen here, before any result is produced, so
+        the endpoint can still answer errors with a regular error response.
+
+        Returns:
+            AsyncGenerator[dict, None]: One result per variant, in completion order
+        """
+        log(f"Starting generation of {len(variants)} content variants")
+        messages_per_variant = await self.prepare_variant_messages(
+            variants, text, image_paths, document_ids, workspace_id, context_token_budget
+        )
+        return self.run_variants(variants, messages_per_variant)
+
+    @staticmethod
+    async def run_variants(variants: List[Dict[str, str]], messages_per_variant: List[List[dict]]) -> AsyncGenerator[dict, None]:
+        async def generate_variant(index: int, messages: List[dict]) -> dict:
+            result = {"index": index, "variant": variants[index]}
+            try:
+                result["generated_content"] = await use_brain(
+                    messages=messages,
+                    model=GENERATION_MODEL,
+                    stream=False,
+                    inference="openai",
+                    temperature=GENERATION_TEMPERATURE,
+                    use_cache=False,
+                    call_site="content_variants"
+                )
+            except Exception as e:
+                detail = getattr(e, "detail", str(e))
+                log(f"Content variant {index} failed: {detail}")
+                result["error"] = f"Content generation failed: {detail}"
+            return result
+
+        # Every variant goes through the LLM scheduler, which bounds how many run at once
+        tasks = [
+            asyncio.create_task(generate_variant(index, messages))
+            for index, messages in enumerate(messages_per_variant)
+        ]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                yield await next_result
+        finally:
+            # The client went away: stop the variants that are still running
+            for task in tasks:
+                task.cancel()
 
 
 content_generator = ContentGenerator()
\ No newline at end of file
@@ -0,0 +1,149 @@
+"""
+Unified Document Text Extraction
+
+Extracts the text of a PDF once, in a single PyMuPDF pass per page, and keeps
+everything the processing pipeline needs from it: the page text, the line boxes
+and the word boxes. The outline, the vectorisation chunks, the highlight helper
+table and the highlighting all read the same ExtractedDocument, so they no
+longer extract the text separately or disagree about it.
+"""
+
+import fitz
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from utils.document_handling.logger import log
+
+Box = Tuple[float, float, float, float]
+
+
+def clean_page_text(text: str) -> str:
+    """Drop characters that only add noise and every empty line."""
+    text = text.replace("©", "").replace("�", "")
+    return "\n".join(line for line in text.splitlines() if line.strip())
+
+
+@dataclass
+class ExtractedPage:
+    """
+    Extracted content of one page.
+
+    Attributes:
+        page_number: 1-based page number
+        text: Cleaned page text
+        lines: (text, bbox) of every non-empty text line
+        words: Words in the tuple layout of page.get_text("words"):
+            (x0, y0, x1, y1, text, block_number, line_number, word_number)
+    """
+    page_number: int
+    text: str
+    lines: List[Tuple[str, Box]] = field(default_factory=list)
+    words: List[tuple] = field(default_factory=list)
+
+
+@dataclass
+class ExtractedDocument:
+    """
+    Text, line boxes and word boxes of every page of a document.
+
+    Attributes:
+        pdf_name: Name the document's text markers are written with
+        pages: The extracted pages, in order
+    """
+    pdf_name: str
+    pages: List[ExtractedPage] = field(default_factory=list)
+
+    @property
+    def page_count(self) -> int:
+        return len(self.pages)
+
+    def get_page(self, page_number: int) -> Optional[ExtractedPage]:
+        """The extracted page with the given 1-based number, if any."""
+        if 1 <= page_number <= len(self.pages) and self.pages[page_number - 1].page_number == page_number:
+            return self.pages[page_number - 1]
+        # Documents loaded for a subset of their pages
+        return next((page for page in self.pages if page.page_number == page_number), None)
+
+    def to_marked_text(self) -> str:
+        """
+        Document text with DOCUMENT and PAGE NUMBER markers, the format read by the
+        chunker and the outline generation.
+        """
+        marked_text = [f'DOCUMENT <{self.pdf_name}> CONTENTS STARTS HERE']
+        for page in self.pages:
+            marked_text.append(f'PAGE NUMBER {page.page_number} STARTS HERE')
+            if page.text:
+                marked_text.append(page.text)
+            marked_text.append(f'PAGE NUMBER {page.page_number} ENDS HERE')
+        marked_text.append(f'DOCUMENT <{self.pdf_name}> CONTENTS ENDS HERE')
+        return "\n".join(marked_text) + "\n"
+
+    def helper_rows(self, page_numbers: Optional[List[int]] = None) -> List[Dict]:
+        """
+        Rows of the highlight helper table: every text line with its bounding box.
+
+        Args:
+            page_numbers (List[int], optional): 1-based pages to include, all pages by default
+
+        Returns:
+            List[Dict]: Rows with "Page Number", "Line Number", "Content" and "Coordinates"
+        """
+        wanted_pages = set(page_numbers) if page_numbers is not None else None
+        rows = []
+        for page in self.pages:
+            if wanted_pages is not None and page.page_number not in wanted_pages:
+                continue
+            for line_number, (line_text, bbox) in enumerate(page.lines, start=1):
+                rows.append({
+                    "Page Number": page.page_number,
+                    "Line Number": line_number,
+                    "Content": line_text,
+                    "Coordinates": tuple(bbox)
+                })
+        return rows
+
+
+def extract_page(page, page_number: int) -> ExtractedPage:
+    """Extract the text, line boxes and word boxes of one page from a single text page."""
+    textpage = page.get_textpage()
+
+    lines = []
+    for block in page.get_text("dict", textpage=textpage)["blocks"]:
+        for line in block.get("lines", []):
+            line_text = " ".join([span["text"] for span in line["spans"]]).strip()
+            if line_text:
+                # Get bounding box from the line itself
+                x0 = min([span["bbox"][0] for span in line["spans"]])
+                y0 = min([span["bbox"][1] for span in line["spans"]])
+                x1 = max([span["bbox"][2] for span in line["spans"]])
+                y1 = max([span["bbox"][3] for span in line["spans"]])
+                lines.append((line_text, (x0, y0, x1, y1)))
+
+    words = [tuple(word) for word in page.get_text("words", textpage=textpage)]
+
+    text = clean_page_text(page.get_text("text", textpage=textpage) or "")
+    return ExtractedPage(page_number=page_number, text=text, lines=lines, words=words)
+
+
+def extract_document(pdf_data: bytes, pdf_name: str) -> ExtractedDocument:
+    """
+    Extract every page of a PDF in one pass.
+
+    Args:
+        pdf_data (bytes): The PDF file content as bytes
+        pdf_name (str): Name of the document, used in the text markers
+
+    Returns:
+        ExtractedDocument: The text, line boxes and word boxes of every page
+    """
+    pdf_document = fitz.open(stream=pdf_data, filetype="pdf")
+    try:
+        pages = [
+            extract_page(pdf_document.load_page(page_num), page_num + 1)
+            for page_num in range(len(pdf_document))
+        ]
+    finally:
+        pdf_document.close()
+
+    log(f"Extracted text, line and word boxes of {len(pages)} pages from {pdf_name}")
+    return ExtractedDocument(pdf_name=pdf_name, pages=pages)
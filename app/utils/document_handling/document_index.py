@@ -0,0 +1,265 @@
+"""
+Per-Document Line Index
+
+In-memory spatial and text index over the lines of a document (the highlight
+helper table data), used to anchor citations and highlight overlays:
+
+- which lines of page P overlap rectangle R
+- which lines contain a phrase
+
+Indexes are built on first use from the stored extraction, or from the packed
+helper table in S3 for documents processed before it was stored, and kept in an
+LRU cache with hit metrics.
+"""
+
+import asyncio
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from time import monotonic
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from models.extracted_text import extracted_text_repo
+from services.document_encoder import DocumentEncoder
+from utils.document_handling.helper_table import helper_table_reader
+from utils.document_handling.logger import log
+from utils.document_handling.text_alignment import normalize_word
+
+DOCUMENT_INDEX_CACHE_SIZE = 64
+# Lines following a match start that a phrase may continue onto
+PHRASE_MAX_LINE_SPAN = 2
+
+
+class PageLines:
+    """
+    Lines of one page sorted by their top edge.
+
+    A rectangle query bisects the sorted top edges: only lines starting below
+    `rect.y0 - max_height` and above `rect.y1` can overlap, the rest are skipped
+    without being looked at.
+    """
+
+    def __init__(self, line_ids: List[int], boxes: np.ndarray):
+        order = np.argsort(boxes[:, 1], kind="stable")
+        self.line_ids = [line_ids[position] for position in order]
+        self.boxes = boxes[order]
+        self.tops = self.boxes[:, 1].tolist()
+        self.max_height = float((self.boxes[:, 3] - self.boxes[:, 1]).max()) if len(self.boxes) else 0.0
+
+    def overlapping(self, rect: Sequence[float]) -> List[int]:
+        x0, y0, x1, y1 = rect
+        start = bisect_left(self.tops, y0 - self.max_height)
+        end = bisect_right(self.tops, y1)
+        if start >= end:
+            return []
+        boxes = self.boxes[start:end]
+        mask = (boxes[:, 0] <= x1) & (boxes[:, 2] >= x0) & (boxes[:, 1] <= y1) & (boxes[:, 3] >= y0)
+        return [self.line_ids[start + position] for position in np.flatnonzero(mask)]
+
+
+class DocumentIndex:
+    """
+    Spatial and text index of the lines of one document.
+
+    Attributes:
+        document_id: The indexed document
+        lines: Every line as a dict with page_number, line_number, text and bbox
+    """
+
+    def __init__(self, document_id: str, rows: List[Dict]):
+        self.document_id = document_id
+        self.lines: List[Dict] = []
+        self._tokens: List[List[str]] = []
+        self._postings: Dict[str, List[int]] = {}
+        page_line_ids: Dict[int, List[int]] = {}
+
+        for row in sorted(rows, key=lambda row: (row["Page Number"], row["Line Number"])):
+            line_id = len(self.lines)
+            self.lines.append({
+                "page_number": int(row["Page Number"]),
+                "line_number": int(row["Line Number"]),
+                "text": row["Content"],
+                "bbox": [float(value) for value in row["Coordinates"]],
+            })
+            tokens = [token for token in (normalize_word(word) for word in str(row["Content"]).split()) if token]
+            self._tokens.append(tokens)
+            for token in set(tokens):
+                self._postings.setdefault(token, []).append(line_id)
+            page_line_ids.setdefault(int(row["Page Number"]), []).append(line_id)
+
+        self.pages = {
+            page_number: PageLines(line_ids, np.asarray([self.lines[line_id]["bbox"] for line_id in line_ids], dtype=np.float32))
+            for page_number, line_ids in page_line_ids.items()
+        }
+
+    def lines_in_rect(self, page_number: int, rect: Sequence[float]) -> List[Dict]:
+        """
+        Lines of a page overlapping a rectangle, top to bottom.
+
+        Args:
+            page_number (int): 1-based page number
+            rect (Sequence[float]): x0, y0, x1, y1 in PDF points
+
+        Returns:
+            List[Dict]: The overlapping lines
+        """
+        page = self.pages.get(page_number)
+        if page is None:
+            return []
+        return [self.lines[line_id] for line_id in page.overlapping(rect)]
+
+    def find_phrase(self, phrase: str, page_numbers: Optional[Sequence[int]] = None, limit: int = 10) -> List[Dict]:
+        """
+        Lines containing a phrase, ignoring case, punctuation and hyphenation.
+
+        The phrase is looked up from the lines containing its rarest word; a
+        phrase may run over up to PHRASE_MAX_LINE_SPAN consecutive lines of a page.
+
+        Args:
+            phrase (str): The text to locate
+            page_numbers (Sequence[int], optional): Only search these pages
+            limit (int): Maximum number of matches
+
+        Returns:
+            List[Dict]: Per match its page_number and the lines it spans
+        """
+        phrase_tokens = [token for token in (normalize_word(word) for word in phrase.split()) if token]
+        if not phrase_tokens:
+            return []
+
+        posting_lists = [self._postings.get(token) for token in phrase_tokens]
+        if any(postings is None for postings in posting_lists):
+            # A word split across lines by hyphenation has no posting of its own
+            posting_lists = [postings for postings in posting_lists if postings]
+            if not posting_lists:
+                return []
+        anchor_postings = min(posting_lists, key=len)
+
+        wanted_pages = set(page_numbers) if page_numbers else None
+        phrase_text = "".join(phrase_tokens)
+        matches = []
+        seen_starts = set()
+        for anchor in anchor_postings:
+            page_number = self.lines[anchor]["page_number"]
+            if wanted_pages is not None and page_number not in wanted_pages:
+                continue
+
+            # The match can start on an earlier line than the anchor word
+            for start in range(max(0, anchor - PHRASE_MAX_LINE_SPAN + 1), anchor + 1):
+                if start in seen_starts or self.lines[start]["page_number"] != page_number:
+                    continue
+                text = ""
+                for end in range(start, min(start + PHRASE_MAX_LINE_SPAN, len(self.lines))):
+                    if self.lines[end]["page_number"] != page_number:
+                        break
+                    text += "".join(self._tokens[end])
+                    if phrase_text in text:
+                        # Skip the match if it is already complete on a later line
+                        if end > start and phrase_text in "".join(
+                            token for line_id in range(start + 1, end + 1) for token in self._tokens[line_id]
+                        ):
+                            break
+                        seen_starts.add(start)
+                        matches.append({
+                            "page_number": page_number,
+                            "lines": self.lines[start:end + 1],
+                        })
+                        break
+            if len(matches) >= limit:
+                break
+
+        return sorted(matches, key=lambda match: (match["page_number"], match["lines"][0]["line_number"]))
+
+
+async def load_document_rows(document_id: str) -> List[Dict]:
+    """
+    Helper table rows of a document, from the stored extraction or the packed table in S3.
+
+    Raises:
+        FileNotFoundError: If there is no such document, or it has no helper table
+    """
+    extracted_document = await extracted_text_repo.get_extracted_document(document_id)
+    if extracted_document:
+        return extracted_document.helper_rows()
+
+    try:
+        key = DocumentEncoder.get_highlight_helper_table_file_key(document_id)
+    except (ValueError, KeyError):
+        raise FileNotFoundError(f"Invalid document id {document_id}")
+    return await helper_table_reader.get_rows(key)
+
+
+class DocumentIndexCache:
+    """
+    LRU cache of document indexes.
+
+    Concurrent requests for a document that is not cached share one build.
+
+    Attributes:
+        max_documents: Maximum number of cached indexes
+        hits: Lookups answered from the cache
+        misses: Lookups that had to build the index
+        evictions: Indexes evicted to stay within max_documents
+        build_seconds: Total time spent building indexes
+    """
+
+    def __init__(self, max_documents: int = DOCUMENT_INDEX_CACHE_SIZE, loader=load_document_rows):
+        self.max_documents = max_documents
+        self.loader = loader
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.build_seconds = 0.0
+        self._indexes: "OrderedDict[str, DocumentIndex]" = OrderedDict()
+        self._building: Dict[str, asyncio.Future] = {}
+
+    async def get(self, document_id: str) -> DocumentIndex:
+        index = self._indexes.get(document_id)
+        if index is not None:
+            self._indexes.move_to_end(document_id)
+            self.hits += 1
+            return index
+
+        self.misses += 1
+        building = self._building.get(document_id)
+        if building is not None:
+            return await asyncio.shield(building)
+
+        building = asyncio.ensure_future(self._build(document_id))
+        self._building[document_id] = building
+        return await asyncio.shield(building)
+
+    async def _build(self, document_id: str) -> DocumentIndex:
+        try:
+            start_time = monotonic()
+            rows = await self.loader(document_id)
+            index = await asyncio.to_thread(DocumentIndex, document_id, rows)
+            self.build_seconds += monotonic() - start_time
+            log(f"Built line index of {len(index.lines)} lines for document {document_id}")
+
+            self._indexes[document_id] = index
+            while len(self._indexes) > self.max_documents:
+                self._indexes.popitem(last=False)
+                self.evictions += 1
+            return index
+        finally:
+            self._building.pop(document_id, None)
+
+    def invalidate(self, document_id: str) -> None:
+        self._indexes.pop(document_id, None)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "documents": len(self._indexes),
+            "max_documents": self.max_documents,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+            "evictions": self.evictions,
+            "build_seconds": round(self.build_seconds, 3),
+        }
+
+
+document_index_cache = DocumentIndexCache()
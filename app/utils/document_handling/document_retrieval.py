@@ -0,0 +1,195 @@
+"""
+Document Text Retrieval
+
+Reads the text of processed documents back from the vector store, so features
+such as findings extraction and content generation can work from document IDs
+instead of having the client send the full text with every request.
+"""
+
+import anyio
+from typing import List, Optional
+from fastapi import HTTPException
+from qdrant_client.http.models import Filter, FieldCondition, MatchValue
+
+from lib.brain import estimate_prompt_tokens
+from models.extracted_text import extracted_text_repo
+from models.workspace import workspace_repo
+from services.ollama_host import current_ollama_client
+from services.qdrant_host import current_qdrant_client
+from utils.document_handling.logger import log
+
+DOCUMENT_TEXT_COLLECTION_NAME = 'creator'
+SCROLL_PAGE_SIZE = 256
+RETRIEVAL_CANDIDATE_CHUNKS = 48
+RETRIEVAL_TOKEN_BUDGET = 6000
+
+
+def document_filter(document_ids: List[str]) -> Filter:
+    """Qdrant filter matching the chunks of any of the given documents."""
+    return Filter(
+        should=[
+            FieldCondition(key="document_id", match=MatchValue(value=document_id))
+            for document_id in document_ids
+        ]
+    )
+
+
+def scroll_document_chunks(document_id: str) -> List[dict]:
+    """
+    Read every stored chunk of a document, in chunk order.
+
+    Args:
+        document_id (str): The document whose chunks to read
+
+    Returns:
+        List[dict]: Chunk payloads with `text`, `document_id` and `chunk_index`
+    """
+    if current_qdrant_client is None:
+        raise HTTPException(status_code=503, detail="Vector store is not available")
+
+    payloads = []
+    offset = None
+    while True:
+        points, offset = current_qdrant_client.scroll(
+            collection_name=DOCUMENT_TEXT_COLLECTION_NAME,
+            scroll_filter=document_filter([document_id]),
+            limit=SCROLL_PAGE_SIZE,
+            offset=offset,
+            with_payload=True,
+            with_vectors=False
+        )
+        payloads.extend(point.payload for point in points)
+        if offset is None:
+            break
+
+    return sorted(payloads, key=lambda payload: payload.get("chunk_index", 0))
+
+
+async def get_document_text(document_id: str) -> str:
+    """
+    Return the text of a processed document.
+
+    The per-page text stored at ingest is used when available; documents
+    processed before it was stored are rebuilt from their vector store chunks.
+
+    Args:
+        document_id (str): The document to read
+
+    Returns:
+        str: The document text in page order
+
+    Raises:
+        HTTPException: 404 if no text is stored for the document
+    """
+    page_texts = await extracted_text_repo.get_page_texts(document_id)
+    if page_texts:
+        log(f"Loaded {len(page_texts)} stored pages of document {document_id}")
+        return "\n".join(page_texts[page_number] for page_number in sorted(page_texts))
+
+    payloads = await anyio.to_thread.run_sync(scroll_document_chunks, document_id)
+    if not payloads:
+        raise HTTPException(status_code=404, detail=f"No extracted text found for document {document_id}")
+
+    log(f"Loaded {len(payloads)} chunks of document {document_id} from the vector store")
+    return "\n".join(payload["text"] for payload in payloads)
+
+
+async def resolve_document_ids(document_ids: Optional[List[str]] = None, workspace_id: Optional[str] = None) -> List[str]:
+    """
+    Return the documents to retrieve from: the given IDs plus the files of the workspace.
+
+    Raises:
+        HTTPException: 404 if the workspace does not exist, 400 if no document is left
+    """
+    resolved = list(document_ids or [])
+    if workspace_id:
+        workspace = await workspace_repo.get_workspace_by_id(workspace_id)
+        if not workspace:
+            raise HTTPException(status_code=404, detail=f"Workspace {workspace_id} not found")
+        resolved.extend(workspace.get("files", []))
+
+    resolved = list(dict.fromkeys(resolved))
+    if not resolved:
+        raise HTTPException(status_code=400, detail="No documents to retrieve content from")
+    return resolved
+
+
+def search_document_chunks(query: str, document_ids: List[str], limit: int) -> List[dict]:
+    """
+    Vector search for the chunks of the given documents most relevant to a query.
+
+    Returns:
+        List[dict]: Chunk payloads with their `score`, most relevant first
+    """
+    if current_qdrant_client is None:
+        raise HTTPException(status_code=503, detail="Vector store is not available")
+
+    query_vector = current_ollama_client.embed_query(query)
+    response = current_qdrant_client.query_points(
+        collection_name=DOCUMENT_TEXT_COLLECTION_NAME,
+        query=query_vector,
+        query_filter=document_filter(document_ids),
+        limit=limit,
+        with_payload=True,
+        with_vectors=False
+    )
+    return [{**point.payload, "score": point.score} for point in response.points]
+
+
+def pack_chunks(chunks: List[dict], token_budget: int) -> List[dict]:
+    """
+    Greedily keep the most relevant chunks that fit in the token budget.
+
+    Chunks are expected most relevant first; the kept chunks are returned in
+    document order so the packed context reads naturally.
+    """
+    packed = []
+    used_tokens = 0
+    seen = set()
+    for chunk in chunks:
+        key = (chunk.get("document_id"), chunk.get("chunk_index"))
+        if key in seen:
+            continue
+        tokens = estimate_prompt_tokens([{"content": chunk["text"]}])
+        if used_tokens + tokens > token_budget:
+            continue
+        seen.add(key)
+        packed.append(chunk)
+        used_tokens += tokens
+
+    return sorted(packed, key=lambda chunk: (chunk.get("document_id"), chunk.get("chunk_index", 0)))
+
+
+async def retrieve_context(
+    query: str,
+    document_ids: Optional[List[str]] = None,
+    workspace_id: Optional[str] = None,
+    token_budget: Optional[int] = None
+) -> str:
+    """
+    Build a prompt context from the chunks of a set of documents most relevant to a query.
+
+    Args:
+        query (str): What the context should be relevant to
+        document_ids (List[str], optional): Documents to retrieve from
+        workspace_id (str, optional): Workspace whose files to retrieve from
+        token_budget (int, optional): Maximum estimated tokens of the context
+
+    Returns:
+        str: The packed chunk texts, in document order
+
+    Raises:
+        HTTPException: 404 if nothing relevant is stored for the documents
+    """
+    resolved_ids = await resolve_document_ids(document_ids, workspace_id)
+    token_budget = token_budget or RETRIEVAL_TOKEN_BUDGET
+
+    chunks = await anyio.to_thread.run_sync(
+        search_document_chunks, query, resolved_ids, RETRIEVAL_CANDIDATE_CHUNKS
+    )
+    packed = pack_chunks(chunks, token_budget)
+    if not packed:
+        raise HTTPException(status_code=404, detail="No extracted text found for the requested documents")
+
+    log(f"Packed {len(packed)} of {len(chunks)} retrieved chunks from {len(resolved_ids)} documents into a {token_budget} token budget")
+    return "\n\n".join(chunk["text"] for chunk in packed)
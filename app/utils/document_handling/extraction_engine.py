@@ -1,94 +1,52 @@
-from io import BytesIO, StringIO
-from time import time
+import asyncio
+import os
+from typing import Optional
+
+import anyio
 import fitz
-import pandas as pd
-import json
-from ultralyticsplus import YOLO
-from PIL import Image
 from services.s3host import current_s3_client
 from utils.document_handling.logger import log
+from utils.document_handling.document_extraction import ExtractedDocument, extract_document
+from utils.document_handling.helper_table import helper_table_reader, pack_helper_table
 from models.images import ImageModel, image_repo  # Update import
 from models.tables import TableModel, table_repo
-import torch
-from PIL import Image
-import io
-import os 
+from utils.document_handling.page_rasterizer import render_page_images, render_regions
+from utils.document_handling.table_detector import (
+    TABLE_CROP_DPI, TABLE_CROP_MARGIN, TABLE_DETECTION_BATCH_PAGES, TABLE_DETECTION_DPI, table_detector
+)
 
-async def extract_text_from_pdf_data_for_vectorisation(pdf_content: bytes, pdf_name: str, userId:str) -> str:
+async def extract_text_from_pdf_data_for_vectorisation(pdf_content: bytes, pdf_name: str, userId:str, extracted_document: Optional[ExtractedDocument] = None) -> str:
     """
     Asynchronously extract text from PDF content.
     
     Args:
         pdf_content (bytes): The PDF file content as bytes
         pdf_name (str): Name of the PDF file
+        extracted_document (ExtractedDocument, optional): Text already extracted from the PDF,
+            extracted here when not given
     
     Returns:
         str: Extracted and formatted text from the PDF
     """
-    pdf_document = None
     try:
-        # TEXT EXTRACTION INTO DATAFRAME FOR HIGHLIGHTS
-        highlights_helper_table = []
-        pdf_document = fitz.open(stream=pdf_content, filetype="pdf")
-        for page_num in range(len(pdf_document)):
-            page = pdf_document.load_page(page_num)
-            lines = page.get_text("dict")["blocks"]
- 
-            line_counter = 1
-            for block in lines:
-                for line in block.get("lines", []):
-                    line_text = " ".join([span["text"] for span in line["spans"]]).strip()
-                    if line_text:
-                        #get bounding box from the line itself
-                        x0 = min([span["bbox"][0] for span in line["spans"]])
-                        y0 = min([span["bbox"][1] for span in line["spans"]])
-                        x1 = max([span["bbox"][2] for span in line["spans"]])
-                        y1 = max([span["bbox"][3] for span in line["spans"]])
- 
-                        highlights_helper_table.append({
-                            "Page Number": page_num + 1,
-                            "Line Number": line_counter,
-                            "Content": line_text,
-                            "Coordinates": (x0, y0, x1, y1)
-                        })
-                        line_counter += 1
-
-        df = pd.DataFrame(highlights_helper_table)
-        csv_buffer = StringIO()
-        df.to_csv(csv_buffer, index=False)
-        csv_bytes = csv_buffer.getvalue().encode("utf-8")  # Convert to bytes
+        if extracted_document is None:
+            extracted_document = await anyio.to_thread.run_sync(extract_document, pdf_content, pdf_name)
+
+        # PAGE-INDEXED HELPER TABLE FOR HIGHLIGHTS
+        helper_table_bytes = pack_helper_table(extracted_document.helper_rows())
 
         # Define the key
-        key = f'DB/USERS/{userId}/highlight_helper_tables/{pdf_name}.csv'
+        key = f'DB/USERS/{userId}/highlight_helper_tables/{pdf_name}.bin'
 
         # Upload using AsyncS3Host
-        await current_s3_client.save_to_s3(csv_bytes, key)
+        await current_s3_client.save_to_s3(helper_table_bytes, key)
+        helper_table_reader.invalidate(key)
 
         # TEXT EXTRACTION FOR VECTORISATION
-        extracted_text = []
-        extracted_text.append(f'DOCUMENT <{pdf_name}> CONTENTS STARTS HERE')
-       
-        for page_num in range(len(pdf_document)):
-            page = pdf_document.load_page(page_num)
-            page_text = page.get_text("text") or ""
-            page_text = page_text.replace("©", "").replace("�", "")
-           
-            extracted_text.append(f'PAGE NUMBER {page_num + 1} STARTS HERE')
-            extracted_text.append(page_text.strip())
-            extracted_text.append(f'PAGE NUMBER {page_num + 1} ENDS HERE')
-       
-        extracted_text.append(f'DOCUMENT <{pdf_name}> CONTENTS ENDS HERE')
-        
-        output = "\n".join(extracted_text)
-        return output
+        return extracted_document.to_marked_text()
 
     except Exception as e:
         raise Exception(f"Error extracting text from PDF {pdf_name}: {str(e)}")
-    
-    finally:
-        if pdf_document:
-            pdf_document.close()
-
 
 async def extract_and_save_images_from_pdf(document_content: bytes, document_name: str, document_id: str, userId: str):
     """
@@ -126,7 +84,7 @@ async def extract_and_save_images_from_pdf(document_content: bytes, document_nam
                 await current_s3_client.save_to_s3(image_bytes, s3_key)
 
                 image_id=f'{pdf_name}_pg{page_num+1}_img{img_index+1}.{ext}'
-                await image_repo.add_new_image(ImageModel(id=image_id,document_id=document_id))
+                await image_repo.add_new_image(ImageModel(id=image_id,document_id=document_id,page_number=page_num+1))
 
         log(f"Extracted {image_count} images from document {document_name}")
         return True
@@ -142,7 +100,7 @@ async def extract_and_save_images_from_pdf(document_content: bytes, document_nam
 
 async def extract_and_save_tables_from_pdf(document_content: bytes, document_name: str, document_id: str, userId: str) -> list:
     """
-    Asynchronously extracts tables from PDF content using YOLOv8 model.
+    Asynchronously extracts tables from PDF content using the shared YOLOv8 table detector.
     
     Args:
         document_content (bytes): The PDF file content as bytes
@@ -155,61 +113,51 @@ async def extract_and_save_tables_from_pdf(document_content: bytes, document_nam
     """
 
     try:
-        # Patch torch.load to force weights_only=False for compatibility
-        original_load = torch.load
-        def safe_load(f, map_location=None, pickle_module=None, weights_only=None, **kwargs):
-            return original_load(f, map_location=map_location, pickle_module=pickle_module, 
-                                weights_only=False, **kwargs)
-        torch.load = safe_load
-
-        # Initialize YOLO model
-        model = YOLO('keremberke/yolov8m-table-extraction')
-        model.overrides['conf'] = 0.25
-        model.overrides['iou'] = 0.45
-        model.overrides['agnostic_nms'] = False
-        model.overrides['max_det'] = 1000
-
         extracted_tables = []
         doc = fitz.open(stream=document_content, filetype="pdf")
-
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
-            pix = page.get_pixmap(dpi=300)
-            image = Image.open(io.BytesIO(pix.tobytes("png")))
-
-            # Detect tables
-            results = model.predict(image)
-            boxes = results[0].boxes.xyxy.cpu().numpy()
-
-            # Process each detected table
-            for i, (x1, y1, x2, y2) in enumerate(boxes):
-                table_crop = image.crop((x1, y1, x2, y2))
-                
-                # Convert table image to bytes
-                img_byte_arr = io.BytesIO()
-                table_crop.save(img_byte_arr, format='PNG')
-                img_byte_arr = img_byte_arr.getvalue()
-
-                # Define S3 path and save
-                s3_key = f'DB/USERS/{userId}/document_tables/{document_name}/page_{page_num+1}_table_{i+1}.png'
-                await current_s3_client.save_to_s3(img_byte_arr, s3_key)
-                
-                # Create and save table metadata
-                table_model = TableModel(
-                    id=s3_key,
-                    document_id=document_id,
-                    page_number=page_num + 1,
-                    table_number=i + 1
+        page_count = len(doc)
+        doc.close()
+
+        for batch_start in range(1, page_count + 1, TABLE_DETECTION_BATCH_PAGES):
+            page_numbers = list(range(batch_start, min(batch_start + TABLE_DETECTION_BATCH_PAGES, page_count + 1)))
+
+            # Detect tables on a batch of low-resolution pages with the shared model
+            images = await anyio.to_thread.run_sync(
+                render_page_images, document_content, page_numbers, TABLE_DETECTION_DPI
+            )
+            page_boxes = await table_detector.detect(images)
+            for image in images:
+                image.close()
+
+            batch_tables = []
+            uploads = []
+            for page_number, boxes in zip(page_numbers, page_boxes):
+                if not len(boxes):
+                    continue
+
+                # Render only the detected tables at high resolution
+                table_images = await anyio.to_thread.run_sync(
+                    render_regions, document_content, page_number, boxes.tolist(),
+                    TABLE_DETECTION_DPI, TABLE_CROP_DPI, "png", TABLE_CROP_MARGIN
                 )
-                await table_repo.add_new_table(table_model)
-                
-                extracted_tables.append(s3_key)
-                log(f"Saved table: {s3_key}")
-                
-                table_crop.close()
-            
-            image.close()
-            pix = None  # Release pixmap memory
+
+                for i, table_image in enumerate(table_images):
+                    s3_key = f'DB/USERS/{userId}/document_tables/{document_name}/page_{page_number}_table_{i+1}.png'
+                    uploads.append(current_s3_client.save_to_s3(table_image, s3_key))
+                    batch_tables.append(TableModel(
+                        id=s3_key,
+                        document_id=document_id,
+                        page_number=page_number,
+                        table_number=i + 1
+                    ))
+
+            # Upload the batch's crops concurrently, then save their metadata in one write
+            await asyncio.gather(*uploads)
+            await table_repo.add_new_tables(batch_tables)
+
+            extracted_tables.extend(table.id for table in batch_tables)
+            if batch_tables:
+                log(f"Saved {len(batch_tables)} tables from pages {page_numbers[0]}-{page_numbers[-1]}")
 
         return extracted_tables
 
@@ -217,8 +165,4 @@ async def extract_and_save_tables_from_pdf(document_content: bytes, document_nam
         log(f"Error extracting tables from PDF {document_name}: {str(e)}")
         raise
 
-    finally:
-        if 'doc' in locals():
-            doc.close()
-
 
@@ -1,50 +1,40 @@
-
-
 import asyncio
+import anyio
 import re
 import json
 from time import time
 import fitz
-from io import BytesIO
-from PyPDF2 import PdfReader
+from typing import Optional
 
 from utils.document_handling.logger import log
 from services.s3host import current_s3_client
 from utils.document_handling.save_document_data_to_DB import save_document_outline_to_db
-from lib.brain import use_brain
-
-
-def extract_text_from_pdf_data(pdf_data, pdf_name: str):
-    # Wrap the binary data in a BytesIO object to make it file-like
-    pdf_file = BytesIO(pdf_data)
-
-    # Initialize a PdfReader with the file-like object
-    pdf_reader = PdfReader(pdf_file)
-
-    raw_text = ''''''
-
-    # Iterate through each page and extract text
-    raw_text += f'\nDOCUMENT <{pdf_name}> CONTENTS STARTS HERE\n'
-    for page_num in range(len(pdf_reader.pages)):
-        page = pdf_reader.pages[page_num]
-        page_text = page.extract_text()
-
-        # Replace problematic characters
-        page_text = page_text.replace("©", "").replace("�", "")
-
-        # Add markers to the text
-        raw_text += f'PAGE NUMBER {page_num + 1} STARTS HERE\n'
-        raw_text += page_text
-        raw_text += f'\nPAGE NUMBER {page_num + 1} ENDS HERE\n'
-
-    raw_text += f'\nDOCUMENT <{pdf_name}> CONTENTS ENDS HERE\n'
-
-    # Clean the text to remove empty lines
-    lines = raw_text.splitlines()
-    non_empty_lines = [line + '\n' for line in lines if line.strip()]
-    cleaned_text = ''.join(non_empty_lines)
-
-    return cleaned_text
+from utils.document_handling.page_renderer import PREVIEW_RENDITIONS, get_document_hash, get_render_page_url, page_render_cache
+from lib.brain import estimate_prompt_tokens, use_brain
+from utils.document_handling.document_extraction import ExtractedDocument, extract_document
+from utils.document_handling.text_alignment import PageWordIndex, align_text_to_pages
+
+# Documents whose extracted text is longer than this are outlined with the map-reduce mode
+OUTLINE_SINGLE_SHOT_MAX_CHARS = 60000
+OUTLINE_PAGES_PER_GROUP = 8
+OUTLINE_MAX_CONCURRENT_GROUPS = 4
+# Group notes above this prompt size are first merged in batches of OUTLINE_NOTES_PER_MERGE
+OUTLINE_REDUCE_MAX_PROMPT_TOKENS = 12000
+OUTLINE_NOTES_PER_MERGE = 6
+# Ask the vision model for the source passage of pages the local alignment could not match
+OUTLINE_VISION_FALLBACK = True
+HIGHLIGHT_COLOR = (1, 1, 0.5)  # yellow
+# How outline source highlights are delivered: "page" uploads the highlighted page,
+# "crops" uploads a crop per highlight cluster, "rects" only returns rectangles to
+# overlay on the page's preview render
+OUTLINE_HIGHLIGHT_MODE = "crops"
+HIGHLIGHT_CLUSTER_GAP = 24
+HIGHLIGHT_CROP_MARGIN = 12
+HIGHLIGHT_CROP_ZOOM = 2.0
+# Preview rendition the "rects" mode entries point at
+HIGHLIGHT_PREVIEW_RENDITION = "full"
+
+PAGE_BLOCK_PATTERN = re.compile(r'PAGE NUMBER (\d+) STARTS HERE\n(.*?)PAGE NUMBER \1 ENDS HERE\n', re.DOTALL)
 
 
 def extract_page_image(pdf_data, page_number):
@@ -97,7 +87,7 @@ async def process_page_hint(pdf_data, page_number, hint):
     ]
 
     try:
-        response_text = await use_brain(messages=messages, stream=False, inference="groq")
+        response_text = await use_brain(messages=messages, stream=False, inference="groq", priority="background", call_site="page_hints")
         
         # Parse JSON response with error handling
         try:
@@ -115,14 +105,96 @@ async def process_page_hint(pdf_data, page_number, hint):
         return None
 
 
-async def highlight_text_in_pdf_with_vision(pdf_data, pdf_name, page_hints, userId, document_id):
+def align_outline_to_source_pages(extracted_document: ExtractedDocument, document_outline: str, source_pages: list) -> list:
+    """
+    Locate the passages of the source pages the outline was written from, locally.
+
+    Args:
+        extracted_document (ExtractedDocument): The document's extracted text and line boxes
+        document_outline (str): The generated outline
+        source_pages (list): Page numbers the outline cites
+
+    Returns:
+        list: Per matched page, its "page_number" and the line "rects" to highlight
+    """
+    helper_rows = extracted_document.helper_rows(page_numbers=source_pages)
+    return align_text_to_pages(document_outline, helper_rows, source_pages)
+
+
+def cluster_highlight_rects(rects: list, gap: float = HIGHLIGHT_CLUSTER_GAP) -> list:
+    """
+    Group the highlight rectangles of a page into vertically contiguous clusters.
+
+    Args:
+        rects (list): fitz.Rect highlights of one page
+        gap (float): Largest vertical gap in points between rectangles of one cluster
+
+    Returns:
+        list: One fitz.Rect per cluster, enclosing its highlights
+    """
+    clusters = []
+    for rect in sorted(rects, key=lambda rect: rect.y0):
+        if clusters and rect.y0 - clusters[-1].y1 <= gap:
+            clusters[-1] |= rect
+        else:
+            clusters.append(fitz.Rect(rect))
+    return clusters
+
+
+def normalize_rect(rect, page_rect) -> list:
+    """Rectangle as fractions of the page size, so it can be overlaid on a render of any resolution."""
+    return [
+        round((rect.x0 - page_rect.x0) / page_rect.width, 4),
+        round((rect.y0 - page_rect.y0) / page_rect.height, 4),
+        round((rect.x1 - page_rect.x0) / page_rect.width, 4),
+        round((rect.y1 - page_rect.y0) / page_rect.height, 4),
+    ]
+
+
+async def highlight_text_in_pdf_with_vision(pdf_data, pdf_name, page_hints, userId, document_id, aligned_highlights=None, highlight_mode: str = None, extracted_document: Optional[ExtractedDocument] = None):
+    """
+    Highlight the outline source passages and save what the frontend needs to show them.
+
+    Every returned entry carries the highlight rectangles of its page as fractions
+    of the page size. What is rendered and uploaded depends on the highlight mode:
+    "page" uploads the full highlighted page, "crops" uploads one image per
+    cluster of highlights, and "rects" uploads nothing: its entries carry the
+    "preview" URL of the page's render, warmed in the render cache, for the
+    frontend to overlay the rectangles on.
+
+    Returns:
+        list: Entries with "id", "page_number", "rects" and, for crops, the "crop"
+            rectangle or, for rects, the "preview" URL
+    """
+    highlight_mode = highlight_mode or OUTLINE_HIGHLIGHT_MODE
     added_highlights = 0
-    highlighted_pages_set = set()
+    highlighted_rects = {}
     highlighted_images_ids = []
+    document_hash = None
     image_output_dir_key = f'DB/USERS/{userId}/document_outline_sources/{pdf_name}'
 
+    def add_highlight(page, page_number, rect):
+        highlight = page.add_highlight_annot(rect)
+        highlight.set_colors(stroke=HIGHLIGHT_COLOR)
+        highlight.update()
+        highlighted_rects.setdefault(page_number, []).append(fitz.Rect(rect))
+
     try:
         pdf_document = fitz.open(stream=pdf_data, filetype="pdf")
+        # Word index per page, shared by every hint on that page
+        word_indexes = {}
+
+        # Passages located by the local alignment come with their rectangles
+        for aligned in aligned_highlights or []:
+            page_number = aligned['page_number']
+            page = pdf_document.load_page(page_number - 1)
+            for rect in aligned['rects']:
+                try:
+                    add_highlight(page, page_number, fitz.Rect(rect))
+                    added_highlights += 1
+                except (IndexError, ValueError) as e:
+                    log(f"Error highlighting aligned line on page {page_number}: {e}")
+                    continue
 
         for hint in page_hints:
             if not hint:  # Skip None results
@@ -136,19 +208,15 @@ async def highlight_text_in_pdf_with_vision(pdf_data, pdf_name, page_hints, user
                 continue
 
             page = pdf_document.load_page(page_number - 1)
-            words = page.get_text("words")
-
-            start_words = start_text.split()
-            start_length = len(start_words)
+            if page_number not in word_indexes:
+                extracted_page = extracted_document.get_page(page_number) if extracted_document else None
+                page_words = extracted_page.words if extracted_page else page.get_text("words")
+                word_indexes[page_number] = PageWordIndex(page_words)
+            word_index = word_indexes[page_number]
+            words = word_index.words
 
-            start_index = None
-            for i in range(len(words) - start_length + 1):
-                try:
-                    if all(words[i + j][4] == start_words[j] for j in range(start_length)):
-                        start_index = i
-                        break
-                except IndexError:
-                    continue
+            start_length = len(start_text.split())
+            start_index = word_index.find_phrase(start_text)
 
             if start_index is None:
                 log(f"Could not find start text '{start_text}' on page {page_number}")
@@ -157,12 +225,8 @@ async def highlight_text_in_pdf_with_vision(pdf_data, pdf_name, page_hints, user
             # Highlight the start words
             for j in range(start_length):
                 try:
-                    rect = fitz.Rect(words[start_index + j][:4])
-                    highlight = page.add_highlight_annot(rect)
-                    highlight.set_colors(stroke=(1, 1, 0.5))  # yellow
-                    highlight.update()
+                    add_highlight(page, page_number, fitz.Rect(words[start_index + j][:4]))
                     added_highlights += 1
-                    highlighted_pages_set.add(page_number)
                 except (IndexError, ValueError) as e:
                     log(f"Error highlighting word {j} on page {page_number}: {e}")
                     continue
@@ -170,34 +234,59 @@ async def highlight_text_in_pdf_with_vision(pdf_data, pdf_name, page_hints, user
             # Highlight additional words
             for i in range(start_index + start_length, min(start_index + start_length + word_count, len(words))):
                 try:
-                    rect = fitz.Rect(words[i][:4])
-                    highlight = page.add_highlight_annot(rect)
-                    highlight.set_colors(stroke=(1, 1, 0.5))
-                    highlight.update()
+                    add_highlight(page, page_number, fitz.Rect(words[i][:4]))
                     added_highlights += 1
-                    highlighted_pages_set.add(page_number)
                 except (IndexError, ValueError) as e:
                     log(f"Error highlighting additional word {i} on page {page_number}: {e}")
                     continue
 
         # CONCURRENT UPLOADS START HERE
         upload_tasks = []
+        preview_pages = []
 
-        for page_number in highlighted_pages_set:
+        for page_number, rects in sorted(highlighted_rects.items()):
             try:
                 page = pdf_document.load_page(page_number - 1)
-                pix = page.get_pixmap()
+                page_rect = page.rect
+                normalized_rects = [normalize_rect(rect, page_rect) for rect in rects]
+
+                if highlight_mode == "rects":
+                    if document_hash is None:
+                        document_hash = get_document_hash(pdf_data)
+                    highlighted_images_ids.append({
+                        "id": f'{document_id}_PN{page_number}_DOSI',
+                        "page_number": page_number,
+                        "rects": normalized_rects,
+                        "preview": get_render_page_url(document_id, page_number, HIGHLIGHT_PREVIEW_RENDITION)
+                    })
+                    preview_pages.append(page_number)
+                    continue
 
-                image_bytes = BytesIO()
-                image_bytes.write(pix.tobytes())
-                image_bytes.seek(0)
+                if highlight_mode == "crops":
+                    for crop_number, cluster in enumerate(cluster_highlight_rects(rects), start=1):
+                        clip = (cluster + (-HIGHLIGHT_CROP_MARGIN, -HIGHLIGHT_CROP_MARGIN, HIGHLIGHT_CROP_MARGIN, HIGHLIGHT_CROP_MARGIN)) & page_rect
+                        pix = page.get_pixmap(matrix=fitz.Matrix(HIGHLIGHT_CROP_ZOOM, HIGHLIGHT_CROP_ZOOM), clip=clip)
+
+                        image_save_key = f"{image_output_dir_key}/Page_{page_number}_Crop_{crop_number}.png"
+                        highlighted_images_ids.append({
+                            "id": f'{document_id}_PN{page_number}_CR{crop_number}_DOSI',
+                            "page_number": page_number,
+                            "rects": [normalize_rect(rect, page_rect) for rect in rects if rect.intersects(clip)],
+                            "crop": normalize_rect(clip, page_rect)
+                        })
+                        upload_tasks.append(
+                            current_s3_client.save_to_s3(file_data=pix.tobytes("png"), key=image_save_key)
+                        )
+                    log(f'Scheduled upload for Page {page_number} highlight crops')
+                    continue
 
+                pix = page.get_pixmap()
                 image_save_key = f"{image_output_dir_key}/Page_{page_number}.png"
                 image_id = f'{document_id}_PN{page_number}_DOSI'
-                highlighted_images_ids.append({"id": image_id, "page_number": page_number})
+                highlighted_images_ids.append({"id": image_id, "page_number": page_number, "rects": normalized_rects})
 
                 upload_tasks.append(
-                    current_s3_client.save_to_s3(file_data=image_bytes.getvalue(), key=image_save_key)
+                    current_s3_client.save_to_s3(file_data=pix.tobytes("png"), key=image_save_key)
                 )
 
                 log(f'Scheduled upload for Page {page_number} highlighted image')
@@ -205,10 +294,17 @@ async def highlight_text_in_pdf_with_vision(pdf_data, pdf_name, page_hints, user
                 log(f"Error preparing upload for page {page_number}: {e}")
                 continue
 
+        if preview_pages:
+            # Rendered from the unannotated PDF bytes, so the renders are of the clean pages
+            rendition = PREVIEW_RENDITIONS[HIGHLIGHT_PREVIEW_RENDITION]
+            upload_tasks.append(page_render_cache.warm_many(
+                pdf_data, document_hash, preview_pages, rendition["dpi"], rendition["format"]
+            ))
+
         if upload_tasks:
             await asyncio.gather(*upload_tasks, return_exceptions=True)
 
-        log(f'Added {added_highlights} highlights and uploaded {len(highlighted_pages_set)} page images to S3.')
+        log(f'Added {added_highlights} highlights on {len(highlighted_rects)} pages and uploaded {len(upload_tasks)} images to S3 ({highlight_mode} mode).')
         return highlighted_images_ids
 
     except Exception as e:
@@ -216,33 +312,113 @@ async def highlight_text_in_pdf_with_vision(pdf_data, pdf_name, page_hints, user
         return []
 
 
-async def get_and_save_outline_source_images(document_outline_source_pages, document_outline, pdf_data, pdf_name, userId, document_id):
+async def get_and_save_outline_source_images(document_outline_source_pages, document_outline, pdf_data, pdf_name, userId, document_id, extracted_document: Optional[ExtractedDocument] = None):
     log('Request received to save document_outline source highlighted pdf')
 
-    tasks = [
-        process_page_hint(pdf_data, page, document_outline)
-        for page in document_outline_source_pages
-    ]
+    try:
+        if extracted_document is None:
+            extracted_document = await anyio.to_thread.run_sync(extract_document, pdf_data, pdf_name)
+        aligned_highlights = await anyio.to_thread.run_sync(
+            align_outline_to_source_pages, extracted_document, document_outline, document_outline_source_pages
+        )
+    except Exception as e:
+        log(f"Local alignment of the outline failed: {e}")
+        aligned_highlights = []
+
+    aligned_pages = {aligned['page_number'] for aligned in aligned_highlights}
+    unaligned_pages = [page for page in document_outline_source_pages if page not in aligned_pages]
+    log(f'Locally aligned the outline to {len(aligned_pages)} of {len(document_outline_source_pages)} source pages')
+
+    page_hints = []
+    if unaligned_pages and OUTLINE_VISION_FALLBACK:
+        tasks = [
+            process_page_hint(pdf_data, page, document_outline)
+            for page in unaligned_pages
+        ]
 
-    results = await asyncio.gather(*tasks, return_exceptions=True)
-    page_hints = [result for result in results if result and not isinstance(result, Exception)]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        page_hints = [result for result in results if result and not isinstance(result, Exception)]
 
-    highlighted_images_ids = await highlight_text_in_pdf_with_vision(pdf_data, pdf_name, page_hints, userId, document_id)
+    highlighted_images_ids = await highlight_text_in_pdf_with_vision(
+        pdf_data, pdf_name, page_hints, userId, document_id,
+        aligned_highlights=aligned_highlights, extracted_document=extracted_document
+    )
 
     return highlighted_images_ids
 
 
-async def generate_and_save_document_outline(pdf_data, pdf_name, userId, document_id):
-    log(f'Request received to generate document outline')
-    start_time = time()
-    
-    try:
-        pdf_text = extract_text_from_pdf_data(pdf_data=pdf_data, pdf_name=pdf_name)
-    except Exception as e:
-        log(f'Error extracting text from PDF: {e}')
-        return False
-   
-    system_prompt = f'''The user will provide you with the extracted text from a document and your task is to generate a 600 word Document Overview of that document in markdown format. Make sure that you try to outline the following things:
+def split_text_into_page_groups(pdf_text: str, pages_per_group: int = OUTLINE_PAGES_PER_GROUP) -> list:
+    """
+    Split page-marked document text into groups of consecutive pages.
+
+    Args:
+        pdf_text (str): Text produced by ExtractedDocument.to_marked_text, with PAGE NUMBER markers
+        pages_per_group (int): Maximum number of pages in a single group
+
+    Returns:
+        list: Dictionaries with 'first_page', 'last_page' and the marked 'text' of the group
+    """
+    pages = PAGE_BLOCK_PATTERN.findall(pdf_text)
+    page_groups = []
+
+    for group_start in range(0, len(pages), pages_per_group):
+        group = pages[group_start:group_start + pages_per_group]
+        group_text = ''.join(
+            f'PAGE NUMBER {page_number} STARTS HERE\n{page_text}PAGE NUMBER {page_number} ENDS HERE\n'
+            for page_number, page_text in group
+        )
+        page_groups.append({
+            "first_page": int(group[0][0]),
+            "last_page": int(group[-1][0]),
+            "text": group_text
+        })
+
+    return page_groups
+
+
+def split_outline_source_pages(document_outline: str):
+    """
+    Separate the trailing source page list from a generated outline.
+
+    Args:
+        document_outline (str): Model output ending with a list of page numbers
+
+    Returns:
+        tuple: (outline text without the page list, list of source page numbers)
+    """
+    match = re.search(r'```\s*\[(\d+(?:,\s*\d+)*)\]\s*```', document_outline)
+    if match:
+        list_string = match.group(1)
+        outline_source_pages = [int(num.strip()) for num in list_string.split(',')]
+        document_outline = re.sub(r'```\s*\[.*?\]\s*```', '', document_outline, flags=re.DOTALL)
+        return document_outline, outline_source_pages
+
+    if "[" in document_outline and "]" in document_outline:
+        fallback_match = re.search(r'\[\s*(\d+(?:,\s*\d+)*)\s*\]', document_outline)
+        if fallback_match:
+            list_string = fallback_match.group(1)
+            outline_source_pages = [int(num.strip()) for num in list_string.split(',')]
+            document_outline = re.sub(r'\[\s*.*?\s*\]', '', document_outline, flags=re.DOTALL)
+            return document_outline, outline_source_pages
+        log('Unable to extract source page numbers from document outline.')
+    else:
+        log('No page numbers found in document outline.')
+
+    return document_outline, []
+
+
+def build_document_outline_prompt(pdf_name: str, source_description: str = 'the extracted text from a document') -> str:
+    """
+    Build the 600 word document outline prompt shared by the single-shot and map-reduce modes.
+
+    Args:
+        pdf_name (str): Name of the document, used in the outline heading
+        source_description (str): What the user message contains (raw text or page-tagged notes)
+
+    Returns:
+        str: The outline system prompt
+    """
+    return f'''The user will provide you with {source_description} and your task is to generate a 600 word Document Overview of that document in markdown format. Make sure that you try to outline the following things:
     - Factual description and summary of Disease if any is present in the content (Can be Definition, Cause Effect, Characteristics, prognosis)
     - Factual description and summary of Therapy if any is present in the content (Definition, Mechanism, Purpose)
     - Factual description and summary of Clinical study if any is present in the content (Design, Duration, Blinding Study, Outcome)
@@ -298,52 +474,293 @@ async def generate_and_save_document_outline(pdf_data, pdf_name, userId, documen
     ```
     '''
 
+
+async def summarize_page_group(page_group: dict, pdf_name: str, semaphore: asyncio.Semaphore):
+    """
+    Map step of the hierarchical outline: condense one page group into page-tagged notes.
+
+    Args:
+        page_group (dict): A group produced by split_text_into_page_groups
+        pdf_name (str): Name of the document
+        semaphore (asyncio.Semaphore): Caps the number of concurrent LLM calls
+
+    Returns:
+        dict: The group's page range, its 'notes' and the 'source_pages' the notes were drawn from
+    """
+    first_page = page_group["first_page"]
+    last_page = page_group["last_page"]
+
+    system_prompt = f'''The user will provide you with the extracted text of pages {first_page} to {last_page} of the document {pdf_name}. Your task is to write detailed factual notes about these pages that will later be merged with the notes of the other pages into a single document overview. Capture the following things wherever they are present:
+    - Disease (Definition, Cause Effect, Characteristics, prognosis)
+    - Therapy (Definition, Mechanism, Purpose)
+    - Clinical study (Design, Duration, Blinding Study, Outcome)
+    - Treatment (Side Effects, Duration, Serious Side Effects)
+    - Assessment (Tool, Additional tests, Outcome), Insights(results , conclusion , discussion)
+    - All the Important and relevant numbers, claims and quotes
+
+    Follow the rules:
+    1. Write the notes as markdown bullet points
+    2. End every bullet point with the page number it was taken from, like this: (p. page)
+    3. Do not add anything that is not present in the text
+
+    After your notes, insert the numbers of every page your notes were taken from as integers inside a python list in triple markdown quotes like this:
+    ```
+    [page, page, ...]
+    ```
+    '''
+
     messages = [
         {"role": "user", "content": system_prompt},
-        {"role": "user", "content": pdf_text}
+        {"role": "user", "content": page_group["text"]}
     ]
+
+    async with semaphore:
+        group_notes = await use_brain(messages=messages, stream=False, inference="groq", priority="background", call_site="outline")
+
+    return split_tagged_notes(group_notes, first_page, last_page)
+
+
+def split_tagged_notes(notes: str, first_page: int, last_page: int, allowed_pages: Optional[list] = None) -> dict:
+    """
+    Separate page-tagged notes from their trailing source page list.
+
+    Args:
+        notes (str): Model output with (p. N) tags and a trailing page list
+        first_page (int): First page the notes cover
+        last_page (int): Last page the notes cover
+        allowed_pages (list, optional): Pages the model was shown; defaults to the whole range
+
+    Returns:
+        dict: The 'first_page', 'last_page', 'notes' and 'source_pages' of the notes
+    """
+    notes, source_pages = split_outline_source_pages(notes)
+    if not source_pages:
+        source_pages = [int(page) for page in re.findall(r'\(p\.\s*(\d+)\)', notes)]
+
+    # Keep provenance inside the pages the model was actually shown
+    if allowed_pages is None:
+        source_pages = {page for page in source_pages if first_page <= page <= last_page}
+    else:
+        source_pages = set(source_pages) & set(allowed_pages)
+
+    return {
+        "first_page": first_page,
+        "last_page": last_page,
+        "notes": notes.strip(),
+        "source_pages": sorted(source_pages)
+    }
+
+
+def format_group_notes(group_summaries: list) -> str:
+    """Join group notes into one page-tagged text, each block headed by its page range."""
+    return ''.join(
+        f"NOTES FOR PAGES {summary['first_page']} TO {summary['last_page']} (SOURCE PAGES: {summary['source_pages']})\n"
+        f"{summary['notes']}\n\n"
+        for summary in group_summaries
+    )
+
+
+async def merge_group_notes(group_summaries: list, pdf_name: str, semaphore: asyncio.Semaphore) -> dict:
+    """
+    Intermediate reduce step: condense the notes of consecutive page groups into one set of notes.
+
+    Args:
+        group_summaries (list): Consecutive results of summarize_page_group or merge_group_notes
+        pdf_name (str): Name of the document
+        semaphore (asyncio.Semaphore): Caps the number of concurrent LLM calls
+
+    Returns:
+        dict: Notes covering the combined page range, in the summarize_page_group format
+    """
+    first_page = group_summaries[0]["first_page"]
+    last_page = group_summaries[-1]["last_page"]
+    mapped_source_pages = sorted({page for summary in group_summaries for page in summary["source_pages"]})
+
+    system_prompt = f'''The user will provide you with page-tagged notes about pages {first_page} to {last_page} of the document {pdf_name}. Your task is to condense them into a single set of detailed factual notes that will later be merged with the notes of the other pages into a single document overview. Keep every important number, claim and quote.
+
+    Follow the rules:
+    1. Write the notes as markdown bullet points
+    2. End every bullet point with the page numbers it was taken from, copied from the notes, like this: (p. page)
+    3. Do not add anything that is not present in the notes
+
+    After your notes, insert the numbers of every page your notes were taken from as integers inside a python list in triple markdown quotes like this:
+    ```
+    [page, page, ...]
+    ```
+    '''
+
+    messages = [
+        {"role": "user", "content": system_prompt},
+        {"role": "user", "content": format_group_notes(group_summaries)}
+    ]
+
+    async with semaphore:
+        merged_notes = await use_brain(messages=messages, stream=False, inference="groq", priority="background", call_site="outline")
+
+    merged = split_tagged_notes(merged_notes, first_page, last_page, allowed_pages=mapped_source_pages)
+    # The merged notes can only cite pages the group notes cited; fall back to them if they cite none
+    merged["source_pages"] = merged["source_pages"] or mapped_source_pages
+    return merged
+
+
+async def reduce_group_notes(group_summaries: list, pdf_name: str, semaphore: asyncio.Semaphore) -> list:
+    """
+    Merge group notes in batches until they fit in a single outline prompt.
+
+    Args:
+        group_summaries (list): Results of summarize_page_group, in page order
+        pdf_name (str): Name of the document
+        semaphore (asyncio.Semaphore): Caps the number of concurrent LLM calls
+
+    Returns:
+        list: Notes in page order whose joined text is within OUTLINE_REDUCE_MAX_PROMPT_TOKENS
+    """
+    level = 0
+    while len(group_summaries) > 1 and estimate_prompt_tokens(
+        [{"content": format_group_notes(group_summaries)}]
+    ) > OUTLINE_REDUCE_MAX_PROMPT_TOKENS:
+        level += 1
+        batches = [
+            group_summaries[batch_start:batch_start + OUTLINE_NOTES_PER_MERGE]
+            for batch_start in range(0, len(group_summaries), OUTLINE_NOTES_PER_MERGE)
+        ]
+        results = await asyncio.gather(
+            *[merge_group_notes(batch, pdf_name, semaphore) for batch in batches],
+            return_exceptions=True
+        )
+
+        merged_summaries = []
+        for batch, result in zip(batches, results):
+            if isinstance(result, Exception):
+                log(f"Failed to merge notes for pages {batch[0]['first_page']}-{batch[-1]['last_page']}: {result}")
+                continue
+            merged_summaries.append(result)
+
+        if not merged_summaries:
+            raise Exception("No group notes could be merged")
+
+        log(f'Merged {len(group_summaries)} group notes into {len(merged_summaries)} at reduce level {level}')
+        group_summaries = merged_summaries
+
+    return group_summaries
+
+
+async def generate_hierarchical_document_outline(pdf_text: str, pdf_name: str):
+    """
+    Generate a document outline in two steps for documents too long for a single prompt.
+
+    Page groups are summarized in parallel (map) and the page-tagged notes are then
+    merged into the regular 600 word outline format (reduce). Notes too long for one
+    prompt are first merged in batches, level by level, so the final prompt stays bounded.
+
+    Args:
+        pdf_text (str): Text produced by ExtractedDocument.to_marked_text
+        pdf_name (str): Name of the document
+
+    Returns:
+        tuple: (document outline, list of source page numbers)
+    """
+    start_time = time()
+    page_groups = split_text_into_page_groups(pdf_text)
+    semaphore = asyncio.Semaphore(OUTLINE_MAX_CONCURRENT_GROUPS)
+
+    results = await asyncio.gather(
+        *[summarize_page_group(page_group, pdf_name, semaphore) for page_group in page_groups],
+        return_exceptions=True
+    )
+
+    group_summaries = []
+    for page_group, result in zip(page_groups, results):
+        if isinstance(result, Exception):
+            log(f"Failed to summarize pages {page_group['first_page']}-{page_group['last_page']}: {result}")
+            continue
+        group_summaries.append(result)
+
+    if not group_summaries:
+        raise Exception("No page group could be summarized")
+
+    log(f'Summarized {len(group_summaries)} of {len(page_groups)} page groups in {time() - start_time} seconds')
+
+    group_summaries = await reduce_group_notes(group_summaries, pdf_name, semaphore)
+    notes_text = format_group_notes(group_summaries)
+    mapped_source_pages = sorted({page for summary in group_summaries for page in summary['source_pages']})
+
+    system_prompt = build_document_outline_prompt(
+        pdf_name=pdf_name,
+        source_description='page-tagged notes that were written for consecutive page groups of a document, where every note ends with the page it came from like (p. 3),'
+    )
+    messages = [
+        {"role": "user", "content": system_prompt},
+        {"role": "user", "content": notes_text}
+    ]
+
+    document_outline = await use_brain(messages=messages, stream=False, inference="groq", priority="background", call_site="outline")
+    document_outline, outline_source_pages = split_outline_source_pages(document_outline)
+
+    # The reduce step can only cite pages the map step saw; fall back to them if it cites none
+    outline_source_pages = [page for page in outline_source_pages if page in mapped_source_pages] or mapped_source_pages
+
+    return document_outline, outline_source_pages
+
+
+async def generate_and_save_document_outline(pdf_data, pdf_name, userId, document_id, hierarchical: Optional[bool] = None, extracted_document: Optional[ExtractedDocument] = None):
+    """
+    Generate the document outline, highlight its source pages and save it to the DB.
+
+    Args:
+        pdf_data (bytes): The PDF file content as bytes
+        pdf_name (str): Name of the PDF file
+        userId (str): User identifier
+        document_id (str): Unique identifier for the document
+        hierarchical (Optional[bool]): Force the map-reduce mode on or off. By default it is
+            used when the extracted text exceeds OUTLINE_SINGLE_SHOT_MAX_CHARS
+        extracted_document (Optional[ExtractedDocument]): Text already extracted from the PDF,
+            extracted here when not given
+
+    Returns:
+        bool: True if the outline was saved
+    """
+    log(f'Request received to generate document outline')
+    start_time = time()
+    
+    try:
+        if extracted_document is None:
+            extracted_document = await anyio.to_thread.run_sync(extract_document, pdf_data, pdf_name)
+        pdf_text = extracted_document.to_marked_text()
+    except Exception as e:
+        log(f'Error extracting text from PDF: {e}')
+        return False
+
+    if hierarchical is None:
+        hierarchical = len(pdf_text) > OUTLINE_SINGLE_SHOT_MAX_CHARS
+
     highlighted_images_ids = []
 
     try:
-        # Fixed: Properly handle the async call
-        document_outline = await use_brain(messages=messages, stream=False, inference="groq")
-        print(document_outline)
+        if hierarchical:
+            log(f'Generating hierarchical document outline for {len(pdf_text)} characters of text')
+            document_outline, outline_source_pages = await generate_hierarchical_document_outline(pdf_text, pdf_name)
+        else:
+            messages = [
+                {"role": "user", "content": build_document_outline_prompt(pdf_name=pdf_name)},
+                {"role": "user", "content": pdf_text}
+            ]
+            document_outline = await use_brain(messages=messages, stream=False, inference="groq", priority="background", call_site="outline")
+            document_outline, outline_source_pages = split_outline_source_pages(document_outline)
 
         log(f'Document text outline generated in {time() - start_time} seconds')
 
-        # Extract page numbers from document_outline with better error handling
         try:
-            match = re.search(r'```\s*\[(\d+(?:,\s*\d+)*)\]\s*```', document_outline)
-            if match:
-                list_string = match.group(1)
-                outline_source_pages = [int(num.strip()) for num in list_string.split(',')]
-                document_outline = re.sub(r'```\s*\[.*?\]\s*```', '', document_outline, flags=re.DOTALL)
+            if outline_source_pages:
                 highlighted_images_ids = await get_and_save_outline_source_images(
                     document_outline_source_pages=outline_source_pages,
                     document_outline=document_outline,
                     pdf_data=pdf_data,
                     pdf_name=pdf_name,
                     userId=userId,
-                    document_id=document_id
+                    document_id=document_id,
+                    extracted_document=extracted_document
                 )
-            elif "[" in document_outline and "]" in document_outline:
-                fallback_match = re.search(r'\[\s*(\d+(?:,\s*\d+)*)\s*\]', document_outline)
-                if fallback_match:
-                    list_string = fallback_match.group(1)
-                    outline_source_pages = [int(num.strip()) for num in list_string.split(',')]
-                    document_outline = re.sub(r'\[\s*.*?\s*\]', '', document_outline, flags=re.DOTALL)
-                    highlighted_images_ids = await get_and_save_outline_source_images(
-                        document_outline_source_pages=outline_source_pages,
-                        document_outline=document_outline,
-                        pdf_data=pdf_data,
-                        pdf_name=pdf_name,
-                        userId=userId,
-                        document_id=document_id
-                    )
-                else:
-                    log('Unable to extract source page numbers from document outline.')
-            else:
-                log('No page numbers found in document outline.')
         except Exception as e:
             log(f'Error processing page numbers: {e}')
 
@@ -370,5 +787,3 @@ async def generate_and_save_document_outline(pdf_data, pdf_name, userId, documen
     log(f"The Function generate_and_save_document_outline was started at {start_time} and completed in {processing_time_taken} seconds")
     
     return True
-
-
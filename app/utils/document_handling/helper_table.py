@@ -0,0 +1,252 @@
+"""
+Packed Highlight Helper Table
+
+Binary, page-indexed storage of the highlight helper table (every text line of a
+document with its bounding box), replacing the CSV export.
+
+Layout:
+    magic (4 bytes) | header length (uint32, little endian) | header JSON | body
+
+The header lists, per page, where its segment starts in the body and how long
+its coordinates and its text are. A page segment is the line coordinates as
+little-endian float32 (n x 4) followed by the line texts joined by newlines. A
+reader fetches the header and then one page segment with a ranged GET, instead
+of downloading and parsing the whole table.
+
+Documents ingested before the packed format only have the CSV export; their
+table is packed from the CSV and stored next to it on first access.
+"""
+
+import csv
+import io
+import json
+import struct
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from botocore.exceptions import ClientError
+
+from services.s3host import current_s3_client
+from utils.document_handling.logger import log
+
+HELPER_TABLE_MAGIC = b"HHT1"
+HELPER_TABLE_PREFIX = struct.Struct("<4sI")
+# Bytes read with the first ranged GET; covers the header of documents up to a few hundred pages
+HELPER_TABLE_HEADER_PROBE_BYTES = 16384
+HELPER_TABLE_HEADER_CACHE_SIZE = 256
+COORDINATE_DTYPE = np.dtype("<f4")
+
+
+def pack_helper_table(rows: List[Dict]) -> bytes:
+    """
+    Pack helper table rows into the page-indexed binary layout.
+
+    Args:
+        rows (List[Dict]): Rows with "Page Number", "Line Number", "Content" and "Coordinates"
+
+    Returns:
+        bytes: The packed table
+    """
+    page_rows: Dict[int, List[Dict]] = {}
+    for row in rows:
+        page_rows.setdefault(row["Page Number"], []).append(row)
+
+    pages = []
+    segments = []
+    offset = 0
+    for page_number in sorted(page_rows):
+        lines = sorted(page_rows[page_number], key=lambda row: row["Line Number"])
+        coordinates = np.asarray([row["Coordinates"] for row in lines], dtype=COORDINATE_DTYPE).tobytes()
+        text = "\n".join(row["Content"].replace("\n", " ") for row in lines).encode("utf-8")
+        pages.append({
+            "page_number": page_number,
+            "offset": offset,
+            "line_count": len(lines),
+            "coordinates_length": len(coordinates),
+            "text_length": len(text),
+        })
+        segments.append(coordinates + text)
+        offset += len(coordinates) + len(text)
+
+    header = json.dumps({"version": 1, "line_count": len(rows), "pages": pages}, separators=(",", ":")).encode("utf-8")
+    return HELPER_TABLE_PREFIX.pack(HELPER_TABLE_MAGIC, len(header)) + header + b"".join(segments)
+
+
+def parse_legacy_helper_table(data: bytes) -> List[Dict]:
+    """
+    Rows of a helper table from its legacy CSV export.
+
+    Args:
+        data (bytes): The CSV, with "Page Number", "Line Number", "Content" and
+            "Coordinates" columns, coordinates written as "(x0, y0, x1, y1)"
+
+    Returns:
+        List[Dict]: The rows, in the layout pack_helper_table takes
+    """
+    return [
+        {
+            "Page Number": int(row["Page Number"]),
+            "Line Number": int(row["Line Number"]),
+            "Content": row["Content"],
+            "Coordinates": tuple(float(value) for value in row["Coordinates"].strip("()").split(","))
+        }
+        for row in csv.DictReader(io.StringIO(data.decode("utf-8")))
+    ]
+
+
+def get_legacy_helper_table_key(key: str) -> str:
+    """Key of the CSV export a packed helper table replaces."""
+    return key[:-len(".bin")] + ".csv" if key.endswith(".bin") else key + ".csv"
+
+
+def parse_header_length(data: bytes) -> int:
+    magic, header_length = HELPER_TABLE_PREFIX.unpack_from(data)
+    if magic != HELPER_TABLE_MAGIC:
+        raise ValueError("Not a packed highlight helper table")
+    return header_length
+
+
+def parse_header(data: bytes) -> Tuple[Dict, int]:
+    """
+    Read the header of a packed table from its first bytes.
+
+    Returns:
+        Tuple[Dict, int]: The header, with its pages indexed by page number, and the offset of the body
+    """
+    header_length = parse_header_length(data)
+    body_start = HELPER_TABLE_PREFIX.size + header_length
+    if len(data) < body_start:
+        raise ValueError("Incomplete packed highlight helper table header")
+    header = json.loads(data[HELPER_TABLE_PREFIX.size:body_start])
+    header["pages"] = {page["page_number"]: page for page in header["pages"]}
+    return header, body_start
+
+
+def unpack_page(page: Dict, segment: bytes) -> List[Dict]:
+    """Rows of one page from its segment."""
+    coordinates = np.frombuffer(segment[:page["coordinates_length"]], dtype=COORDINATE_DTYPE).reshape(-1, 4)
+    text = segment[page["coordinates_length"]:page["coordinates_length"] + page["text_length"]].decode("utf-8")
+    contents = text.split("\n") if page["line_count"] else []
+    return [
+        {
+            "Page Number": page["page_number"],
+            "Line Number": line_number,
+            "Content": content,
+            "Coordinates": tuple(float(value) for value in box)
+        }
+        for line_number, (content, box) in enumerate(zip(contents, coordinates), start=1)
+    ]
+
+
+def unpack_helper_table(data: bytes, page_numbers: Optional[List[int]] = None) -> List[Dict]:
+    """
+    Rows of a whole packed table held in memory.
+
+    Args:
+        data (bytes): The packed table
+        page_numbers (List[int], optional): Pages to read, all pages by default
+    """
+    header, body_start = parse_header(data)
+    wanted = sorted(header["pages"]) if page_numbers is None else [page for page in page_numbers if page in header["pages"]]
+    rows = []
+    for page_number in wanted:
+        page = header["pages"][page_number]
+        start = body_start + page["offset"]
+        rows.extend(unpack_page(page, data[start:start + page["coordinates_length"] + page["text_length"]]))
+    return rows
+
+
+class HelperTableReader:
+    """
+    Reads single pages of packed helper tables stored in S3 with ranged GETs.
+
+    Headers are cached per key, so a page lookup after the first one on a
+    document costs a single small read.
+    """
+
+    def __init__(self, s3_client, header_cache_size: int = HELPER_TABLE_HEADER_CACHE_SIZE):
+        self.s3_client = s3_client
+        self.header_cache_size = header_cache_size
+        self._headers: "OrderedDict[str, Tuple[Dict, int]]" = OrderedDict()
+
+    async def _pack_legacy_table(self, key: str) -> bytes:
+        legacy_key = get_legacy_helper_table_key(key)
+        legacy_table = await self.s3_client.get_object_if_exists(legacy_key)
+        if legacy_table is None:
+            raise FileNotFoundError(f"No highlight helper table at {key}")
+
+        table = pack_helper_table(parse_legacy_helper_table(legacy_table))
+        await self.s3_client.save_to_s3(table, key)
+        log(f"Packed legacy highlight helper table {legacy_key} into {key}")
+        return table
+
+    async def get_header(self, key: str) -> Tuple[Dict, int]:
+        """
+        Header of a packed helper table and the offset of its body.
+
+        Raises:
+            FileNotFoundError: If the document has neither a packed nor a CSV helper table
+        """
+        cached = self._headers.get(key)
+        if cached is not None:
+            self._headers.move_to_end(key)
+            return cached
+
+        try:
+            data = await self.s3_client.get_object_range(key, 0, HELPER_TABLE_HEADER_PROBE_BYTES - 1)
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in ("NoSuchKey", "404"):
+                raise
+            data = await self._pack_legacy_table(key)
+
+        body_start = HELPER_TABLE_PREFIX.size + parse_header_length(data)
+        if len(data) < body_start:
+            data += await self.s3_client.get_object_range(key, len(data), body_start - 1)
+
+        header = parse_header(data)
+        self._headers[key] = header
+        while len(self._headers) > self.header_cache_size:
+            self._headers.popitem(last=False)
+        return header
+
+    async def get_page_rows(self, key: str, page_number: int) -> List[Dict]:
+        """
+        Lines of one page of a packed helper table.
+
+        Args:
+            key (str): S3 key of the packed table
+            page_number (int): 1-based page number
+
+        Returns:
+            List[Dict]: The page's rows, empty if the page has no text lines
+        """
+        header, body_start = await self.get_header(key)
+        page = header["pages"].get(page_number)
+        if not page or not page["line_count"]:
+            return []
+
+        start = body_start + page["offset"]
+        end = start + page["coordinates_length"] + page["text_length"] - 1
+        segment = await self.s3_client.get_object_range(key, start, end)
+        return unpack_page(page, segment)
+
+    async def get_rows(self, key: str) -> List[Dict]:
+        """Every row of a packed helper table, read with the header and one ranged GET of the body."""
+        header, body_start = await self.get_header(key)
+        body_length = sum(page["coordinates_length"] + page["text_length"] for page in header["pages"].values())
+        if not body_length:
+            return []
+
+        body = await self.s3_client.get_object_range(key, body_start, body_start + body_length - 1)
+        rows = []
+        for page_number in sorted(header["pages"]):
+            page = header["pages"][page_number]
+            rows.extend(unpack_page(page, body[page["offset"]:page["offset"] + page["coordinates_length"] + page["text_length"]]))
+        return rows
+
+    def invalidate(self, key: str) -> None:
+        self._headers.pop(key, None)
+
+
+helper_table_reader = HelperTableReader(current_s3_client)
@@ -0,0 +1,182 @@
+"""
+Page Rasterization
+
+Renders PDF pages, and tiles of pages, to encoded images. Kept free of database
+and storage imports, as it is the module loaded by the render worker processes.
+"""
+
+import io
+import math
+from typing import List, Tuple
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+RENDER_JPEG_QUALITY = 85
+RENDER_WEBP_QUALITY = 80
+
+
+def encode_pixmap(pix, image_format: str) -> bytes:
+    """Encode a pixmap as "png", "jpeg" or "webp"."""
+    if image_format == "jpeg":
+        return pix.tobytes("jpeg", jpg_quality=RENDER_JPEG_QUALITY)
+    if image_format == "webp":
+        # MuPDF has no WebP writer
+        image = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+        buffer = io.BytesIO()
+        image.save(buffer, format="WEBP", quality=RENDER_WEBP_QUALITY)
+        return buffer.getvalue()
+    return pix.tobytes("png")
+
+
+def get_render_size(page_rect, dpi: int) -> Tuple[int, int]:
+    """Pixel width and height of a page rendered at `dpi`."""
+    zoom = dpi / 72
+    pixel_rect = fitz.Rect(page_rect).transform(fitz.Matrix(zoom, zoom)).irect
+    return pixel_rect.width, pixel_rect.height
+
+
+def get_tile_grid(page_rect, dpi: int, tile_size: int) -> Tuple[int, int]:
+    """Columns and rows of `tile_size` pixel tiles covering a page rendered at `dpi`."""
+    width, height = get_render_size(page_rect, dpi)
+    return math.ceil(width / tile_size), math.ceil(height / tile_size)
+
+
+def _load_page(pdf_document, page_number: int):
+    if not 1 <= page_number <= len(pdf_document):
+        raise ValueError(f"Page {page_number} out of range, the document has {len(pdf_document)} pages")
+    return pdf_document.load_page(page_number - 1)
+
+
+def render_pages(pdf_content: bytes, page_numbers: List[int], dpi: int, image_format: str = "png") -> List[bytes]:
+    """
+    Render pages of a PDF, opening it once.
+
+    Args:
+        pdf_content (bytes): The PDF file content as bytes
+        page_numbers (List[int]): 1-based page numbers
+        dpi (int): Render resolution
+        image_format (str): "png", "jpeg" or "webp"
+
+    Returns:
+        List[bytes]: The encoded images, in the order of page_numbers
+
+    Raises:
+        ValueError: If the document has no such page
+    """
+    pdf_document = fitz.open(stream=pdf_content, filetype="pdf")
+    try:
+        return [
+            encode_pixmap(_load_page(pdf_document, page_number).get_pixmap(dpi=dpi), image_format)
+            for page_number in page_numbers
+        ]
+    finally:
+        pdf_document.close()
+
+
+def render_page(pdf_content: bytes, page_number: int, dpi: int, image_format: str = "png") -> bytes:
+    """Render one page of a PDF; see render_pages."""
+    return render_pages(pdf_content, [page_number], dpi, image_format)[0]
+
+
+def render_page_images(pdf_content: bytes, page_numbers: List[int], dpi: int) -> List[Image.Image]:
+    """
+    Render pages of a PDF to RGB PIL images, without encoding them.
+
+    Args:
+        pdf_content (bytes): The PDF file content as bytes
+        page_numbers (List[int]): 1-based page numbers
+        dpi (int): Render resolution
+
+    Returns:
+        List[Image.Image]: The page images, in the order of page_numbers
+    """
+    pdf_document = fitz.open(stream=pdf_content, filetype="pdf")
+    try:
+        images = []
+        for page_number in page_numbers:
+            pix = _load_page(pdf_document, page_number).get_pixmap(dpi=dpi, alpha=False)
+            images.append(Image.frombytes("RGB", (pix.width, pix.height), pix.samples))
+        return images
+    finally:
+        pdf_document.close()
+
+
+def get_region_clip(page_rect, box: Tuple[float, float, float, float], boxes_dpi: int, margin: float = 0):
+    """
+    Clip rectangle of a region measured in pixels of the page rendered at boxes_dpi.
+
+    Args:
+        page_rect (fitz.Rect): The page's rectangle, in points
+        box (Tuple): x1, y1, x2, y2 of the region, in pixels
+        boxes_dpi (int): Resolution the box was measured at
+        margin (float): Points added around the region
+
+    Returns:
+        fitz.Rect: The region in page points, with the margin, clamped to the page
+    """
+    scale = 72 / boxes_dpi
+    x1, y1, x2, y2 = box
+    clip = fitz.Rect(x1 * scale - margin, y1 * scale - margin, x2 * scale + margin, y2 * scale + margin)
+    origin = page_rect.top_left
+    return (clip + (origin.x, origin.y, origin.x, origin.y)) & page_rect
+
+
+def render_regions(
+    pdf_content: bytes,
+    page_number: int,
+    boxes: List[Tuple[float, float, float, float]],
+    boxes_dpi: int,
+    dpi: int,
+    image_format: str = "png",
+    margin: float = 0
+) -> List[bytes]:
+    """
+    Render regions of a page, each clipped out of the page at `dpi`.
+
+    Args:
+        pdf_content (bytes): The PDF file content as bytes
+        page_number (int): 1-based page number
+        boxes (List[Tuple]): x1, y1, x2, y2 regions, in pixels of the page rendered at boxes_dpi
+        boxes_dpi (int): Resolution the boxes were measured at
+        dpi (int): Render resolution of the regions
+        image_format (str): "png", "jpeg" or "webp"
+        margin (float): Points added around each region, to make up for imprecise boxes
+
+    Returns:
+        List[bytes]: The encoded region images, in the order of boxes
+
+    Raises:
+        ValueError: If the document has no such page
+    """
+    pdf_document = fitz.open(stream=pdf_content, filetype="pdf")
+    try:
+        page = _load_page(pdf_document, page_number)
+        return [
+            encode_pixmap(page.get_pixmap(dpi=dpi, clip=get_region_clip(page.rect, box, boxes_dpi, margin)), image_format)
+            for box in boxes
+        ]
+    finally:
+        pdf_document.close()
+
+
+def render_tile(pdf_content: bytes, page_number: int, dpi: int, tile_size: int, column: int, row: int, image_format: str = "png") -> bytes:
+    """
+    Render one tile of a page: the `tile_size` pixel square at `column`, `row` of
+    the page rendered at `dpi`. Tiles on the right and bottom edges are cut to the page.
+
+    Raises:
+        ValueError: If the document has no such page or the tile is outside it
+    """
+    pdf_document = fitz.open(stream=pdf_content, filetype="pdf")
+    try:
+        page = _load_page(pdf_document, page_number)
+        side = tile_size * 72 / dpi
+        origin = page.rect.top_left
+        clip = fitz.Rect(column * side, row * side, (column + 1) * side, (row + 1) * side) + (origin.x, origin.y, origin.x, origin.y)
+        clip &= page.rect
+        if column < 0 or row < 0 or clip.is_empty:
+            raise ValueError(f"Tile {column},{row} is outside page {page_number} at {dpi} DPI")
+        return encode_pixmap(page.get_pixmap(dpi=dpi, clip=clip), image_format)
+    finally:
+        pdf_document.close()
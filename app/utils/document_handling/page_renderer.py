@@ -0,0 +1,292 @@
+"""
+On-Demand Page Rendering
+
+Pages are rendered when they are first requested instead of all at ingest. A
+render is addressed by the hash of the PDF content, the page, the resolution and
+the image format, and is cached in two tiers:
+
+- memory: an LRU of rendered images bounded by their total size
+- S3: every render is stored under its content-addressed key, so it is only
+  ever produced once, whichever worker renders it
+
+Every page preview is offered in the named PREVIEW_RENDITIONS (a thumbnail, a
+compressed screen-size image, the full-size PNG) and optionally as a tile
+pyramid for zooming. Only the first-page thumbnail and the first pages are
+rendered eagerly at ingest. Batches of renders run in a pool of worker processes, since rendering
+holds the GIL, and are uploaded with bounded concurrency.
+"""
+
+import asyncio
+import hashlib
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from time import monotonic
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+from configs.config import AppInfo
+from models.preview import preview_repo
+from services.document_encoder import DocumentEncoder
+from services.s3host import current_s3_client
+from utils.document_handling.logger import log
+from utils.document_handling.page_rasterizer import render_page, render_pages, render_tile
+
+PREVIEW_DPI = 150
+THUMBNAIL_DPI = 40
+MIN_RENDER_DPI = 36
+MAX_RENDER_DPI = 300
+RENDER_MEDIA_TYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+# Named renditions recorded for every page preview and selectable by clients
+PREVIEW_RENDITIONS = {
+    "thumbnail": {"dpi": THUMBNAIL_DPI, "format": "jpeg"},
+    "screen": {"dpi": 110, "format": "webp"},
+    "full": {"dpi": PREVIEW_DPI, "format": "png"},
+}
+DEFAULT_PREVIEW_RENDITION = "screen"
+# Hi-res tile pyramid for zooming; one level per DPI, tiles are rendered on request
+PREVIEW_TILES_ENABLED = False
+PREVIEW_TILE_SIZE = 512
+PREVIEW_TILE_LEVEL_DPIS = (150, 300)
+PREVIEW_TILE_FORMAT = "webp"
+RENDER_CACHE_MAX_BYTES = 128 * 1024 * 1024
+# Source PDFs kept in memory, so rendering consecutive pages downloads the PDF once
+RENDER_PDF_CACHE_SIZE = 4
+RENDER_WORKERS = min(4, os.cpu_count() or 1)
+# Pages a render worker renders per task; smaller batches start uploading sooner
+RENDER_BATCH_PAGES = 8
+# Fewer pages than this render on a thread; shipping the PDF to worker processes costs more
+RENDER_POOL_MIN_PAGES = RENDER_BATCH_PAGES
+RENDER_UPLOAD_CONCURRENCY = 16
+
+
+def get_document_hash(pdf_content: bytes) -> str:
+    """SHA-256 hex digest of a PDF, the content address of its renders."""
+    return hashlib.sha256(pdf_content).hexdigest()
+
+
+def get_render_page_url(document_id: str, page_number: int, rendition: str = DEFAULT_PREVIEW_RENDITION) -> str:
+    """API path rendering a rendition of a page of a document."""
+    query = urlencode({"document_id": document_id, "page_number": page_number, "rendition": rendition})
+    return f"{AppInfo().API_V1_STR}/render-page?{query}"
+
+
+class PageRenderCache:
+    """
+    Two-tier (memory, S3) cache of rendered pages.
+
+    Concurrent requests for the same render share one render.
+
+    Attributes:
+        max_bytes: Memory budget for cached renders
+        memory_hits: Renders served from memory
+        s3_hits: Renders loaded from S3
+        renders: Renders produced for requests
+        prewarmed: Renders produced ahead of requests at ingest
+        evictions: Renders evicted from memory
+        render_seconds: Total time spent rendering
+    """
+
+    def __init__(self, s3_client, max_bytes: int = RENDER_CACHE_MAX_BYTES):
+        self.s3_client = s3_client
+        self.max_bytes = max_bytes
+        self.memory_hits = 0
+        self.s3_hits = 0
+        self.renders = 0
+        self.prewarmed = 0
+        self.evictions = 0
+        self.render_seconds = 0.0
+        self._images: "OrderedDict[str, bytes]" = OrderedDict()
+        self._bytes = 0
+        self._pdfs: "OrderedDict[str, bytes]" = OrderedDict()
+        self._document_hashes: Dict[str, str] = {}
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _remember(self, key: str, image: bytes) -> None:
+        if key in self._images:
+            return
+        self._images[key] = image
+        self._bytes += len(image)
+        while self._bytes > self.max_bytes and len(self._images) > 1:
+            _, evicted = self._images.popitem(last=False)
+            self._bytes -= len(evicted)
+            self.evictions += 1
+
+    async def _get_pdf(self, document_id: str) -> bytes:
+        pdf_content = self._pdfs.get(document_id)
+        if pdf_content is None:
+            pdf_content, _ = await self.s3_client.get_document(document_id)
+            self._pdfs[document_id] = pdf_content
+            while len(self._pdfs) > RENDER_PDF_CACHE_SIZE:
+                self._pdfs.popitem(last=False)
+        else:
+            self._pdfs.move_to_end(document_id)
+        return pdf_content
+
+    async def get_document_hash(self, document_id: str) -> str:
+        document_hash = self._document_hashes.get(document_id)
+        if document_hash is None:
+            document_hash = await preview_repo.get_document_hash(document_id)
+            if document_hash is None:
+                # Documents ingested before renders were content-addressed
+                document_hash = get_document_hash(await self._get_pdf(document_id))
+            self._document_hashes[document_id] = document_hash
+        return document_hash
+
+    async def get(
+        self,
+        document_id: str,
+        page_number: int,
+        dpi: int = PREVIEW_DPI,
+        image_format: str = "png",
+        tile: Optional[Tuple[int, int, int]] = None
+    ) -> Tuple[bytes, str]:
+        """
+        A rendered page or page tile, from memory, from S3 or rendered now.
+
+        Args:
+            document_id (str): The document's unique identifier
+            page_number (int): 1-based page number
+            dpi (int): Render resolution
+            image_format (str): "png", "jpeg" or "webp"
+            tile (Tuple[int, int, int], optional): (tile_size, column, row) to render a tile of the page
+
+        Returns:
+            Tuple[bytes, str]: The encoded image and its content-addressed key
+        """
+        document_hash = await self.get_document_hash(document_id)
+        key = DocumentEncoder.get_page_render_file_key(document_hash, page_number, dpi, image_format, tile)
+
+        image = self._images.get(key)
+        if image is not None:
+            self._images.move_to_end(key)
+            self.memory_hits += 1
+            return image, key
+
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = asyncio.ensure_future(self._load(key, document_id, page_number, dpi, image_format, tile))
+            self._pending[key] = pending
+        return await asyncio.shield(pending), key
+
+    async def _load(self, key: str, document_id: str, page_number: int, dpi: int, image_format: str, tile: Optional[Tuple[int, int, int]]) -> bytes:
+        try:
+            image = await self.s3_client.get_object_if_exists(key)
+            if image is not None:
+                self.s3_hits += 1
+            else:
+                pdf_content = await self._get_pdf(document_id)
+                image = await self._render(pdf_content, key, page_number, dpi, image_format, tile)
+                self.renders += 1
+            self._remember(key, image)
+            return image
+        finally:
+            self._pending.pop(key, None)
+
+    async def _render(self, pdf_content: bytes, key: str, page_number: int, dpi: int, image_format: str, tile: Optional[Tuple[int, int, int]] = None) -> bytes:
+        start_time = monotonic()
+        if tile:
+            image = await asyncio.to_thread(render_tile, pdf_content, page_number, dpi, *tile, image_format)
+        else:
+            image = await asyncio.to_thread(render_page, pdf_content, page_number, dpi, image_format)
+        self.render_seconds += monotonic() - start_time
+        await self.s3_client.save_to_s3(image, key)
+        log(f"Rendered page {page_number} at {dpi} DPI as {image_format}: {key}")
+        return image
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # Forking a process running the event loop and its client threads is unsafe
+            self._pool = ProcessPoolExecutor(max_workers=RENDER_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    async def warm_many(self, pdf_content: bytes, document_hash: str, page_numbers: List[int], dpi: int, image_format: str = "png") -> List[str]:
+        """
+        Render pages of a document being ingested ahead of their first request.
+
+        Pages already rendered, in memory or in S3, are skipped. More than
+        RENDER_POOL_MIN_PAGES others are split into batches for the render workers,
+        fewer are rendered on a thread; each batch is uploaded as soon as it is rendered.
+
+        Returns:
+            List[str]: The content-addressed keys of the renders, in the order of page_numbers
+        """
+        keys = {
+            page_number: DocumentEncoder.get_page_render_file_key(document_hash, page_number, dpi, image_format)
+            for page_number in page_numbers
+        }
+        semaphore = asyncio.Semaphore(RENDER_UPLOAD_CONCURRENCY)
+
+        async def load_existing(page_number: int) -> Optional[bytes]:
+            async with semaphore:
+                return await self.s3_client.get_object_if_exists(keys[page_number])
+
+        async def upload(page_number: int, image: bytes) -> None:
+            async with semaphore:
+                await self.s3_client.save_to_s3(image, keys[page_number])
+            self._remember(keys[page_number], image)
+
+        # The same PDF may have been ingested before
+        missing = [page_number for page_number in page_numbers if keys[page_number] not in self._images]
+        existing = await asyncio.gather(*(load_existing(page_number) for page_number in missing))
+        to_render = []
+        for page_number, image in zip(missing, existing):
+            if image is None:
+                to_render.append(page_number)
+            else:
+                self._remember(keys[page_number], image)
+
+        if to_render:
+            start_time = monotonic()
+            loop = asyncio.get_running_loop()
+
+            use_pool = len(to_render) > RENDER_POOL_MIN_PAGES
+            batch_size = RENDER_BATCH_PAGES if use_pool else len(to_render)
+            batches = [to_render[start:start + batch_size] for start in range(0, len(to_render), batch_size)]
+
+            async def render_and_upload(batch: List[int]) -> None:
+                if use_pool:
+                    images = await loop.run_in_executor(self._get_pool(), render_pages, pdf_content, batch, dpi, image_format)
+                else:
+                    images = await asyncio.to_thread(render_pages, pdf_content, batch, dpi, image_format)
+                await asyncio.gather(*(upload(page_number, image) for page_number, image in zip(batch, images)))
+
+            await asyncio.gather(*(render_and_upload(batch) for batch in batches))
+            self.render_seconds += monotonic() - start_time
+            self.prewarmed += len(to_render)
+            log(f"Pre-rendered {len(to_render)} pages at {dpi} DPI as {image_format} in {len(batches)} batches")
+
+        return [keys[page_number] for page_number in page_numbers]
+
+    async def warm(self, pdf_content: bytes, document_hash: str, page_number: int, dpi: int, image_format: str = "png") -> str:
+        """Render one page ahead of its first request; see warm_many."""
+        return (await self.warm_many(pdf_content, document_hash, [page_number], dpi, image_format))[0]
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def invalidate(self, document_id: str) -> None:
+        self._pdfs.pop(document_id, None)
+        self._document_hashes.pop(document_id, None)
+
+    def stats(self) -> Dict:
+        lookups = self.memory_hits + self.s3_hits + self.renders
+        return {
+            "renders_cached": len(self._images),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "memory_hits": self.memory_hits,
+            "s3_hits": self.s3_hits,
+            "renders": self.renders,
+            "prewarmed": self.prewarmed,
+            "hit_rate": (self.memory_hits + self.s3_hits) / lookups if lookups else None,
+            "evictions": self.evictions,
+            "render_seconds": round(self.render_seconds, 3),
+        }
+
+
+page_render_cache = PageRenderCache(current_s3_client)
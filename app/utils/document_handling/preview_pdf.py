@@ -1,71 +1,107 @@
+import asyncio
 import fitz  # PyMuPDF
-import io
-from PIL import Image
-from services.s3host import current_s3_client
+from services.document_encoder import DocumentEncoder
 from utils.document_handling.logger import log
-from models.preview import PreviewModel, preview_repo
+from utils.document_handling.page_rasterizer import get_render_size, get_tile_grid
+from utils.document_handling.page_renderer import (
+    DEFAULT_PREVIEW_RENDITION, PREVIEW_RENDITIONS, PREVIEW_TILE_FORMAT, PREVIEW_TILE_LEVEL_DPIS,
+    PREVIEW_TILE_SIZE, PREVIEW_TILES_ENABLED, get_document_hash, page_render_cache
+)
+from models.preview import PreviewModel, PreviewRendition, PreviewTileLevel, PreviewTiles, preview_repo
+
+# Leading pages whose preview is rendered at ingest, the ones opened first
+PREVIEW_PRERENDER_PAGES = 3
 
 async def save_document_preview_images(
     pdf_content: bytes,
     document_name: str,
     document_id: str,
     userId: str,
-    dpi: int = 150,
-    image_format: str = 'PNG'
+    renditions: dict = None,
+    tiles_enabled: bool = None
 ):
     """
-    Convert each page of a PDF to an image and save to S3 in PNG format.
+    Register the page previews of a PDF and pre-render the ones opened first.
+
+    Pages are rendered on their first request through the page render cache, so
+    ingest only records, per page, its renditions and tile pyramid, addressed by
+    the content hash of the PDF. It warms the first-page thumbnail shown in
+    document lists and the default rendition of the first PREVIEW_PRERENDER_PAGES pages.
 
     Args:
         pdf_content (bytes): The PDF file content as bytes
         document_name (str): Name of the PDF file
         document_id (str): Unique identifier for the document
         userId (str): User identifier
-        dpi (int): Resolution for the output images (default: 150)
-        image_format (str): Image format ('PNG' by default)
+        renditions (dict, optional): Renditions by name, PREVIEW_RENDITIONS by default
+        tiles_enabled (bool, optional): Record a tile pyramid, PREVIEW_TILES_ENABLED by default
 
     Returns:
-        list: List of S3 keys for saved images
+        list: Content-addressed S3 keys of the default rendition of each page
     """
+    renditions = renditions or PREVIEW_RENDITIONS
+    tiles_enabled = PREVIEW_TILES_ENABLED if tiles_enabled is None else tiles_enabled
+    default_rendition = DEFAULT_PREVIEW_RENDITION if DEFAULT_PREVIEW_RENDITION in renditions else next(iter(renditions))
+
     try:
         pdf_document = fitz.open(stream=pdf_content, filetype="pdf")
-        saved_previews = []
+        page_rects = [pdf_document.load_page(page_num).rect for page_num in range(len(pdf_document))]
+        pdf_document.close()
 
-        for page_num in range(len(pdf_document)):
-            page = pdf_document.load_page(page_num)
-            mat = fitz.Matrix(dpi / 72, dpi / 72)
-            pix = page.get_pixmap(matrix=mat)
-            img = Image.open(io.BytesIO(pix.tobytes("png")))
+        document_hash = get_document_hash(pdf_content)
+        previews = []
+        for page_number, page_rect in enumerate(page_rects, start=1):
+            page_renditions = {}
+            for name, rendition in renditions.items():
+                width, height = get_render_size(page_rect, rendition["dpi"])
+                page_renditions[name] = PreviewRendition(
+                    id=DocumentEncoder.get_page_render_file_key(document_hash, page_number, rendition["dpi"], rendition["format"]),
+                    dpi=rendition["dpi"],
+                    format=rendition["format"],
+                    width=width,
+                    height=height
+                )
 
-            # Convert image to bytes
-            img_byte_arr = io.BytesIO()
-            img.save(img_byte_arr, format=image_format)
-            img_bytes = img_byte_arr.getvalue()
+            tiles = None
+            if tiles_enabled:
+                tiles = PreviewTiles(
+                    tile_size=PREVIEW_TILE_SIZE,
+                    format=PREVIEW_TILE_FORMAT,
+                    levels=[
+                        PreviewTileLevel(dpi=dpi, columns=columns, rows=rows)
+                        for dpi in PREVIEW_TILE_LEVEL_DPIS
+                        for columns, rows in [get_tile_grid(page_rect, dpi, PREVIEW_TILE_SIZE)]
+                    ]
+                )
 
-            # S3 key
-            s3_key = f'DB/USERS/{userId}/document_previews/{document_name}/page_{page_num+1}.{image_format.lower()}'
-            await current_s3_client.save_to_s3(img_bytes, s3_key)
-
-            # Save preview metadata
-            preview_model = PreviewModel(
-                id=s3_key,
+            previews.append(PreviewModel(
+                id=page_renditions[default_rendition].id,
                 document_id=document_id,
-                page_number=page_num + 1
-            )
-            await preview_repo.add_new_preview(preview_model)
+                page_number=page_number,
+                document_hash=document_hash,
+                renditions=page_renditions,
+                tiles=tiles
+            ))
 
-            saved_previews.append(s3_key)
-            log(f"Saved preview image: {s3_key}")
+        if previews:
+            warm_tasks = [
+                page_render_cache.warm_many(
+                    pdf_content, document_hash, list(range(1, min(len(previews), PREVIEW_PRERENDER_PAGES) + 1)),
+                    renditions[default_rendition]["dpi"], renditions[default_rendition]["format"]
+                )
+            ]
+            if "thumbnail" in renditions and default_rendition != "thumbnail":
+                warm_tasks.append(page_render_cache.warm(
+                    pdf_content, document_hash, 1, renditions["thumbnail"]["dpi"], renditions["thumbnail"]["format"]
+                ))
+            await asyncio.gather(*warm_tasks)
 
-            img.close()
-            pix = None
+        await preview_repo.add_new_previews(previews)
+        saved_previews = [preview.id for preview in previews]
 
+        log(f"Registered {len(previews)} page previews of {document_name} in {len(renditions)} renditions, thumbnail and first pages pre-rendered")
         return saved_previews
 
     except Exception as e:
         log(f"Error generating PDF previews for {document_name}: {str(e)}")
         raise
-
-    finally:
-        if 'pdf_document' in locals():
-            pdf_document.close()
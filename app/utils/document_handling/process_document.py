@@ -7,6 +7,7 @@ import multiprocessing
 import uuid
 from time import time
 from io import BytesIO
+from typing import Optional
 from numpy import array
 from pathlib import Path
 import fitz
@@ -19,6 +20,10 @@ from services.document_encoder import DocumentEncoder
 from services.qdrant_host import current_qdrant_client
 from services.ollama_host import current_ollama_client
 from utils.document_handling.chunker import create_optimized_marked_chunks
+from utils.document_handling.document_retrieval import DOCUMENT_TEXT_COLLECTION_NAME
+from utils.document_handling.document_extraction import ExtractedDocument, extract_document
+from models.extracted_text import extracted_text_repo
+from utils.document_handling.document_index import document_index_cache
 from utils.document_handling.extraction_engine import extract_and_save_images_from_pdf
 from utils.document_handling.generate_save_document_ouline import generate_and_save_document_outline
 from utils.document_handling.extraction_engine import extract_and_save_tables_from_pdf
@@ -32,9 +37,6 @@ from utils.document_handling.save_document_data_to_DB import (
                                             )
 
 
-DOCUMENT_TEXT_COLLECTION_NAME = 'creator'
-
-
 def initialize_collection(collection_name: str) -> bool:
     """
     Initialize a collection if it doesn't exist.
@@ -97,7 +99,7 @@ def add_document_to_collection(document_extracted_text: str, document_id: str) -
     log(f"The Function add_document_to_collection was started at {start_time} and completed in {processing_time_taken} seconds")
     return document_id
 
-async def vectorise_document(document_content, document_id, document_name, userId):
+async def vectorise_document(document_content, document_id, document_name, userId, extracted_document: Optional[ExtractedDocument] = None):
     start_time = time()
     # handle the collection's existence state
     initialize_collection(collection_name=DOCUMENT_TEXT_COLLECTION_NAME)
@@ -106,7 +108,8 @@ async def vectorise_document(document_content, document_id, document_name, userI
     document_extracted_text = await extract_text_from_pdf_data_for_vectorisation(
         pdf_content=document_content,
         pdf_name=document_name,
-        userId=userId
+        userId=userId,
+        extracted_document=extracted_document
     )
 
     add_document_to_collection(document_extracted_text, document_id)
@@ -116,6 +119,36 @@ async def vectorise_document(document_content, document_id, document_name, userI
     log(f"The Function vectorise_document was started at {start_time} and completed in {processing_time_taken} seconds")
     return True
 
+async def load_or_extract_document(document_content: bytes, document_name: str, document_id: str) -> Optional[ExtractedDocument]:
+    """
+    Return the stored extraction of a document, or extract the PDF and store the result.
+
+    Returns:
+        Optional[ExtractedDocument]: None if extraction failed, the tasks then extract on their own
+    """
+    try:
+        extracted_document = await extracted_text_repo.get_extracted_document(document_id)
+        if extracted_document:
+            log(f"Reusing stored extracted text of {extracted_document.page_count} pages for {document_id}")
+            return extracted_document
+    except Exception as e:
+        log(f"Could not read stored extracted text of {document_id}: {str(e)}")
+
+    try:
+        extracted_document = await anyio.to_thread.run_sync(extract_document, document_content, document_name)
+    except Exception as e:
+        log(f"Text extraction failed, tasks will extract on their own: {str(e)}")
+        return None
+
+    try:
+        stored_pages = await extracted_text_repo.save_extracted_document(document_id, extracted_document)
+        log(f"Stored extracted text of {stored_pages} pages for {document_id}")
+        document_index_cache.invalidate(document_id)
+    except Exception as e:
+        log(f"Could not store extracted text of {document_id}: {str(e)}")
+
+    return extracted_document
+
 async def process_document(document_content: bytes, fileName: str, userId: str, document_id: str):
     """
     Process document by running all tasks in parallel, handling both async and sync functions
@@ -126,12 +159,16 @@ async def process_document(document_content: bytes, fileName: str, userId: str,
 
     status = 'done'
 
+    # Extract the text once; vectorisation, the helper table and the outline all read it.
+    # A reprocessed document reuses the extraction stored on its first ingest.
+    extracted_document = await load_or_extract_document(document_content, document_name, document_id)
+
     # Create tasks list with appropriate handling for sync vs async functions
     tasks = [
         # extract_text_from_pdf_data_for_frontend(pdf_content=document_content, pdf_name=document_name),
-        vectorise_document(document_content, document_id, document_name, userId),
+        vectorise_document(document_content, document_id, document_name, userId, extracted_document),
         save_document_preview_images(document_content, document_name,document_id, userId),
-        generate_and_save_document_outline(document_content, document_name, userId, document_id),
+        generate_and_save_document_outline(document_content, document_name, userId, document_id, extracted_document=extracted_document),
         extract_and_save_tables_from_pdf(document_content, document_name, document_id, userId),
         extract_and_save_images_from_pdf(document_content, document_name, document_id, userId)
     ]
@@ -3,6 +3,7 @@ from fastapi import HTTPException
 from pydantic import BaseModel
 from utils.document_handling.content_type import CONTENT_HIERARCHY
 from services.s3host import current_s3_client
+from services.document_encoder import DocumentEncoder
 from models.images import image_repo
 
 class ContentFlowQuestion(BaseModel):
@@ -68,11 +69,8 @@ class ContentFlowManager:
             document_id = current_state.get("document_id")
             if document_id:
                 image_ids = await image_repo.get_image_by_document_id(document_id)
-                images = []
-                for image_id in image_ids:
-                    url = await current_s3_client.get_presigned_view_url(f"images/{image_id}")
-                    images.append(url)
-                response.images = images
+                image_keys = [DocumentEncoder.get_document_image_file_key(document_id, image_id) for image_id in image_ids]
+                response.images = await current_s3_client.get_presigned_view_urls(image_keys)
 
         if "options" in question:
             response.options = question["options"]
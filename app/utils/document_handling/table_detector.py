@@ -0,0 +1,166 @@
+"""
+Table Detection Service
+
+Holds the YOLOv8 table detection model, loaded once per worker process at
+startup, and runs detection for every document being processed. Requests are
+queued and served one batch at a time by a single inference task, so concurrent
+documents share the model without running it from several threads at once.
+"""
+
+import asyncio
+import os
+from contextlib import contextmanager
+from time import monotonic
+from typing import List, Optional
+
+import numpy as np
+import torch
+from ultralyticsplus import YOLO
+
+from utils.document_handling.logger import log
+
+TABLE_DETECTION_MODEL = 'keremberke/yolov8m-table-extraction'
+TABLE_DETECTION_CONFIDENCE = 0.25
+TABLE_DETECTION_IOU = 0.45
+TABLE_DETECTION_MAX_DETECTIONS = 1000
+# Pages are detected on at about the model's 640 px input size and only the tables re-rendered sharp
+TABLE_DETECTION_DPI = 96
+TABLE_DETECTION_BATCH_PAGES = 8
+TABLE_CROP_DPI = 300
+# Points added around a detected table before it is cropped, as detection boxes are approximate
+TABLE_CROP_MARGIN = 4
+# Intra-op threads of the detector; leave cores for the event loop and the render workers
+TABLE_DETECTOR_TORCH_THREADS = max(1, (os.cpu_count() or 2) // 2)
+# Detection requests waiting for the model before producers are held back
+TABLE_DETECTOR_QUEUE_SIZE = 32
+
+
+@contextmanager
+def full_checkpoint_loading():
+    """
+    Let torch.load unpickle full checkpoints while the detector weights load.
+
+    The published weights are a pickled model, which torch>=2.6 refuses with
+    its weights_only default; torch.load is restored as soon as they are loaded.
+    """
+    original_load = torch.load
+
+    def load_full_checkpoint(*args, **kwargs):
+        kwargs["weights_only"] = False
+        return original_load(*args, **kwargs)
+
+    torch.load = load_full_checkpoint
+    try:
+        yield
+    finally:
+        torch.load = original_load
+
+
+class TableDetector:
+    """
+    Shared table detector of a worker process.
+
+    Attributes:
+        model: The loaded YOLO model, None until started
+        pages: Page images run through the model
+        batches: Detection requests served
+        inference_seconds: Total time spent in the model
+    """
+
+    def __init__(self, queue_size: int = TABLE_DETECTOR_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.model = None
+        self.pages = 0
+        self.batches = 0
+        self.inference_seconds = 0.0
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._starting: Optional[asyncio.Future] = None
+
+    def _load_model(self):
+        torch.set_num_threads(TABLE_DETECTOR_TORCH_THREADS)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            # Only settable before the first parallel operation of the process
+            pass
+
+        start_time = monotonic()
+        with full_checkpoint_loading():
+            model = YOLO(TABLE_DETECTION_MODEL)
+        model.overrides['conf'] = TABLE_DETECTION_CONFIDENCE
+        model.overrides['iou'] = TABLE_DETECTION_IOU
+        model.overrides['agnostic_nms'] = False
+        model.overrides['max_det'] = TABLE_DETECTION_MAX_DETECTIONS
+        log(f"Loaded table detection model in {monotonic() - start_time:.1f}s with {TABLE_DETECTOR_TORCH_THREADS} torch threads")
+        return model
+
+    async def start(self) -> None:
+        """Load the model and start serving detection requests; later calls return at once."""
+        if self._worker is not None:
+            return
+        if self._starting is None:
+            self._starting = asyncio.ensure_future(self._start())
+        await asyncio.shield(self._starting)
+
+    async def _start(self) -> None:
+        try:
+            self.model = await asyncio.to_thread(self._load_model)
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+            self._worker = asyncio.create_task(self._serve())
+        finally:
+            self._starting = None
+
+    async def _serve(self) -> None:
+        while True:
+            images, future = await self._queue.get()
+            try:
+                if future.cancelled():
+                    continue
+                start_time = monotonic()
+                results = await asyncio.to_thread(self.model.predict, images, verbose=False)
+                self.inference_seconds += monotonic() - start_time
+                self.pages += len(images)
+                self.batches += 1
+                boxes = [result.boxes.xyxy.cpu().numpy() for result in results]
+                if not future.cancelled():
+                    future.set_result(boxes)
+            except Exception as e:
+                if not future.cancelled():
+                    future.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+    async def detect(self, images: List) -> List[np.ndarray]:
+        """
+        Detect tables on page images.
+
+        Args:
+            images (List): Page images (PIL images or numpy arrays)
+
+        Returns:
+            List[np.ndarray]: Per image the (n x 4) x1, y1, x2, y2 boxes of its tables, in image pixels
+        """
+        if not images:
+            return []
+        await self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((images, future))
+        return await future
+
+    async def close(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+
+    def stats(self):
+        return {
+            "loaded": self.model is not None,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "pages": self.pages,
+            "batches": self.batches,
+            "inference_seconds": round(self.inference_seconds, 3),
+        }
+
+
+table_detector = TableDetector()
@@ -0,0 +1,270 @@
+"""
+Local Text Alignment
+
+Aligns sentences of a generated text (such as the document outline) to the lines
+of the source pages they were written from, using TF-IDF weighted word n-gram
+similarity. The matched lines carry their coordinates, so highlight rectangles
+can be produced without asking a vision model where the source text is.
+"""
+
+import math
+import re
+import unicodedata
+from collections import Counter
+from difflib import SequenceMatcher, get_close_matches
+from typing import Dict, List, Optional, Tuple
+
+# Minimum cosine similarity for a line window to count as the source of a sentence
+ALIGNMENT_MIN_SCORE = 0.35
+# Longest run of consecutive lines considered as the source of one sentence
+ALIGNMENT_MAX_WINDOW_LINES = 4
+# Highlighted passages kept per page
+ALIGNMENT_MAX_MATCHES_PER_PAGE = 3
+# Sentences with fewer words than this are too generic to align
+ALIGNMENT_MIN_SENTENCE_WORDS = 4
+# Similarity above which a page word is taken as a spelling variant of a looked-up word
+WORD_MATCH_MIN_RATIO = 0.8
+# Similarity the page text must reach for a phrase to be found
+PHRASE_MATCH_MIN_RATIO = 0.8
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+WORD_STRIP_PATTERN = re.compile(r"[^\w]+")
+SENTENCE_SPLIT_PATTERN = re.compile(r"(?<=[.!?])\s+|\n+")
+MARKDOWN_PATTERN = re.compile(r"^[\s#>*\-\d.)]+|[*_`]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens, ignoring punctuation."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def ngram_features(tokens: List[str]) -> Counter:
+    """Word unigrams and bigrams of a token list."""
+    features = Counter(tokens)
+    features.update(f"{first} {second}" for first, second in zip(tokens, tokens[1:]))
+    return features
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split generated text into sentences, dropping markdown decoration and short fragments."""
+    sentences = []
+    for sentence in SENTENCE_SPLIT_PATTERN.split(text):
+        sentence = MARKDOWN_PATTERN.sub(" ", sentence).strip()
+        if len(tokenize(sentence)) >= ALIGNMENT_MIN_SENTENCE_WORDS:
+            sentences.append(sentence)
+    return sentences
+
+
+class TfidfSpace:
+    """
+    TF-IDF weighting fitted on the lines of the pages being aligned.
+
+    Attributes:
+        idf: Inverse document frequency of each feature
+    """
+
+    def __init__(self, documents: List[Counter]):
+        document_frequency = Counter()
+        for features in documents:
+            document_frequency.update(features.keys())
+        total = len(documents) or 1
+        self.idf = {
+            feature: math.log((1 + total) / (1 + frequency)) + 1
+            for feature, frequency in document_frequency.items()
+        }
+        self.default_idf = math.log(1 + total) + 1
+
+    def vector(self, features: Counter) -> Tuple[Dict[str, float], float]:
+        """Weighted vector of a feature counter and its norm."""
+        weighted = {
+            feature: count * self.idf.get(feature, self.default_idf)
+            for feature, count in features.items()
+        }
+        norm = math.sqrt(sum(weight * weight for weight in weighted.values()))
+        return weighted, norm
+
+
+def cosine(first: Tuple[Dict[str, float], float], second: Tuple[Dict[str, float], float]) -> float:
+    first_vector, first_norm = first
+    second_vector, second_norm = second
+    if not first_norm or not second_norm:
+        return 0.0
+    if len(first_vector) > len(second_vector):
+        first_vector, second_vector = second_vector, first_vector
+    dot = sum(weight * second_vector.get(feature, 0.0) for feature, weight in first_vector.items())
+    return dot / (first_norm * second_norm)
+
+
+def align_text_to_pages(text: str, helper_rows: List[Dict], page_numbers: List[int]) -> List[Dict]:
+    """
+    Find the passages of the given pages that a generated text was written from.
+
+    Every sentence of the text is compared with every run of up to
+    ALIGNMENT_MAX_WINDOW_LINES consecutive lines of each page. Per page, the
+    best-scoring non-overlapping runs above ALIGNMENT_MIN_SCORE are kept.
+
+    Args:
+        text (str): The generated text, e.g. the document outline
+        helper_rows (List[Dict]): Line rows as produced by ExtractedDocument.helper_rows
+        page_numbers (List[int]): The pages to align against
+
+    Returns:
+        List[Dict]: Per page with a match: "page_number", "score" of its best
+            passage and the line "rects" to highlight
+    """
+    sentences = split_sentences(text)
+    if not sentences:
+        return []
+
+    wanted_pages = set(page_numbers)
+    page_lines: Dict[int, List[Dict]] = {}
+    for row in helper_rows:
+        if row["Page Number"] in wanted_pages:
+            page_lines.setdefault(row["Page Number"], []).append(row)
+
+    line_features = {
+        page_number: [ngram_features(tokenize(row["Content"])) for row in rows]
+        for page_number, rows in page_lines.items()
+    }
+    space = TfidfSpace([features for page in line_features.values() for features in page])
+    sentence_vectors = [space.vector(ngram_features(tokenize(sentence))) for sentence in sentences]
+
+    aligned = []
+    for page_number in page_numbers:
+        rows = page_lines.get(page_number)
+        if not rows:
+            continue
+        features = line_features[page_number]
+
+        # Score every window of consecutive lines against its best-matching sentence
+        candidates = []
+        for start in range(len(rows)):
+            window_features = Counter()
+            for end in range(start, min(start + ALIGNMENT_MAX_WINDOW_LINES, len(rows))):
+                window_features.update(features[end])
+                window_vector = space.vector(window_features)
+                score = max(cosine(window_vector, sentence_vector) for sentence_vector in sentence_vectors)
+                if score >= ALIGNMENT_MIN_SCORE:
+                    candidates.append((score, start, end))
+
+        # Keep the best non-overlapping windows
+        used_lines = set()
+        matches = []
+        for score, start, end in sorted(candidates, reverse=True):
+            window = range(start, end + 1)
+            if any(line in used_lines for line in window):
+                continue
+            used_lines.update(window)
+            matches.append((score, start, end))
+            if len(matches) >= ALIGNMENT_MAX_MATCHES_PER_PAGE:
+                break
+
+        if matches:
+            aligned.append({
+                "page_number": page_number,
+                "score": matches[0][0],
+                "rects": [
+                    tuple(rows[line]["Coordinates"])
+                    for _, start, end in sorted(matches, key=lambda match: match[1])
+                    for line in range(start, end + 1)
+                ]
+            })
+
+    return aligned
+
+
+def normalize_word(word: str) -> str:
+    """
+    Normalize a word for matching: ligatures and full-width forms are unfolded,
+    case, punctuation, hyphens and soft hyphens are dropped.
+    """
+    word = unicodedata.normalize("NFKC", word).replace("\u00ad", "")
+    return WORD_STRIP_PATTERN.sub("", word.lower()).replace("_", "")
+
+
+class PageWordIndex:
+    """
+    Normalized word index of one page for locating phrases.
+
+    Maps every normalized word to its positions on the page, so a phrase is
+    located from the positions of one of its words instead of by comparing it
+    at every word position. Lookups tolerate punctuation, hyphenation, ligature
+    and small OCR differences.
+
+    Attributes:
+        words: The page words as returned by page.get_text("words")
+        tokens: The normalized word at each position
+        positions: Positions of each normalized word
+    """
+
+    def __init__(self, words: List[tuple]):
+        self.words = words
+        self.tokens = [normalize_word(word[4]) for word in words]
+        self.positions: Dict[str, List[int]] = {}
+        for position, token in enumerate(self.tokens):
+            if token:
+                self.positions.setdefault(token, []).append(position)
+
+    def lookup(self, token: str) -> List[int]:
+        """Positions of a normalized word, falling back to its closest spellings on the page."""
+        if token in self.positions:
+            return self.positions[token]
+        close_tokens = get_close_matches(token, self.positions.keys(), n=3, cutoff=WORD_MATCH_MIN_RATIO)
+        return sorted(position for close_token in close_tokens for position in self.positions[close_token])
+
+    def phrase_score(self, phrase_tokens: List[str], start: int) -> float:
+        """
+        Similarity of the phrase to the page text from `start` on.
+
+        Words are compared as one joined string, so a word hyphenated across a
+        line break on the page still matches the whole word in the phrase.
+        """
+        if start < 0 or start >= len(self.tokens):
+            return 0.0
+        phrase_text = "".join(phrase_tokens)
+        page_text = ""
+        position = start
+        while position < len(self.tokens) and len(page_text) < len(phrase_text):
+            page_text += self.tokens[position]
+            position += 1
+        return SequenceMatcher(None, phrase_text, page_text[:len(phrase_text)], autojunk=False).ratio()
+
+    def find_phrase(self, phrase: str) -> Optional[int]:
+        """
+        Locate a phrase on the page.
+
+        The phrase is anchored on its least frequent word found on the page; only
+        the positions of that word are verified against the whole phrase.
+
+        Args:
+            phrase (str): The text to locate
+
+        Returns:
+            Optional[int]: Position of the phrase's first word, or None if not found
+        """
+        phrase_tokens = [token for token in (normalize_word(word) for word in phrase.split()) if token]
+        if not phrase_tokens:
+            return None
+
+        anchors = []
+        for offset, token in enumerate(phrase_tokens):
+            positions = self.lookup(token)
+            if positions:
+                anchors.append((len(positions), offset, positions))
+        if not anchors:
+            return None
+
+        best_start, best_score = None, 0.0
+        for _, offset, positions in sorted(anchors)[:2]:
+            for position in positions:
+                # Hyphenation can shift the page position by a word either way
+                for start in (position - offset, position - offset - 1, position - offset + 1):
+                    score = self.phrase_score(phrase_tokens, start)
+                    if score > best_score:
+                        best_start, best_score = start, score
+            if best_score == 1.0:
+                break
+
+        if best_score < PHRASE_MATCH_MIN_RATIO:
+            return None
+        return best_start